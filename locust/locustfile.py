@@ -1,24 +1,60 @@
+import logging
 import os
-from locust import HttpUser, task, between
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from locust import HttpUser, task, between, events
+from locust.runners import WorkerRunner
 import uuid
 import random
-import sqlite3
-from datetime import datetime
 
-def init_db():
-    conn = sqlite3.connect('requests.db')
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS requests_send (
-            request_id TEXT PRIMARY KEY,
-            test_id TEXT,
-            status_code INTEGER,
-            response_time REAL,
-            timestamp DATETIME
-        )
-    ''')
-    conn.close()
+BASE_DIR = Path(__file__).resolve().parent.parent
+if str(BASE_DIR) not in sys.path:
+    sys.path.append(str(BASE_DIR))
+from storage import metrics_row, open_storage, postback_row  # noqa: E402
 
-init_db()
+logger = logging.getLogger(__name__)
+
+# Sent postbacks land next to what the receiver got, so stat.py can verify a locust run
+storage = open_storage(os.getenv("STORAGE", "sqlite"), path=BASE_DIR / "requests.db")
+SAVE_BATCH = int(os.getenv("SAVE_BATCH", "500"))
+# One test_id for every user of the run; distributed runs need TEST_ID set,
+# otherwise each worker process picks its own
+TEST_ID = os.getenv("TEST_ID", str(uuid.uuid4()))
+
+
+@events.test_stop.add_listener
+def save_run(environment, **kwargs):
+    """Stores the run in the metrics history, stat.py checks the latest one
+    when no --test_id is given"""
+    if isinstance(environment.runner, WorkerRunner):
+        # The master stores the run with the stats of every worker
+        return
+    total = environment.stats.total
+    if not total.num_requests:
+        return
+    duration = max(total.last_request_timestamp - total.start_time, 0)
+    storage.save_metrics(
+        metrics_row(
+            {
+                "test_id": TEST_ID,
+                "duration": duration,
+                "sending_count": total.num_requests,
+                "failed": total.num_failures,
+                "avg_latency": total.avg_response_time / 1000,
+                "min_latency": (total.min_response_time or 0) / 1000,
+                "max_latency": total.max_response_time / 1000,
+                "p50": total.get_response_time_percentile(0.5) / 1000,
+                "p90": total.get_response_time_percentile(0.9) / 1000,
+                "p95": total.get_response_time_percentile(0.95) / 1000,
+                "p99": total.get_response_time_percentile(0.99) / 1000,
+                "p999": total.get_response_time_percentile(0.999) / 1000,
+                "rps": total.num_requests / duration if duration > 0 else 0,
+                "params": {"tool": "locust", "users": environment.runner.user_count},
+            }
+        )
+    )
 
 
 class PostbackUser(HttpUser):
@@ -28,11 +64,12 @@ class PostbackUser(HttpUser):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.test_id = os.getenv("TEST_ID", str(uuid.uuid4()))
+        self.test_id = TEST_ID
         self.postback_types = os.getenv("POSTBACK_TYPES", "install,event").split(",")
         self.event_names = os.getenv("EVENT_NAMES", "registration,level,purchase").split(",")
         self.source_ids = os.getenv("SOURCE_IDS", "100").split(",")
         self.mmp = os.getenv("MMP", "appmetrica,appsflyer").split(",")
+        self.pending: list[tuple] = []
 
     @task
     def send_postback(self):
@@ -52,27 +89,30 @@ class PostbackUser(HttpUser):
             "mmp": random.choice(self.mmp),
         }
 
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         with self.client.get("/verify", params=params, catch_response=True) as response:
-            response_time = (datetime.now() - start_time).total_seconds()
-            self.save_to_db(params, response.status_code, response_time)
+            response_time = time.perf_counter() - start_time
+            logger.info({
+                "event_log": "postback_sent",
+                "request_id": params["request_id"],
+                "test_id": self.test_id,
+                "status_code": response.status_code,
+                "response_time": response_time,
+                "timestamp": datetime.now().isoformat(),
+            })
+            self.save_to_db(params)
 
-    def save_to_db(self, params, status_code, response_time):
-        conn = sqlite3.connect('requests.db')
+    def save_to_db(self, params):
+        self.pending.append(postback_row(params))
+        if len(self.pending) >= SAVE_BATCH:
+            self.flush()
+
+    def flush(self):
         try:
-            conn.execute('''
-                INSERT INTO requests_send
-                (request_id, test_id, status_code, response_time, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                params['request_id'],
-                params['test_id'],
-                status_code,
-                response_time,
-                datetime.now().isoformat()
-            ))
-            conn.commit()
+            storage.insert_sent(self.pending)
         except Exception as e:
             print(f"Error saving to DB: {e}")
-        finally:
-            conn.close()
+        self.pending = []
+
+    def on_stop(self):
+        self.flush()
@@ -1,8 +1,14 @@
+import argparse
 import asyncio
-from collections import defaultdict
+import os
+import re
+import sqlite3
+import sys
+import zlib
+from collections import Counter, defaultdict
 from pathlib import Path
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import logging
 import uvicorn
 import aiosqlite
@@ -11,6 +17,27 @@ from typing import Optional
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 DB_PATH = BASE_DIR / "requests.db"
+# With several workers every process writes its own shard, the sender merges
+# shards of a test into DB_PATH before verification
+SHARDS_DIR = BASE_DIR / "shards"
+# Postbacks carrying a seq param (their number in the run) are also marked in
+# a per-worker bitmap, shards/{test_id}.{pid}.bitmap
+_TEST_ID_RE = re.compile(r"^[\w-]+$")
+WORKERS = int(os.environ.get("RECEIVER_WORKERS", "1"))
+# Backend for received rows (see storage.BACKENDS), counters always stay in SQLite
+STORAGE = os.environ.get("RECEIVER_STORAGE", "sqlite")
+if str(BASE_DIR) not in sys.path:
+    sys.path.append(str(BASE_DIR))
+
+from storage import (  # noqa: E402
+    BACKENDS,
+    BitmapFile,
+    DeliveryBitmap,
+    Storage,
+    open_storage,
+    postback_row,
+)
+from storage.sqlite import SQLiteStorage  # noqa: E402
 
 logger = logging.getLogger("receiver")
 logging.basicConfig(
@@ -21,11 +48,23 @@ logging.basicConfig(
 class Database:
     _instance: Optional['Database'] = None
 
-    def __init__(self):
+    def __init__(self, flush_rows: int = 2000, flush_interval: float = 0.05,
+                 queue_size: int = 100_000):
         self._pool = None
-        self._batch = []
-        self._batch_size = 500
-        self._lock = asyncio.Lock()
+        self.storage: Optional[Storage] = None
+        # Request handlers only enqueue rows, a single writer task group-commits
+        # them every flush_interval seconds or as soon as flush_rows are waiting
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._flush_rows = flush_rows
+        self._flush_interval = flush_interval
+        self._batch_ready = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        self.written_count = 0
+        # Per test_id: rows accepted by /verify and rows committed to disk
+        self.received_counts: Counter = Counter()
+        self.persisted_counts: Counter = Counter()
+        self._committed = asyncio.Event()
+        self.bitmaps: dict[str, BitmapFile] = {}
 
     @classmethod
     async def get_instance(cls):
@@ -34,70 +73,154 @@ class Database:
             await cls._instance._initialize()
         return cls._instance
 
+    @property
+    def path(self) -> Path:
+        if WORKERS > 1:
+            return SHARDS_DIR / f"received_{os.getpid()}.db"
+        return DB_PATH
+
     async def _initialize(self):
-        self._pool = await aiosqlite.connect(DB_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._pool = await aiosqlite.connect(self.path)
         await self._pool.execute("PRAGMA journal_mode=WAL")
         await self._pool.execute("PRAGMA synchronous=NORMAL")
-        await self._pool.execute("PRAGMA cache_size=-10000")
-        await self._pool.execute("PRAGMA temp_store=MEMORY")
-        await self._pool.execute("PRAGMA mmap_size=268435456")
-        await self._pool.execute("""CREATE TABLE IF NOT EXISTS received_requests (
-                    request_id TEXT PRIMARY KEY,
+        await self._pool.execute("""CREATE TABLE IF NOT EXISTS receiver_stats (
+                    pid INTEGER PRIMARY KEY,
+                    all_count INTEGER,
+                    success_count INTEGER,
+                    error_count INTEGER,
+                    written_count INTEGER
+                );""")
+        await self._pool.execute("""CREATE TABLE IF NOT EXISTS receiver_progress (
                     test_id TEXT,
-                    postback_type TEXT,
-                    event_name TEXT,
-                    source_id TEXT,
-                    campaign_id TEXT,
-                    placement_id TEXT,
-                    adset_id TEXT,
-                    ad_id TEXT,
-                    advertising_id TEXT,
-                    country TEXT,
-                    click_id TEXT,
-                    mmp TEXT,
-                    gaid TEXT,
-                    idfa TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    pid INTEGER,
+                    persisted INTEGER,
+                    PRIMARY KEY (test_id, pid)
                 );""")
         await self._pool.commit()
+        self.storage = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: open_storage(STORAGE, path=self.path)
+        )
+        self._writer_task = asyncio.create_task(self._writer())
 
-    async def save_request(self, data: dict):
-        async with self._lock:
-            self._batch.append(data)
-            if len(self._batch) >= self._batch_size:
-                await self._flush_batch()
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
 
-    async def _flush_batch(self):
-        if not self._batch:
+    def mark_delivered(self, test_id: str, seq: str):
+        """Sets the postback's bit, visible to /bitmap in every worker at once"""
+        if not seq.isdigit() or not _TEST_ID_RE.match(test_id):
             return
+        bitmap = self.bitmaps.get(test_id)
+        if bitmap is None:
+            bitmap = self.bitmaps[test_id] = BitmapFile(
+                SHARDS_DIR / f"{test_id}.{os.getpid()}.bitmap"
+            )
+        bitmap.add(int(seq))
+
+    async def save_request(self, data: dict):
+        row = postback_row(data)
+        self.received_counts[row[1]] += 1
+        if "seq" in data and row[1]:
+            self.mark_delivered(row[1], data["seq"])
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            # Waits for queue space, never for the disk write itself
+            await self._queue.put(row)
+        if self._queue.qsize() >= self._flush_rows:
+            self._batch_ready.set()
+
+    async def _writer(self):
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            while len(batch) < self._flush_rows:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
 
+    async def _write_batch(self, batch: list[tuple]):
         try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.storage.insert_received, batch
+            )
             async with self._pool.cursor() as cursor:
+                persisted = self.persisted_counts.copy()
+                persisted.update(row[1] for row in batch)
+                # Per-process counters live next to the rows so /stats can sum shards
+                await cursor.execute(
+                    """INSERT OR REPLACE INTO receiver_stats
+                    (pid, all_count, success_count, error_count, written_count)
+                    VALUES (?, ?, ?, ?, ?)""",
+                    (os.getpid(), stats["all_count"], stats["success_count"],
+                     stats["error_count"], self.written_count + len(batch))
+                )
                 await cursor.executemany(
-                    """INSERT OR IGNORE INTO received_requests
-                    (request_id, test_id, postback_type, event_name,
-                     source_id, campaign_id, placement_id, adset_id,
-                     ad_id, advertising_id, country, click_id, mmp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    [(d.get("request_id"), d.get("test_id"), d.get("postback_type"),
-                      d.get("event_name"), d.get("source_id"), d.get("campaign_id"),
-                      d.get("placement_id"), d.get("adset_id"), d.get("ad_id"),
-                      d.get("advertising_id"), d.get("country"), d.get("click_id"),
-                      d.get("mmp")) for d in self._batch]
+                    """INSERT OR REPLACE INTO receiver_progress (test_id, pid, persisted)
+                    VALUES (?, ?, ?)""",
+                    [(test_id, os.getpid(), persisted[test_id])
+                     for test_id in {row[1] for row in batch}]
                 )
                 await self._pool.commit()
-                self._batch.clear()
+                self.written_count += len(batch)
+                self.persisted_counts = persisted
         except Exception as e:
             logger.error(f"Failed to save batch: {e}")
+        finally:
+            # Wake up /stats long-polls
+            self._committed.set()
+            self._committed = asyncio.Event()
+
+    async def wait_commit(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._committed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def persisted_count(self, test_id: str) -> int:
+        if WORKERS > 1:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, _sum_shard_progress, test_id
+            )
+        return self.persisted_counts[test_id]
+
+    async def drain(self):
+        """Waits until every queued row is committed"""
+        await self._queue.join()
+
+    async def close(self):
+        await self.drain()
+        if self._writer_task:
+            self._writer_task.cancel()
+            await asyncio.gather(self._writer_task, return_exceptions=True)
+        if self._pool:
+            await self._pool.close()
+        if self.storage:
+            self.storage.close()
+        # Bitmaps are only served while the receiver runs
+        for bitmap in self.bitmaps.values():
+            bitmap.close()
+            bitmap.path.unlink(missing_ok=True)
+        self.bitmaps.clear()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     db = await Database.get_instance()
     yield
 
-    await db._flush_batch()
-    if db._pool:
-        await db._pool.close()
+    await db.close()
 
 app = FastAPI(lifespan=lifespan)
 stats = defaultdict(int)
@@ -107,13 +230,83 @@ stats.update({"success_count": 0, "error_count": 0, "all_count": 0})
 @app.get("/flush")
 async def flush(request: Request):
     db = await Database.get_instance()
-    if db._batch:
-        await db._flush_batch()
-        if db._pool:
-            await db._pool.close()
+    await db.drain()
     return {"status": "flushed"}
 
 
+def _sum_shard_stats() -> dict:
+    totals = defaultdict(int)
+    for path in SHARDS_DIR.glob("received_*.db"):
+        with sqlite3.connect(path) as conn:
+            row = conn.execute(
+                """SELECT COUNT(*), SUM(all_count), SUM(success_count),
+                          SUM(error_count), SUM(written_count)
+                   FROM receiver_stats"""
+            ).fetchone()
+        for key, value in zip(("workers", "all_count", "success_count",
+                               "error_count", "written_count"), row):
+            totals[key] += value or 0
+    return dict(totals)
+
+
+def _sum_shard_progress(test_id: str) -> int:
+    total = 0
+    for path in SHARDS_DIR.glob("received_*.db"):
+        with sqlite3.connect(path) as conn:
+            total += conn.execute(
+                "SELECT COALESCE(SUM(persisted), 0) FROM receiver_progress WHERE test_id = ?",
+                (test_id,)
+            ).fetchone()[0]
+    return total
+
+
+@app.get("/stats")
+async def get_stats(request: Request, test_id: Optional[str] = None,
+                    wait_for: int = 0, timeout: float = 0.0):
+    """Receiver counters; with test_id it reports that test's persisted rows and,
+    given wait_for, long-polls until that many are committed or timeout expires."""
+    db = await Database.get_instance()
+    if test_id is not None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(timeout, 30.0)
+        persisted = await db.persisted_count(test_id)
+        while persisted < wait_for and loop.time() < deadline:
+            # Other workers' commits are not signalled here, so re-check shards often
+            remaining = deadline - loop.time()
+            await db.wait_commit(min(remaining, 0.1) if WORKERS > 1 else remaining)
+            persisted = await db.persisted_count(test_id)
+        return {
+            "test_id": test_id,
+            "received": db.received_counts[test_id],
+            "persisted": persisted,
+            "queue_depth": db.queue_depth,
+        }
+
+    result = {**stats, "queue_depth": db.queue_depth, "written_count": db.written_count}
+    if WORKERS > 1:
+        # Counters of all workers as of their last commit
+        result["pid"] = os.getpid()
+        result["all_workers"] = await asyncio.get_running_loop().run_in_executor(
+            None, _sum_shard_stats
+        )
+    return result
+
+
+def _read_bitmap(test_id: str) -> DeliveryBitmap:
+    return DeliveryBitmap.union(
+        path.read_bytes() for path in SHARDS_DIR.glob(f"{test_id}.*.bitmap")
+    )
+
+
+@app.get("/bitmap")
+async def get_bitmap(request: Request, test_id: str):
+    """zlib-compressed DeliveryBitmap of the postbacks of a test received with
+    a seq param, all workers included"""
+    if not _TEST_ID_RE.match(test_id):
+        return JSONResponse(status_code=400, content={"error": "invalid test_id"})
+    bitmap = await asyncio.get_running_loop().run_in_executor(None, _read_bitmap, test_id)
+    return Response(zlib.compress(bitmap.to_bytes()), media_type="application/octet-stream")
+
 
 @app.get("/verify")
 async def verify(request: Request):
@@ -135,12 +328,59 @@ async def verify(request: Request):
             content={"error": "internal server error"}
         )
 
+def compact_shards():
+    """Moves rows of shards left by a previous run into DB_PATH and removes the
+    files, bitmaps of that run included"""
+    bitmaps = list(SHARDS_DIR.glob("*.bitmap"))
+    for path in bitmaps:
+        path.unlink(missing_ok=True)
+    if bitmaps:
+        logger.info(f"Removed {len(bitmaps)} delivery bitmaps of a previous run")
+    if not any(SHARDS_DIR.glob("received_*.db")):
+        return
+    storage = SQLiteStorage(DB_PATH, shards_dir=SHARDS_DIR)
+    storage.init_schema()
+    try:
+        shards = storage.merge_received_shards()
+    finally:
+        storage.close()
+    for path in shards:
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+    logger.info(f"Compacted {len(shards)} receiver shards into {DB_PATH}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Postback receiver")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="Worker processes, each writes its own shard in shards/",
+    )
+    parser.add_argument(
+        "--storage",
+        type=str,
+        choices=BACKENDS,
+        default=STORAGE,
+        help="Where received postbacks are stored",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    compact_shards()
+    # Workers import this module anew and read the mode from the environment
+    os.environ["RECEIVER_WORKERS"] = str(args.workers)
+    os.environ["RECEIVER_STORAGE"] = args.storage
     uvicorn.run(
         "main:app",
-        host="0.0.0.0",
-        port=8001,
-        workers=1,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
         # loop="uvloop",
         # http="h11",
         # limit_concurrency=5000
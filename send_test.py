@@ -3,27 +3,16 @@ import httpx
 import random
 import time
 import uuid
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 import logging
+from typing import Iterable, Iterator
+
+from sender.generator import PostbackGenerator
+from sender.pool import run_worker_pool
+
 logger = logging.getLogger(__name__)
 
 
-def generate_postback(test_id: str) -> dict:
-        return {
-            "request_id": str(uuid.uuid4()),
-            "test_id": test_id,
-            "postback_type": "random.choice(self.config.postback_types)",
-            "event_name": "random.choice(self.config.event_names)",
-            "source_id": "random.choice(self.config.source_ids)",
-            "campaign_id": str(uuid.uuid4()),
-            "placement_id": str(uuid.uuid4()),
-            "adset_id": random.choice(["123456", "654321"]),
-            "ad_id": random.choice(["0123456", "0654321"]),
-            "advertising_id": test_id,
-            "country": "ru",
-            "click_id": str(uuid.uuid4()),
-            "mmp": "random.choice(self.config.mmp)",
-        }
 # async def async_generate_postback(test_id: str) -> dict:
 #         return {
 #             "request_id": str(uuid.uuid4()),
@@ -41,11 +30,17 @@ def generate_postback(test_id: str) -> dict:
 #             "mmp": "random.choice(self.config.mmp)",
 #         }
 
-def generate_all_postbacks(test_id:str):
-    postbacks = []
-    for _ in range(100_000):
-        postbacks.append(generate_postback(test_id))
-    return postbacks
+def iter_postbacks(test_id: str, count: int = 100_000) -> Iterator[dict]:
+    """Postbacks генерируются чанками по мере отправки"""
+    generator = PostbackGenerator(
+        test_id=test_id,
+        seed=random.getrandbits(63),
+        postback_types=["install", "event"],
+        event_names=["registration", "level", "purchase"],
+        source_ids=["100"],
+        mmp=["appmetrica", "appsflyer"],
+    )
+    return generator.iter_dicts(count)
 
 # async def async_generate_all_postbacks(test_id:str):
 #     postbacks = []
@@ -70,10 +65,10 @@ async def send_postback(postback: dict, client: httpx.AsyncClient) -> bool:
         logger.error(f"Postback failed: {e}")
         return False
 
-async def send_postbacks_concurrently(postbacks: list[dict], max_concurrent: int = 100) -> tuple[int, int]:
-    """Отправляет множество postbacks асинхронно с ограничением на параллелизм."""
-    success = errors = 0
-
+async def send_postbacks_concurrently(postbacks: Iterable[dict], max_concurrent: int = 100) -> tuple[int, int]:
+    """Отправляет postbacks асинхронно: max_concurrent корутин забирают их из
+    итератора по одному, так что задач в планировщике и postbacks в памяти
+    не больше max_concurrent при любом объёме теста."""
     # Ограничиваем количество одновременных соединений
     limits = httpx.Limits(max_connections=max_concurrent)
 
@@ -82,23 +77,13 @@ async def send_postbacks_concurrently(postbacks: list[dict], max_concurrent: int
         limits=limits,
         timeout=httpx.Timeout(10.0)
     ) as client:
-        # Создаем задачи для всех postbacks
-        tasks = [send_postback(pb, client) for pb in postbacks]
-
-        # Обрабатываем результаты по мере завершения
-        for task in asyncio.as_completed(tasks):
-            try:
-                if await task:
-                    success += 1
-                else:
-                    errors += 1
-            except Exception as e:
-                errors += 1
-                logger.error(f"Task failed: {e}")
-
-    return success, errors
-
-async def async_main(postbacks: list[dict]):
+        return await run_worker_pool(
+            postbacks,
+            workers=max_concurrent,
+            handle=lambda postback: send_postback(postback, client),
+        )
+
+async def async_main(postbacks: Iterable[dict], count: int):
     """Основная асинхронная функция с замером времени."""
     start_time = time.perf_counter()
 
@@ -106,9 +91,9 @@ async def async_main(postbacks: list[dict]):
     success, errors = await send_postbacks_concurrently(postbacks, max_concurrent=100)
 
     total_time = time.perf_counter() - start_time
-    rps = len(postbacks) / total_time if total_time > 0 else 0
+    rps = count / total_time if total_time > 0 else 0
 
-    print(f"Total requests: {len(postbacks)}")
+    print(f"Total requests: {count}")
     print(f"Success: {success}, Errors: {errors}")
     print(f"Time: {total_time:.2f} sec")
     print(f"Requests per second (RPS): {rps:.2f}")
@@ -126,20 +111,37 @@ def send_request_with_client(postback: dict):
             })
             return False
 
-def thread_pool_main(postbacks):
+def send_request(postback: dict, client: httpx.Client) -> bool:
+    try:
+        response = client.get("http://127.0.0.1:8001/verify", params=postback)
+        response.raise_for_status()
+        return True
+    except Exception as e:
+        logger.error({
+            "event_log": "send_request_failed",
+            "error": str(e),
+        })
+        return False
+
+def thread_pool_main(postbacks: Iterable[dict], max_workers: int = 4):
     start_time = time.perf_counter()
     success, errors = 0,0
     with httpx.Client() as client:
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            futures = [executor.submit(send_request, postback, client) for postback in postbacks]
-
-            # Ожидаем завершения всех задач и считаем результаты
-            for future in futures:
-                result = future.result()  # Блокирует, пока запрос не завершится
-                if result:
-                    success += 1
-                else:
-                    errors += 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Не больше двух задач на поток в очереди: postbacks берутся из
+            # итератора по мере освобождения потоков, а не все сразу
+            pending = set()
+            for postback in postbacks:
+                if len(pending) >= 2 * max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    ok = sum(future.result() for future in done)
+                    success += ok
+                    errors += len(done) - ok
+                pending.add(executor.submit(send_request, postback, client))
+            # Ожидаем завершения оставшихся задач
+            ok = sum(future.result() for future in wait(pending).done)
+            success += ok
+            errors += len(pending) - ok
     result_time = time.perf_counter() - start_time
     print("thread_pool_main result_time",result_time)
     print("thread_pool_main success",success)
@@ -178,62 +180,14 @@ def thread_pool_main(postbacks):
 #     print("async_main success",success)
 #     print("async_main errors",errors)
 
-def main():
-    start_time = time.perf_counter()
+def main() -> tuple[Iterator[dict], int]:
     test_id = str(uuid.uuid4())
-    result = generate_all_postbacks(test_id)
-    print(len(result))
-    result_time = time.perf_counter() - start_time
-    print("main result_time",result_time)
-    return result
-
-
-
-async def send_postbacks_concurrently(postbacks: list[dict], max_concurrent: int = 100) -> tuple[int, int]:
-    """Отправляет множество postbacks асинхронно с ограничением на параллелизм."""
-    success = errors = 0
-
-    # Ограничиваем количество одновременных соединений
-    limits = httpx.Limits(max_connections=max_concurrent)
-
-    async with httpx.AsyncClient(
-        http2=True,  # Используем HTTP/2 для эффективности
-        limits=limits,
-        timeout=httpx.Timeout(10.0)
-    ) as client:
-        # Создаем задачи для всех postbacks
-        tasks = [send_postback(pb, client) for pb in postbacks]
-
-        # Обрабатываем результаты по мере завершения
-        for task in asyncio.as_completed(tasks):
-            try:
-                if await task:
-                    success += 1
-                else:
-                    errors += 1
-            except Exception as e:
-                errors += 1
-                logger.error(f"Task failed: {e}")
-
-    return success, errors
-
-async def async_main(postbacks: list[dict]):
-    """Основная асинхронная функция с замером времени."""
-    start_time = time.perf_counter()
-
-    # Отправляем с ограничением в 100 одновременных запросов
-    success, errors = await send_postbacks_concurrently(postbacks, max_concurrent=100)
-
-    total_time = time.perf_counter() - start_time
-    rps = len(postbacks) / total_time if total_time > 0 else 0
-
-    print(f"Total requests: {len(postbacks)}")
-    print(f"Success: {success}, Errors: {errors}")
-    print(f"Time: {total_time:.2f} sec")
-    print(f"Requests per second (RPS): {rps:.2f}")
+    count = 100_000
+    print("streaming postbacks", count)
+    return iter_postbacks(test_id, count), count
 
 if __name__ == "__main__":
-    postbacks = main()
-    asyncio.run(async_main(postbacks))
+    postbacks, count = main()
+    asyncio.run(async_main(postbacks, count))
     # thread_pool_main(postbacks)
     # process_pool_main(postbacks)
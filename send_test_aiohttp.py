@@ -4,15 +4,21 @@ from datetime import datetime
 import logging
 import os
 from pathlib import Path
-import sqlite3
 import time
 import uuid
 import random
+from itertools import islice
+from typing import Iterable, Iterator
 import uvloop
 import aiohttp
+from yarl import URL
 from dotenv import load_dotenv
 import httpx
 
+from sender.generator import PostbackGenerator
+from sender.pool import run_worker_pool
+from storage import BACKENDS, Storage, metrics_row, open_storage, postback_row
+
 uvloop.install()
 BASE_DIR = Path(__file__).resolve().parent
 print("BASE_DIR",BASE_DIR)
@@ -23,60 +29,19 @@ TARGET_URL = os.environ.get("TARGET_URL", "http://127.0.0.1:8001")
 # TARGET_URL = os.environ.get("TARGET_URL", "http://127.0.0.1:8001/verify")
 
 logger = logging.getLogger(__name__)
-TEST_CONFIG ={"test_id":"test_id","request_count":1,"target_url":TARGET_URL,"source_id":"100","connection_limit":200,"butch":400,"timeout":None}
-METRICS_DB_PATH = "metrics.db"
+TEST_CONFIG ={"test_id":"test_id","request_count":1,"target_url":TARGET_URL,"source_id":"100","connection_limit":200,"timeout":5.0}
 REQUESTS_DB_PATH = "requests.db"
 if TARGET_URL == "http://127.0.0.1:8001":
     FLUSH_URL = f"{TARGET_URL}/flush"
 else:
     FLUSH_URL = f"http://139.59.26.67:8001/flush"
 
-def init_metrics_db():
-    """Инициализация базы данных для метрик"""
-    with sqlite3.connect(METRICS_DB_PATH) as conn:
-        conn.execute("PRAGMA journal_mode=WAL")  # Режим журналирования
-        conn.execute("PRAGMA synchronous=NORMAL")
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS metrics (
-                test_id TEXT PRIMARY KEY,
-                test_datetime TEXT NOT NULL,
-                duration REAL NOT NULL,
-                total_requests INTEGER NOT NULL,
-                success_count INTEGER NOT NULL,
-                error_count INTEGER NOT NULL,
-                connection_limit INTEGER NOT NULL,
-                batch_size INTEGER NOT NULL,
-                rps REAL NOT NULL,
-                received_count INTEGER,
-                verified_count INTEGER
-            )
-        """)
-        conn.commit()
-
-    with sqlite3.connect(REQUESTS_DB_PATH) as conn:
-        conn.execute("PRAGMA journal_mode=WAL")  # Режим журналирования
-        conn.execute("PRAGMA synchronous=NORMAL")
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS received_requests (
-                request_id TEXT PRIMARY KEY,
-                test_id TEXT,
-                postback_type TEXT,
-                event_name TEXT,
-                source_id TEXT,
-                campaign_id TEXT,
-                placement_id TEXT,
-                adset_id TEXT,
-                ad_id TEXT,
-                advertising_id TEXT,
-                country TEXT,
-                click_id TEXT,
-                mmp TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
+def init_storage(backend: str = "sqlite") -> Storage:
+    """Хранилище postbacks и метрик, общее с sender и receiver"""
+    return open_storage(backend, path=REQUESTS_DB_PATH)
 
 def save_metrics(
+    storage: Storage,
     test_id: str,
     total_time: float,
     rps: float,
@@ -84,50 +49,29 @@ def save_metrics(
     success: int,
     errors: int,
     connection_limit: int,
-    batch_size: int,
-    received_count: int|None = None,
-    verified_count: int|None = None
+    received_count: int,
+    verified_count: int,
 ):
-    with sqlite3.connect(METRICS_DB_PATH) as conn:
-        conn.execute(
-            """
-            INSERT INTO metrics (
-                test_id, test_datetime, duration, total_requests,
-                success_count, error_count, connection_limit, batch_size,
-                rps, received_count, verified_count
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                test_id,
-                datetime.now().isoformat(),
-                total_time,
-                total_requests,
-                success,
-                errors,
-                connection_limit,
-                batch_size,
-                rps,
-                received_count,
-                verified_count
-            )
+    storage.save_metrics(
+        metrics_row(
+            {
+                "test_id": test_id,
+                "duration": total_time,
+                "sending_count": total_requests,
+                "verified_success": verified_count,
+                "unverified_success": max(0, success - verified_count),
+                "failed": errors,
+                "verified_rate": verified_count / total_requests * 100 if total_requests else 0,
+                "rps": rps,
+                "params": {
+                    "tool": "send_test_aiohttp",
+                    "success_count": success,
+                    "connection_limit": connection_limit,
+                    "received_count": received_count,
+                },
+            }
         )
-        conn.commit()
-
-def get_last_metrics(limit: int = 10) -> list[dict]:
-    with sqlite3.connect(METRICS_DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                test_id, test_datetime, duration, total_requests,
-                success_count, error_count, connection_limit, batch_size,
-                rps, received_count, verified_count
-            FROM metrics
-            ORDER BY test_datetime DESC
-            LIMIT ?
-        """, (limit,))
-
-        columns = [col[0] for col in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    )
 
 def print_metrics_history(metrics: list[dict]):
     if not metrics:
@@ -137,184 +81,105 @@ def print_metrics_history(metrics: list[dict]):
     print("\nLast 10 test metrics:")
     print("-" * 120)
     print(f"{'Test ID':<36} | {'Date/Time':<19} | {'Duration':<8} | {'Req':<6} | {'Succ':<6} | "
-          f"{'Err':<6} | {'Conn':<4} | {'Batch':<5} | {'RPS':<8} | {'Recv':<6} | {'Verif':<6}")
+          f"{'Err':<6} | {'Conn':<4} | {'RPS':<8} | {'Recv':<6} | {'Verif':<6}")
     print("-" * 120)
 
     for m in metrics:
-        print(f"{m['test_id']} | {m['test_datetime'][:19]} | {m['duration']:7.2f}s | {m['total_requests']:6} | "
-              f"{m['success_count']:6} | {m['error_count']:6} | {m['connection_limit']:4} | "
-              f"{m['batch_size']:5} | {m['rps']:7.1f} | {m['received_count'] or 0:6} | "
-              f"{m['verified_count'] or 0:6}")
-
-def generate_postback(test_id: str) -> dict:
-    return {
-        "request_id": str(uuid.uuid4()),
-        "test_id": test_id,
-        "postback_type": "install",
-        "event_name": "registration",
-        "source_id": TEST_CONFIG.get("source_id"),
-        "campaign_id": str(uuid.uuid4()),
-        "placement_id": str(uuid.uuid4()),
-        "adset_id": random.choice(["123456", "654321"]),
-        "ad_id": random.choice(["0123456", "0654321"]),
-        "advertising_id": test_id,
-        "country": "ru",
-        "click_id": str(uuid.uuid4()),
-        "mmp": "appsflyer",
-    }
-
-def generate_all_postbacks(test_id: str, count: int = 100000) -> list[dict]:
-    return [generate_postback(test_id) for _ in range(count)]
-
-
-async def send_postback(postback: dict, session: aiohttp.ClientSession) -> bool:
-    """Асинхронно отправляет один postback через aiohttp."""
-    timeout = TEST_CONFIG.get("timeout","5.0")
+        params = m["params"]
+        print(f"{m['test_id']} | {str(m['test_datetime'])[:19]} | {m['duration']:7.2f}s | {m['sending_count']:6} | "
+              f"{params.get('success_count', 0):6} | {m['failed']:6} | {params.get('connection_limit', 0):4} | "
+              f"{m['rps']:7.1f} | {params.get('received_count', 0):6} | "
+              f"{m['verified_success'] or 0:6}")
+
+def postback_generator(test_id: str, seed: int) -> PostbackGenerator:
+    return PostbackGenerator(
+        test_id=test_id,
+        seed=seed,
+        postback_types=["install"],
+        event_names=["registration"],
+        source_ids=[str(TEST_CONFIG.get("source_id"))],
+        mmp=["appsflyer"],
+    )
+
+def iter_postbacks(test_id: str, count: int, seed: int) -> Iterator[dict]:
+    """Генерирует postbacks чанками; при одинаковом seed последовательность повторяется."""
+    return postback_generator(test_id, seed).iter_dicts(count)
+
+def iter_postback_urls(test_id: str, count: int, seed: int) -> Iterator[str]:
+    """Те же postbacks, но сразу готовыми URL с уже закодированным query string."""
+    target_url = TEST_CONFIG.get("target_url")
+    prefix = target_url + ("&" if "?" in target_url else "?")
+    return postback_generator(test_id, seed).iter_query_strings(count, prefix=prefix)
+
+
+async def send_postback(url: str, session: aiohttp.ClientSession) -> bool:
+    """Асинхронно отправляет один postback через aiohttp.
+
+    URL уже закодирован генератором, encoded=True избавляет yarl от повторного разбора params.
+    Таймаут на запрос задан у сессии."""
     try:
-        async with session.get(
-            TEST_CONFIG.get("target_url"),
-            params=postback,
-            timeout=aiohttp.ClientTimeout(total=timeout)
-        ) as response:
+        async with session.get(URL(url, encoded=True)) as response:
             response.raise_for_status()
             return True
     except Exception as e:
         logger.error(f"Postback failed: {e}")
         return False
 
-async def process_batch(batch: list[dict], session: aiohttp.ClientSession) -> tuple[int, int]:
-    """Обрабатывает один батч postbacks."""
-    success = errors = 0
-    tasks = [send_postback(pb, session) for pb in batch]
-
-    for task in asyncio.as_completed(tasks):
-        try:
-            if await task:
-                success += 1
-            else:
-                errors += 1
-        except Exception as e:
-            errors += 1
-            logger.error(f"Task failed: {e}")
-
-    return success, errors
-
-async def send_postbacks_batched(
-    postbacks: list[dict],
+async def send_postbacks_windowed(
+    postbacks: Iterable[str],
     session: aiohttp.ClientSession,
-    batch_size: int = 1000
+    total: int,
+    window: int,
 ) -> tuple[int, int]:
-    """Отправляет postbacks батчами с контролем памяти и нагрузки."""
-    success_total = errors_total = 0
-    total_batches = (len(postbacks) // batch_size) + 1
-
-    for i in range(total_batches):
-        batch = postbacks[i*batch_size : (i+1)*batch_size]
-        if not batch:
-            continue
-
-        logger.info(f"Processing batch {i+1}/{total_batches} ({len(batch)} requests)")
-        success, errors = await process_batch(batch, session)
-        success_total += success
-        errors_total += errors
-
-    return success_total, errors_total
+    """Держит в полёте window запросов: каждый завершившийся сразу сменяется
+    следующим, так что медленный ответ занимает одно соединение, а не весь батч."""
+    return await run_worker_pool(
+        postbacks,
+        workers=min(window, total),
+        handle=lambda url: send_postback(url, session),
+        log_every=max(total // 10, 1),
+    )
 
 
-async def async_start(test_id:str,postbacks: list[dict],connection_limit:int,batch_size:int):
+async def async_start(test_id:str,postbacks: Iterable[str],total_requests:int,connection_limit:int,timeout:float) -> dict:
     """Основная асинхронная функция с замером времени."""
     start_time = time.perf_counter()
 
     connector = aiohttp.TCPConnector(limit=connection_limit, force_close=False,enable_cleanup_closed=True)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        success, errors = await send_postbacks_batched(
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as session:
+        success, errors = await send_postbacks_windowed(
             postbacks,
             session=session,
-            batch_size=batch_size,
+            total=total_requests,
+            window=connection_limit,
         )
 
     total_time = time.perf_counter() - start_time
-    rps = len(postbacks) / total_time
-    total_requests=len(postbacks)
+    rps = total_requests / total_time
     print(f"\nResults:")
     print(f"Total requests: {total_requests:,}")
     print(f"Success: {success:,}, Errors: {errors:,}")
     print(f"Time: {total_time:.2f} sec")
     print(f"Requests per second (RPS): {rps:,.2f}")
-    save_metrics(test_id=test_id,total_time=total_time,rps=rps,total_requests=total_requests,success=success,errors=errors,connection_limit=connection_limit,batch_size=batch_size)
+    return {"total_time": total_time, "rps": rps, "success": success, "errors": errors}
 
 
-def postback_preparation(postback_count:int, test_id:str):
-    start_time = time.perf_counter()
+def postback_preparation(postback_count:int, test_id:str, seed:int) -> Iterator[str]:
+    """Postbacks генерируются по мере отправки, список целиком в памяти не держим."""
+    print(f"Streaming {postback_count:,} postbacks (seed={seed})")
+    return iter_postback_urls(test_id, count=postback_count, seed=seed)
+
+def check_received_postbacks(storage: Storage, test_id:str):
+    return storage.count_received(test_id)
 
-    postbacks = generate_all_postbacks(test_id, count=postback_count)  # 1M запросов
-    print(f"Generated {len(postbacks):,} postbacks")
-    result_time = time.perf_counter() - start_time
-    print(f"Generation time: {result_time:.2f} sec")
-    return postbacks
-
-def check_received_postbacks(test_id:str,db_path:str="requests.db"):
-    with sqlite3.connect(db_path) as conn:
-        received_count = conn.execute(
-                    """SELECT COUNT(*) FROM received_requests r
-                    WHERE r.test_id = ?""",
-                    (test_id,)
-                ).fetchone()[0]
-        return received_count
-
-def check_data_consistency(postbacks:list[dict],test_id:str,db_path:str="requests.db"):
-    with sqlite3.connect(db_path) as conn:
-        conn.execute("""
-                CREATE TABLE IF NOT EXISTS sending_requests (
-                    request_id TEXT PRIMARY KEY,
-                    test_id TEXT,
-                    postback_type TEXT,
-                    event_name TEXT,
-                    source_id TEXT,
-                    campaign_id TEXT,
-                    placement_id TEXT,
-                    adset_id TEXT,
-                    ad_id TEXT,
-                    advertising_id TEXT,
-                    country TEXT,
-                    click_id TEXT,
-                    mmp TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                );""")
-        conn.commit()
-
-        for postback in postbacks:
-            values = [value for value in postback.values()]
-            conn.execute(
-                """
-                INSERT OR IGNORE INTO sending_requests
-                (request_id, test_id, postback_type, event_name, source_id,
-                 campaign_id, placement_id, adset_id, ad_id, advertising_id,
-                 country, click_id, mmp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                values,
-            )
-            conn.commit()
-        verified_received_count = conn.execute(
-                """SELECT COUNT(*) FROM sending_requests s
-                JOIN received_requests r ON s.request_id = r.request_id
-                WHERE s.test_id = ?""",
-                (test_id,)
-            ).fetchone()[0]
-        return verified_received_count
-
-def update_metric(received:int,verified_count:int,test_id:str):
-    with sqlite3.connect(METRICS_DB_PATH) as conn:
-            conn.execute(
-                """
-                UPDATE metrics
-                SET received_count = ?, verified_count = ?
-                WHERE test_id = ?
-                """,
-                (received, verified_count, test_id)
-            )
-            conn.commit()
+def check_data_consistency(storage: Storage, postbacks:Iterable[dict],test_id:str,chunk_size:int=10_000):
+    postbacks = iter(postbacks)
+    while chunk := list(islice(postbacks, chunk_size)):
+        storage.insert_sent([postback_row(postback) for postback in chunk])
+    verified_received_count, _ = storage.verify_requests(test_id)
+    return verified_received_count
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Postback Load Tester")
@@ -339,14 +204,20 @@ def parse_args():
         default=None,
     )
     parser.add_argument(
-        "--batch_size",
+        "--timeout",
+        type=float,
+        default=5.0,
+    )
+    parser.add_argument(
+        "--seed",
         type=int,
         default=None,
     )
     parser.add_argument(
-        "--timeout",
-        type=int,
-        default=5.0,
+        "--storage",
+        type=str,
+        choices=BACKENDS,
+        default="sqlite",
     )
     return parser.parse_args()
 
@@ -357,29 +228,34 @@ def main():
     TEST_CONFIG["requests"] = args.requests or 10
     TEST_CONFIG["source_id"] = args.source_id or "100"
     TEST_CONFIG["connection_limit"] = args.connection_limit or 200
-    TEST_CONFIG["batch_size"] = args.batch_size or 400
     TEST_CONFIG["timeout"] = args.timeout
-    init_metrics_db()
+    TEST_CONFIG["seed"] = args.seed if args.seed is not None else random.getrandbits(64)
+    storage = init_storage(args.storage)
 
     postback_count=TEST_CONFIG.get("requests")
     test_id = TEST_CONFIG["test_id"]
-    postbacks = postback_preparation(postback_count=postback_count,test_id=test_id)
+    seed = TEST_CONFIG["seed"]
+    postbacks = postback_preparation(postback_count=postback_count,test_id=test_id,seed=seed)
 
-    asyncio.run(async_start(test_id=test_id,postbacks=postbacks,connection_limit=TEST_CONFIG["connection_limit"],batch_size=TEST_CONFIG["batch_size"]))
+    result = asyncio.run(async_start(test_id=test_id,postbacks=postbacks,total_requests=postback_count,connection_limit=TEST_CONFIG["connection_limit"],timeout=TEST_CONFIG["timeout"]))
     time.sleep(3)
     with httpx.Client() as client:
         client.get(f"{FLUSH_URL}")
     time.sleep(1)
-    received = check_received_postbacks(test_id)
+    received = check_received_postbacks(storage, test_id)
     print("received",received)
     verified_count = 0
     if postback_count == received:
-        verified_count = check_data_consistency(postbacks=postbacks,test_id=test_id)
+        # Тот же seed воспроизводит ровно те postbacks, что были отправлены
+        postbacks = iter_postbacks(test_id, count=postback_count, seed=seed)
+        verified_count = check_data_consistency(storage, postbacks=postbacks,test_id=test_id)
         print("verified_count",verified_count)
 
-    update_metric(received=received,verified_count=verified_count,test_id=test_id)
+    save_metrics(storage, test_id=test_id,total_time=result["total_time"],rps=result["rps"],total_requests=postback_count,
+                 success=result["success"],errors=result["errors"],connection_limit=TEST_CONFIG["connection_limit"],
+                 received_count=received,verified_count=verified_count)
 
-    metrics_history = get_last_metrics(10)
+    metrics_history = storage.get_history(10)
     print_metrics_history(metrics_history)
 
 
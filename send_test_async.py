@@ -4,9 +4,12 @@ import logging
 import time
 import uuid
 import random
-from typing import List, Dict, Tuple
+from typing import Dict, Iterable, Iterator, Tuple
 import uvloop
-import aiohttp
+
+from sender.generator import PostbackGenerator
+from sender.pool import run_worker_pool
+
 uvloop.install()
 
 
@@ -26,124 +29,59 @@ async def send_postback(postback: dict, client: httpx.AsyncClient) -> bool:
         logger.error(f"Postback failed: {e}")
         return False
 
-async def process_batch(batch: List[Dict], client: httpx.AsyncClient) -> Tuple[int, int]:
-    """Обрабатывает один батч postbacks."""
-    success = errors = 0
-    tasks = [send_postback(pb, client) for pb in batch]
-
-    for task in asyncio.as_completed(tasks):
-        try:
-            if await task:
-                success += 1
-            else:
-                errors += 1
-        except Exception as e:
-            errors += 1
-            logger.error(f"Task failed: {e}")
-
-    return success, errors
-
-async def send_postbacks_batched(
-    postbacks: list[dict],
-    batch_size: int = 1000,
-    max_concurrent: int = 100
-
+async def send_postbacks_pooled(
+    postbacks: Iterable[Dict],
+    workers: int = 300,
 ) -> Tuple[int, int]:
-    """Отправляет postbacks батчами с контролем памяти и нагрузки."""
-    success_total = errors_total = 0
-    limits = httpx.Limits(max_connections=max_concurrent)
+    """Отправляет postbacks фиксированным пулом из workers корутин, забирая их
+    из итератора по одному: память и число задач не зависят от объёма теста."""
+    limits = httpx.Limits(max_connections=workers)
 
     async with httpx.AsyncClient(
         limits=limits,
         timeout=httpx.Timeout(6.0)
     ) as client:
-        # Делим postbacks на равные батчи
-        total_batches = (len(postbacks) // batch_size) + 1
-
-        for i in range(total_batches):
-            start_idx = i * batch_size
-            end_idx = start_idx + batch_size
-            batch = postbacks[start_idx:end_idx]
-
-            if not batch:
-                continue
-
-            logger.info(f"Processing batch {i+1}/{total_batches} ({len(batch)} requests)")
-            success, errors = await process_batch(batch, client)
-            success_total += success
-            errors_total += errors
-
-    return success_total, errors_total
+        return await run_worker_pool(
+            postbacks,
+            workers=workers,
+            handle=lambda postback: send_postback(postback, client),
+        )
 
-async def async_main(postbacks: List[Dict]):
+async def async_main(postbacks: Iterable[Dict], count: int):
     """Основная асинхронная функция с замером времени."""
     start_time = time.perf_counter()
 
-    # Настройки батчинга:
-    # - batch_size: сколько запросов в одном батче (оптимально 10k-50k)
-    # - max_concurrent: сколько одновременных соединений (100-500)
-    success, errors = await send_postbacks_batched(
-        postbacks,
-        batch_size=500,
-        max_concurrent=300
-    )
+    # workers: сколько запросов одновременно в полёте (100-500)
+    success, errors = await send_postbacks_pooled(postbacks, workers=300)
 
     total_time = time.perf_counter() - start_time
-    rps = len(postbacks) / total_time if total_time > 0 else 0
+    rps = count / total_time if total_time > 0 else 0
 
     print(f"\nResults:")
-    print(f"Total requests: {len(postbacks):,}")
+    print(f"Total requests: {count:,}")
     print(f"Success: {success:,}, Errors: {errors:,}")
     print(f"Time: {total_time:.2f} sec")
     print(f"Requests per second (RPS): {rps:,.2f}")
 
-def generate_postback(test_id: str) -> dict:
-    return {
-        "request_id": str(uuid.uuid4()),
-        "test_id": test_id,
-        "postback_type": "click",
-        "event_name": "purchase",
-        "source_id": "facebook",
-        "campaign_id": str(uuid.uuid4()),
-        "placement_id": str(uuid.uuid4()),
-        "adset_id": random.choice(["123456", "654321"]),
-        "ad_id": random.choice(["0123456", "0654321"]),
-        "advertising_id": test_id,
-        "country": "ru",
-        "click_id": str(uuid.uuid4()),
-        "mmp": "appsflyer",
-    }
-
-def generate_all_postbacks(test_id: str, count: int = 100000) -> List[Dict]:
-    """Генерирует тестовые postbacks."""
-    return [generate_postback(test_id) for _ in range(count)]
+def iter_postbacks(test_id: str, count: int = 100000) -> Iterator[Dict]:
+    """Генерирует тестовые postbacks чанками по мере отправки."""
+    generator = PostbackGenerator(
+        test_id=test_id,
+        seed=random.getrandbits(63),
+        postback_types=["click"],
+        event_names=["purchase"],
+        source_ids=["facebook"],
+        mmp=["appsflyer"],
+    )
+    return generator.iter_dicts(count)
 
-def main():
-    """Генерирует данные и запускает тест."""
-    start_time = time.perf_counter()
+def main() -> tuple[Iterator[Dict], int]:
+    """Готовит поток postbacks для теста."""
     test_id = str(uuid.uuid4())
-    postbacks = generate_all_postbacks(test_id, count=10_000)  # 1M запросов
-    print(f"Generated {len(postbacks):,} postbacks")
-    result_time = time.perf_counter() - start_time
-    print(f"Generation time: {result_time:.2f} sec")
-    return postbacks
-
-async def async_main(postbacks: List[Dict]):
-    start_time = time.perf_counter()
-
-    connector = aiohttp.TCPConnector(limit=300)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        success, errors = await send_postbacks_batched(
-            postbacks,
-            batch_size=500,
-            max_concurrent=300,
-            session=session
-        )
-
-    total_time = time.perf_counter() - start_time
-    rps = len(postbacks) / total_time
-    print(f"RPS: {rps:,.2f}")
+    count = 10_000  # 1M запросов
+    print(f"Streaming {count:,} postbacks")
+    return iter_postbacks(test_id, count=count), count
 
 if __name__ == "__main__":
-    postbacks = main()
-    asyncio.run(async_main(postbacks))
+    postbacks, count = main()
+    asyncio.run(async_main(postbacks, count))
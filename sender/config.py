@@ -2,6 +2,7 @@ import logging
 import os
 import dotenv
 import argparse
+import sys
 from pathlib import Path
 from models import TestConfig as Config
 
@@ -9,6 +10,14 @@ logger = logging.getLogger(__name__)
 BASE_DIR = Path(__file__).resolve().parent.parent
 ENV_FILE = BASE_DIR / ".env"
 dotenv.load_dotenv(ENV_FILE)
+# Shared packages (storage) live at the repository root; appended so the root
+# stat.py never shadows the standard library module
+if str(BASE_DIR) not in sys.path:
+    sys.path.append(str(BASE_DIR))
+from storage import BACKENDS  # noqa: E402
+from engines import ENGINES, PROTOCOLS, check_engine_options  # noqa: E402
+from profiles import PROFILE_USAGE, parse_profile  # noqa: E402
+
 print("BASE_DIR", BASE_DIR),
 print("env_file", ENV_FILE),
 TARGET_URL = os.environ.get("TARGET_URL", "http://127.0.0.1:8001/verify")
@@ -51,13 +60,14 @@ def parse_args():
         "--threads",
         type=int,
         default=TEST_CONFIG.parallel_threads_count,
-        help="Number of parallel threads",
+        help="Number of sender processes sharing the RPS budget",
     )
     parser.add_argument(
         "--rps",
         type=int,
-        default=TEST_CONFIG.max_requests_per_second,
-        help="Maximum requests per second",
+        default=None,
+        help=f"Maximum requests per second, {TEST_CONFIG.max_requests_per_second} by default "
+        "and unlimited for --benchmark rounds unless given, 0 means unlimited",
     )
     parser.add_argument(
         "--duration",
@@ -68,4 +78,153 @@ def parse_args():
     parser.add_argument(
         "--target", type=str, default=TEST_CONFIG.target_url, help="Target URL to test"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--storage",
+        type=str,
+        choices=BACKENDS,
+        default=TEST_CONFIG.storage,
+        help="Where sent/received postbacks and metrics are stored",
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=ENGINES,
+        default=TEST_CONFIG.engine,
+        help="HTTP client sending the postbacks, raw is a lean HTTP/1.1-only sender",
+    )
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=TEST_CONFIG.max_connections,
+        help="Keep-alive connections of the aiohttp and raw engines, threads of the threads engine",
+    )
+    parser.add_argument(
+        "--benchmark",
+        nargs="*",
+        choices=ENGINES,
+        default=None,
+        metavar="ENGINE",
+        help="Run the test once per engine (all of them if none are given) and compare them; "
+        "rounds are not rate-limited unless --rps is given",
+    )
+    parser.add_argument(
+        "--saturate",
+        nargs=2,
+        type=int,
+        default=None,
+        metavar=("MIN_RPS", "MAX_RPS"),
+        help="Search the highest RPS between MIN_RPS and MAX_RPS that stays within "
+        "--slo_p99 and --slo_errors, every probe is stored as a run",
+    )
+    parser.add_argument(
+        "--slo_p99",
+        type=float,
+        default=TEST_CONFIG.slo_p99,
+        help="p99 latency limit of the saturation search, seconds",
+    )
+    parser.add_argument(
+        "--slo_errors",
+        type=float,
+        default=TEST_CONFIG.slo_error_rate,
+        help="Failed request limit of the saturation search, percent",
+    )
+    parser.add_argument(
+        "--probe_seconds",
+        type=float,
+        default=TEST_CONFIG.probe_seconds,
+        help="Length of one saturation probe",
+    )
+    parser.add_argument(
+        "--protocol",
+        type=str,
+        choices=PROTOCOLS,
+        default=TEST_CONFIG.protocol,
+        help="auto, h1 keep-alive, h1-pipelined (raw engine, --pipeline > 1) or h2 "
+        "(prior knowledge on http://, httpx and threads engines, needs the h2 package)",
+    )
+    parser.add_argument(
+        "--streams",
+        type=int,
+        default=TEST_CONFIG.max_streams,
+        help="HTTP/2 streams per connection of the httpx engine, h2 opens "
+        "in_flight / streams connections",
+    )
+    parser.add_argument(
+        "--pipeline",
+        type=int,
+        default=TEST_CONFIG.pipeline_depth,
+        help="Requests pipelined per raw-engine connection, 1 disables pipelining",
+    )
+    parser.add_argument(
+        "--no_spool",
+        dest="spool",
+        action="store_false",
+        default=TEST_CONFIG.spool,
+        help="Write sent postbacks to storage while sending instead of spooling them to a file",
+    )
+    parser.add_argument(
+        "--profile",
+        type=_load_profile,
+        default=None,
+        metavar="SPEC",
+        help="Load profile instead of a flat --rps, sets the request count and stretches "
+        "--duration to fit: " + ", ".join(PROFILE_USAGE.values()),
+    )
+    parser.add_argument(
+        "--verification",
+        type=str,
+        choices=("rows", "replay", "bitmap"),
+        default=TEST_CONFIG.verification,
+        help="rows joins stored sent and received postbacks; replay stores no sent rows "
+        "and regenerates them from the seed; bitmap only diffs postback numbers with "
+        "the receiver's bitmap (for huge runs)",
+    )
+    parser.add_argument(
+        "--grace",
+        type=float,
+        default=TEST_CONFIG.delivery_grace_seconds,
+        help="Seconds to wait for the receiver to persist delivered postbacks",
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=TEST_CONFIG.burst_size,
+        help="Requests released together per scheduler tick",
+    )
+    parser.add_argument(
+        "--in_flight",
+        type=int,
+        default=TEST_CONFIG.max_in_flight,
+        help="Maximum requests awaiting a response",
+    )
+    parser.add_argument(
+        "--compact_ids",
+        action="store_true",
+        default=TEST_CONFIG.compact_ids,
+        help="Send 63-bit integer ids instead of uuid4 strings",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=TEST_CONFIG.seed,
+        help="Seed of the generated postbacks, the same seed repeats a run",
+    )
+    args = parser.parse_args()
+    engines = [args.engine] if args.benchmark is None else args.benchmark or list(ENGINES)
+    for engine in engines:
+        try:
+            check_engine_options(engine, args.protocol, args.pipeline)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.saturate is not None:
+        min_rps, max_rps = args.saturate
+        if not 0 < min_rps <= max_rps:
+            parser.error("--saturate needs 0 < MIN_RPS <= MAX_RPS")
+    return args
+
+
+def _load_profile(spec: str):
+    try:
+        return parse_profile(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
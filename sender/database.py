@@ -1,252 +1,342 @@
 import asyncio
-import sqlite3
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
 from pathlib import Path
-from typing import Any
+from typing import IO, Any, Iterable, Sequence
 
+from histogram import LatencyHistogram
 from models import TestMetrics, TestStats
+from storage import Storage, metrics_row, open_storage
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
 
 
 class DatabaseManager:
-    def __init__(self, db_path: Path):
+    """Async front of a storage backend for the sender.
+
+    Sent postbacks are queued and written by one thread, every other call
+    runs the blocking backend method in an executor. With ``spool`` the
+    thread appends them to ``spool/{test_id}-{pid}.jsonl`` next to the
+    database instead, and load_spool() bulk-loads them after the run, so
+    the backend sees no writes while requests are being sent.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        flush_rows: int = 10_000,
+        flush_interval: float = 0.5,
+        queue_size: int = 100_000,
+        backend: str = "sqlite",
+        spool: bool = False,
+        buffer_rows: int = 1_000,
+        max_pending_chunks: int = 100,
+    ):
         self.db_path = db_path
-        self._init_db()
-        self.sending_requests_buffer = []
-        self.buffer_size = 100
-
-    def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("PRAGMA journal_mode = WAL")
-            conn.execute("PRAGMA synchronous = NORMAL")
-            conn.execute("PRAGMA cache_size=-10000")
-            conn.executescript(
-                """
-                CREATE TABLE IF NOT EXISTS sending_requests (
-                    request_id TEXT PRIMARY KEY,
-                    test_id TEXT,
-                    postback_type TEXT,
-                    event_name TEXT,
-                    source_id TEXT,
-                    campaign_id TEXT,
-                    placement_id TEXT,
-                    adset_id TEXT,
-                    ad_id TEXT,
-                    advertising_id TEXT,
-                    country TEXT,
-                    click_id TEXT,
-                    mmp TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                );
-
-                CREATE TABLE IF NOT EXISTS received_requests (
-                    request_id TEXT PRIMARY KEY,
-                    test_id TEXT,
-                    postback_type TEXT,
-                    event_name TEXT,
-                    source_id TEXT,
-                    campaign_id TEXT,
-                    placement_id TEXT,
-                    adset_id TEXT,
-                    ad_id TEXT,
-                    advertising_id TEXT,
-                    country TEXT,
-                    click_id TEXT,
-                    mmp TEXT,
-                    gaid TEXT,
-                    idfa TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                );
-
-                CREATE TABLE IF NOT EXISTS metrics (
-                    test_id TEXT PRIMARY KEY,
-                    test_datetime TEXT,
-                    duration REAL,
-                    sending_count INTEGER,
-                    verified_success INTEGER,
-                    unverified_success INTEGER,
-                    failed INTEGER,
-                    verified_rate REAL,
-                    avg_latency REAL,
-                    min_latency REAL,
-                    max_latency REAL,
-                    p90 REAL,
-                    p95 REAL,
-                    p99 REAL,
-                    rps REAL
-                );
-
-                CREATE INDEX IF NOT EXISTS idx_sending_test ON sending_requests(test_id, request_id);
-                CREATE INDEX IF NOT EXISTS idx_received_test ON received_requests(test_id, request_id);
-                """
+        self.backend = backend
+        kwargs = {}
+        if backend == "sqlite":
+            # Written by a multi-worker receiver, one file per worker process
+            kwargs = {"path": db_path, "shards_dir": Path(db_path).parent / "shards"}
+        self.storage: Storage = open_storage(backend, **kwargs)
+        # Sent postbacks are written by one thread, in batches of up to
+        # flush_rows rows or flush_interval seconds
+        self.flush_rows = max(flush_rows, getattr(self.storage, "block_size", 0))
+        self.flush_interval = flush_interval
+        self._write_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._writer: threading.Thread | None = None
+        self.spool_dir = Path(db_path).parent / "spool" if spool else None
+        self._spool_files: dict[str, IO[str]] = {}
+        # Rows recorded by the send loop, handed to the writer buffer_rows at a time
+        self.buffer_rows = buffer_rows
+        self._buffer: list[tuple] = []
+        # Full buffers the write queue had no room for, at most max_pending_chunks
+        self.max_pending_chunks = max_pending_chunks
+        self._pending: deque[list[tuple]] = deque()
+
+    def record_sent(self, row: tuple):
+        """Records one sent postback (POSTBACK_COLUMNS order) without
+        awaiting anything, for the send loop"""
+        self._buffer.append(row)
+        if len(self._buffer) >= self.buffer_rows:
+            self._hand_off()
+
+    def _hand_off(self):
+        if self._buffer:
+            self._pending.append(self._buffer)
+            self._buffer = []
+        if not self._pending:
+            return
+        self._start_writer()
+        while self._pending:
+            try:
+                self._write_queue.put_nowait(self._pending[0])
+            except queue.Full:
+                # The writer is behind, retry on the next hand-off; past
+                # max_pending_chunks wait_for_room() holds the send loop
+                return
+            self._pending.popleft()
+
+    async def wait_for_room(self):
+        """Backpressure for the send loop, awaited before scheduling a request:
+        while more than max_pending_chunks chunks wait for the write queue,
+        queues them from an executor, the delay shows as send lag"""
+        if len(self._pending) <= self.max_pending_chunks:
+            return
+        loop = asyncio.get_event_loop()
+        while len(self._pending) > self.max_pending_chunks:
+            await loop.run_in_executor(None, self._write_queue.put, self._pending.popleft())
+
+    async def _drain_pending(self):
+        """Queues every buffered and pending row, waiting for queue space"""
+        if self._buffer:
+            self._pending.append(self._buffer)
+            self._buffer = []
+        if not self._pending:
+            return
+        self._start_writer()
+        loop = asyncio.get_event_loop()
+        while self._pending:
+            await loop.run_in_executor(None, self._write_queue.put, self._pending.popleft())
+
+    async def save_requests_batch(self, rows: list[tuple]):
+        """Queues sent postbacks, rows in POSTBACK_COLUMNS order"""
+        values = list(rows)
+        self._start_writer()
+        try:
+            self._write_queue.put_nowait(values)
+        except queue.Full:
+            # Backpressure: wait for the writer without blocking the event loop
+            await asyncio.get_event_loop().run_in_executor(None, self._write_queue.put, values)
+
+    def _start_writer(self):
+        if self._writer is None:
+            self._writer = threading.Thread(
+                target=self._writer_loop, name="sending-requests-writer", daemon=True
             )
+            self._writer.start()
 
-    async def save_requests_batch(self, requests: list[tuple]):
-        values = [
-            (
-                req["request_id"],
-                req["test_id"],
-                req["postback_type"],
-                req["event_name"],
-                req["source_id"],
-                req["campaign_id"],
-                req["placement_id"],
-                req["adset_id"],
-                req["ad_id"],
-                req["advertising_id"],
-                req["country"],
-                req["click_id"],
-                req["mmp"],
+    def _writer_loop(self):
+        pending: list[tuple] = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = (
+                self.flush_interval if deadline is None
+                else max(0.0, deadline - time.monotonic())
             )
-            for req in requests
-        ]
-        self.sending_requests_buffer.extend(values)
-        if len(self.sending_requests_buffer) >= self.buffer_size:
-            await self._flush_buffer()
-
-    async def _flush_buffer(self):
-        if not self.sending_requests_buffer:
-            return
-        values = self.sending_requests_buffer.copy()
-        self.sending_requests_buffer.clear()
-        await asyncio.get_event_loop().run_in_executor(None, self._sync_write, values)
-
-    def _sync_write(self, values: list[tuple]):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.executemany(
-                """
-                INSERT OR IGNORE INTO sending_requests
-                (request_id, test_id, postback_type, event_name, source_id,
-                 campaign_id, placement_id, adset_id, ad_id, advertising_id,
-                 country, click_id, mmp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                values,
+            flushed: threading.Event | None = None
+            try:
+                item = self._write_queue.get(timeout=timeout)
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    flushed = item
+                else:
+                    pending.extend(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+
+            if pending and (
+                stopping
+                or flushed is not None
+                or len(pending) >= self.flush_rows
+                or time.monotonic() >= deadline
+            ):
+                self._write_rows(pending)
+                pending = []
+                deadline = None
+            if flushed is not None:
+                for spool in self._spool_files.values():
+                    spool.flush()
+                flushed.set()
+        self._close_spool_files()
+
+    def _write_rows(self, values: list[tuple]):
+        try:
+            if self.spool_dir is not None:
+                self._spool_rows(values)
+            else:
+                self.storage.insert_sent(values)
+        except Exception as e:
+            logger.error(
+                {"event_log": "write_sending_requests", "rows": len(values), "error": str(e)}
             )
 
+    def _spool_rows(self, values: list[tuple]):
+        lines: dict[str, list[str]] = {}
+        for row in values:
+            lines.setdefault(row[1], []).append(json.dumps(row))
+        for test_id, test_lines in lines.items():
+            spool = self._spool_files.get(test_id)
+            if spool is None:
+                self.spool_dir.mkdir(parents=True, exist_ok=True)
+                # One file per process, appends from several processes never interleave
+                path = self.spool_dir / f"{test_id}-{os.getpid()}.jsonl"
+                spool = self._spool_files[test_id] = open(path, "a", buffering=1 << 20)
+            spool.write("\n".join(test_lines) + "\n")
+
+    def _close_spool_files(self):
+        for spool in self._spool_files.values():
+            spool.close()
+        self._spool_files.clear()
+
+    async def load_spool(self, test_id: str) -> int:
+        """Bulk-loads every process's spooled rows of the test into the
+        backend and removes the files; the writers must be closed first"""
+        if self.spool_dir is None:
+            return 0
+        return await self._run(self._load_spool, test_id)
+
+    def _load_spool(self, test_id: str) -> int:
+        loaded = 0
+        for path in sorted(self.spool_dir.glob(f"{test_id}-*.jsonl")):
+            with open(path, buffering=1 << 20) as spool:
+                rows: list[tuple] = []
+                for line in spool:
+                    rows.append(tuple(json.loads(line)))
+                    if len(rows) >= self.flush_rows:
+                        self.storage.insert_sent(rows)
+                        loaded += len(rows)
+                        rows = []
+                if rows:
+                    self.storage.insert_sent(rows)
+                    loaded += len(rows)
+            path.unlink()
+        logger.info({"event_log": "load_spool", "test_id": test_id, "rows": loaded})
+        return loaded
+
+    async def flush(self):
+        """Waits until every row queued so far is committed"""
+        await self._drain_pending()
+        if self._writer is None:
+            return
+        flushed = threading.Event()
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._write_queue.put, flushed)
+        await loop.run_in_executor(None, flushed.wait)
+
+    async def close(self):
+        """Flushes the remaining rows and stops the writer thread"""
+        loop = asyncio.get_event_loop()
+        await self._drain_pending()
+        if self._writer is None:
+            return
+        await loop.run_in_executor(None, self._write_queue.put, _STOP)
+        await loop.run_in_executor(None, self._writer.join)
+        self._writer = None
+
+    async def _run(self, method, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, method, *args)
+
     async def verify_requests(self, test_id: str) -> tuple[int, int]:
-        def _sync_verify():
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    "SELECT COUNT(*) FROM sending_requests WHERE test_id = ?", (test_id,)
-                )
-                sent_count = cursor.fetchone()[0]
-
-                # cursor = conn.execute(
-                #     "SELECT COUNT(*) FROM received_requests WHERE test_id = ?", (test_id,)
-                # )
-                # received_count = cursor.fetchone()[0]
-                received_count = conn.execute(
-                    """SELECT COUNT(*) FROM sending_requests s
-                    JOIN received_requests r ON s.request_id = r.request_id
-                    WHERE s.test_id = ?""",
-                    (test_id,)
-                ).fetchone()[0]
-
-                return received_count, sent_count - received_count
-
-        return await asyncio.get_event_loop().run_in_executor(None, _sync_verify)
-
-    async def verify_data_integrity(self, test_id: str) -> dict[str, Any]:
-        def _sync_verify():
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    "SELECT * FROM sending_requests WHERE test_id = ?", (test_id,)
-                )
-                sent_requests = {row[0]: row for row in cursor.fetchall()}
-
-                cursor = conn.execute(
-                    "SELECT * FROM received_requests WHERE test_id = ?", (test_id,)
-                )
-                received_requests = {row[0]: row for row in cursor.fetchall()}
-
-                missing = set(sent_requests.keys()) - set(received_requests.keys())
-                mismatches = {}
-
-                for req_id, sent_row in sent_requests.items():
-                    if req_id in received_requests:
-                        recv_row = received_requests[req_id]
-                        for i, field in enumerate(
-                            [
-                                "test_id",
-                                "postback_type",
-                                "event_name",
-                                "source_id",
-                                "campaign_id",
-                                "placement_id",
-                                "adset_id",
-                                "ad_id",
-                                "advertising_id",
-                                "country",
-                                "click_id",
-                                "mmp",
-                            ]
-                        ):
-                            if sent_row[i + 1] != recv_row[i + 1]:
-                                if field not in mismatches:
-                                    mismatches[field] = 0
-                                mismatches[field] += 1
-
-                return {
-                    "total_sent": len(sent_requests),
-                    "total_received": len(received_requests),
-                    "missing_count": len(missing),
-                    "field_mismatches": mismatches,
-                }
+        return await self._run(self.storage.verify_requests, test_id)
+
+    async def verify_data_integrity(self, test_id: str, sample_size: int = 0) -> dict[str, Any]:
+        """Compares sent and received rows inside the backend, memory does not
+        depend on the run size; sample_size > 0 adds up to that many missing
+        and mismatched request_ids."""
+        return await self._run(self.storage.verify_data_integrity, test_id, sample_size)
 
-        return await asyncio.get_event_loop().run_in_executor(None, _sync_verify)
+    async def verify_replayed(
+        self, test_id: str, expected: Iterable[Sequence[Sequence]], sample_size: int = 0
+    ) -> dict[str, Any]:
+        """verify_data_integrity with sent rows regenerated chunk by chunk
+        (``expected``) instead of read from storage"""
+        return await self._run(self.storage.verify_replayed, test_id, expected, sample_size)
 
     async def save_test_results(
-        self, test_id: str, duration: float, stats: TestStats, metrics: TestMetrics
+        self,
+        test_id: str,
+        duration: float,
+        stats: TestStats,
+        metrics: TestMetrics,
+        params: dict[str, Any] | None = None,
     ):
-        def _sync_save():
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    """
-                    INSERT OR IGNORE INTO metrics
-                    (test_id, test_datetime, duration, sending_count,
-                     verified_success, unverified_success, failed,
-                     verified_rate, avg_latency, min_latency, max_latency, p90, p95, p99, rps)
-                    VALUES (?, datetime('now'), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        test_id,
-                        duration,
-                        stats.sent_count,
-                        stats.verified_success,
-                        stats.unverified_success,
-                        stats.failed,
-                        metrics.verified_rate,
-                        metrics.avg_latency,
-                        metrics.min_latency,
-                        metrics.max_latency,
-                        metrics.p90,
-                        metrics.p95,
-                        metrics.p99,
-                        metrics.rps,
-                    ),
-                )
-
-        await asyncio.get_event_loop().run_in_executor(None, _sync_save)
+        """Stores the run's metrics (``params`` goes to the params column),
+        histograms and time series"""
+        await self._run(self._save_results, test_id, duration, stats, metrics, params)
+
+    def _save_results(
+        self,
+        test_id: str,
+        duration: float,
+        stats: TestStats,
+        metrics: TestMetrics,
+        params: dict[str, Any] | None,
+    ):
+        self.storage.save_metrics(
+            metrics_row(
+                {
+                    "test_id": test_id,
+                    "duration": duration,
+                    "sending_count": stats.sent_count,
+                    "verified_success": stats.verified_success,
+                    "unverified_success": stats.unverified_success,
+                    "failed": stats.failed,
+                    "verified_rate": metrics.verified_rate,
+                    "avg_latency": metrics.avg_latency,
+                    "min_latency": metrics.min_latency,
+                    "max_latency": metrics.max_latency,
+                    "p50": metrics.p50,
+                    "p90": metrics.p90,
+                    "p95": metrics.p95,
+                    "p99": metrics.p99,
+                    "p999": metrics.p999,
+                    "rps": metrics.rps,
+                    "avg_send_lag": metrics.avg_send_lag,
+                    "max_send_lag": metrics.max_send_lag,
+                    "p99_send_lag": metrics.p99_send_lag,
+                    "params": params,
+                }
+            )
+        )
+        self.storage.save_histograms(
+            test_id,
+            {"latency": stats.latencies.to_dict(), "send_lag": stats.send_lag.to_dict()},
+        )
+        self.storage.save_timeseries(
+            test_id,
+            [
+                {
+                    "interval_index": point.index,
+                    "offset": point.offset,
+                    "sent": point.sent,
+                    "ok": point.ok,
+                    "failed": point.failed,
+                    "rps": point.rps,
+                    "p50": point.p50,
+                    "p99": point.p99,
+                }
+                for point in stats.timeseries.points
+            ],
+        )
+        if stats.stages:
+            self.storage.save_stages(
+                test_id, [stage.to_row(index) for index, stage in enumerate(stats.stages)]
+            )
+
+    async def get_histogram(self, test_id: str, name: str = "latency") -> LatencyHistogram | None:
+        """Loads a stored histogram, e.g. to merge or compare percentiles across runs"""
+        data = await self._run(self.storage.get_histogram, test_id, name)
+        return LatencyHistogram.from_dict(data) if data else None
+
+    async def get_timeseries(self, test_id: str) -> list[dict[str, Any]]:
+        """Per-interval curve of a finished run, in interval order"""
+        return await self._run(self.storage.get_timeseries, test_id)
+
+    async def get_stages(self, test_id: str) -> list[dict[str, Any]]:
+        """Per-stage results of a load-profile run, in stage order"""
+        return await self._run(self.storage.get_stages, test_id)
 
     async def get_test_history(self, limit: int = 5) -> list[dict[str, Any]]:
-        def _sync_get():
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.execute(
-                    """
-                    SELECT
-                        test_id,
-                        strftime('%Y-%m-%d %H:%M:%S', test_datetime) as test_datetime,
-                        rps,
-                        avg_latency,
-                        verified_rate,
-                        sending_count,
-                        duration
-                    FROM metrics
-                    ORDER BY test_datetime DESC
-                    LIMIT ?
-                    """,
-                    (limit,),
-                )
-                return [dict(row) for row in cursor.fetchall()]
-
-        return await asyncio.get_event_loop().run_in_executor(None, _sync_get)
+        return await self._run(self.storage.get_history, limit)
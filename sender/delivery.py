@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+import zlib
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+from models import TestConfig
+from storage import DeliveryBitmap
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryTracker:
+    """Knows which postbacks are still in flight and waits until the receiver
+    has persisted every delivered one, instead of sleeping a fixed time."""
+
+    def __init__(self, config: TestConfig):
+        self.config = config
+        self.stats_url = config.stats_url or self._default_stats_url(config.target_url)
+        self.in_flight: set[str] = set()
+
+    @staticmethod
+    def _default_stats_url(target_url: str) -> str:
+        parts = urlsplit(target_url)
+        return urlunsplit((parts.scheme, parts.netloc, "/stats", "", ""))
+
+    async def fetch_bitmap(self, test_id: str) -> DeliveryBitmap:
+        """Postback numbers of the test the receiver has accepted, from its
+        /bitmap endpoint next to /stats"""
+        parts = urlsplit(self.stats_url)
+        url = urlunsplit((parts.scheme, parts.netloc, "/bitmap", "", ""))
+        async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=5.0)) as client:
+            response = await client.get(url, params={"test_id": test_id})
+            response.raise_for_status()
+        return DeliveryBitmap(zlib.decompress(response.content))
+
+    def on_dispatch(self, request_id: str):
+        self.in_flight.add(request_id)
+
+    def on_complete(self, request_id: str):
+        self.in_flight.discard(request_id)
+
+    async def wait_until_persisted(self, test_id: str, expected: int) -> int:
+        """Long-polls the receiver until `expected` rows of the test are committed
+        or delivery_grace_seconds pass; returns the last persisted count seen."""
+        deadline = time.perf_counter() + self.config.delivery_grace_seconds
+        persisted = 0
+        async with httpx.AsyncClient(timeout=httpx.Timeout(35.0, connect=5.0)) as client:
+            while True:
+                remaining = deadline - time.perf_counter()
+                try:
+                    response = await client.get(
+                        self.stats_url,
+                        params={
+                            "test_id": test_id,
+                            "wait_for": expected,
+                            "timeout": max(0.0, min(remaining, 5.0)),
+                        },
+                    )
+                    response.raise_for_status()
+                    persisted = response.json()["persisted"]
+                except Exception as e:
+                    logger.warning({"event_log": "delivery_stats_failed", "error": str(e)})
+                    await asyncio.sleep(min(0.5, max(0.0, remaining)))
+
+                if persisted >= expected:
+                    return persisted
+                if time.perf_counter() >= deadline:
+                    logger.warning(
+                        {
+                            "event_log": "delivery_grace_expired",
+                            "test_id": test_id,
+                            "expected": expected,
+                            "persisted": persisted,
+                        }
+                    )
+                    return persisted
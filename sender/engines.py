@@ -0,0 +1,423 @@
+import asyncio
+import logging
+import math
+import ssl
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
+from urllib.parse import urlsplit
+
+import httpx
+
+from models import TestConfig
+from requester import RequestSender
+
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:  # optional, only the aiohttp engine needs it
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("httpx", "aiohttp", "raw", "threads")
+PROTOCOLS = ("auto", "h1", "h1-pipelined", "h2")
+# Engines able to speak each protocol mode
+PROTOCOL_ENGINES = {
+    "auto": ENGINES,
+    "h1": ENGINES,
+    "h1-pipelined": ("raw",),
+    "h2": ("httpx", "threads"),
+}
+
+
+class Engine(ABC):
+    """Sends pre-encoded request targets (see PostbackChunk.encoded) to
+    config.target_url. Used as an async context manager around a run."""
+
+    def __init__(self, config: TestConfig):
+        self.config = config
+        # Responses per negotiated HTTP version
+        self.http_versions: Counter[str] = Counter()
+        url = urlsplit(config.target_url)
+        self.scheme = url.scheme
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.netloc = url.netloc
+        # Path and query start every pre-encoded request target is built on
+        self.target_prefix = (url.path or "/") + (f"?{url.query}&" if url.query else "?")
+
+    async def __aenter__(self) -> "Engine":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    @abstractmethod
+    async def send(self, target: bytes) -> tuple[bool, float]:
+        """Success (2xx) and latency in seconds of one request"""
+
+    def open_connections(self) -> int | None:
+        """Connections currently open to the target, None when the client
+        does not expose it"""
+        return None
+
+    def _log_failure(self, error: Exception, target: bytes):
+        logger.error(
+            {
+                "event_log": "send_request_failed",
+                "engine": type(self).__name__,
+                "error": repr(error),
+                "url": self.config.target_url,
+                "target": target.decode("ascii", "replace"),
+            }
+        )
+
+
+class HttpxEngine(Engine):
+    """httpx.AsyncClient, the default.
+
+    With protocol "h2" it opens max_in_flight / max_streams single-connection
+    clients and lets at most max_streams requests onto each: httpcore alone
+    would multiplex everything over one connection up to the server's
+    stream limit.
+    """
+
+    def __init__(self, config: TestConfig):
+        super().__init__(config)
+        self.sender = RequestSender(config)
+        self.sender.http_versions = self.http_versions
+        self._stack = AsyncExitStack()
+        self.clients: list[httpx.AsyncClient] = []
+        self._slots: asyncio.Queue[httpx.AsyncClient] | None = None
+
+    async def __aenter__(self) -> "HttpxEngine":
+        if self.config.protocol != "h2":
+            self.clients = [await self._stack.enter_async_context(self.sender.get_client())]
+            return self
+        count = max(1, math.ceil(self.config.max_in_flight / self.config.max_streams))
+        self.clients = [
+            await self._stack.enter_async_context(self.sender.get_client(max_connections=1))
+            for _ in range(count)
+        ]
+        # A client appears once per stream it may carry, as RawEngine does
+        # with pipeline slots
+        self._slots = asyncio.Queue()
+        for _ in range(self.config.max_streams):
+            for client in self.clients:
+                self._slots.put_nowait(client)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._stack.aclose()
+        self.clients = []
+        self._slots = None
+
+    async def send(self, target: bytes) -> tuple[bool, float]:
+        if self._slots is None:
+            return await self.sender.send_encoded(self.clients[0], target)
+        client = await self._slots.get()
+        try:
+            return await self.sender.send_encoded(client, target)
+        finally:
+            self._slots.put_nowait(client)
+
+    def open_connections(self) -> int | None:
+        sizes = [_httpx_pool_size(client) for client in self.clients]
+        return sum(size for size in sizes if size is not None) if self.clients else None
+
+
+class AiohttpEngine(Engine):
+    """aiohttp.ClientSession over up to config.max_connections keep-alive connections"""
+
+    def __init__(self, config: TestConfig):
+        if aiohttp is None:
+            raise RuntimeError("The aiohttp engine needs aiohttp installed")
+        super().__init__(config)
+        self.origin = f"{self.scheme}://{self.netloc}"
+        self.session = None
+
+    async def __aenter__(self) -> "AiohttpEngine":
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.config.max_connections or 0),
+            timeout=aiohttp.ClientTimeout(total=self.config.http_timeout),
+            # Targets are already encoded, no cookies to track between requests
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def send(self, target: bytes) -> tuple[bool, float]:
+        start = time.perf_counter()
+        try:
+            url = URL(self.origin + target.decode("ascii"), encoded=True)
+            async with self.session.get(url) as response:
+                await response.read()
+                self.http_versions[f"HTTP/{response.version.major}.{response.version.minor}"] += 1
+                return 200 <= response.status < 300, time.perf_counter() - start
+        except Exception as e:
+            self._log_failure(e, target)
+            return False, time.perf_counter() - start
+
+
+class ThreadPoolEngine(Engine):
+    """Blocking httpx.Client calls on config.max_connections threads, the way
+    send_test.py sends; the event loop only schedules and collects them"""
+
+    def __init__(self, config: TestConfig):
+        super().__init__(config)
+        self.base_url = httpx.URL(config.target_url)
+        self.workers = config.max_connections or 1
+        self.client: httpx.Client | None = None
+        self.pool: ThreadPoolExecutor | None = None
+
+    async def __aenter__(self) -> "ThreadPoolEngine":
+        self.client = httpx.Client(
+            timeout=httpx.Timeout(self.config.http_timeout),
+            http1=self.config.protocol != "h2",
+            http2=self.config.protocol == "h2",
+            limits=httpx.Limits(
+                max_connections=self.workers, max_keepalive_connections=self.workers
+            ),
+        )
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sender")
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.pool:
+            await asyncio.get_running_loop().run_in_executor(None, self.pool.shutdown)
+            self.pool = None
+        if self.client:
+            self.client.close()
+            self.client = None
+
+    def open_connections(self) -> int | None:
+        return _httpx_pool_size(self.client)
+
+    async def send(self, target: bytes) -> tuple[bool, float]:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self._send, target)
+
+    def _send(self, target: bytes) -> tuple[bool, float]:
+        start = time.perf_counter()
+        try:
+            response = self.client.get(self.base_url.copy_with(raw_path=target))
+            self.http_versions[response.http_version] += 1
+            return response.is_success, time.perf_counter() - start
+        except Exception as e:
+            self._log_failure(e, target)
+            return False, time.perf_counter() - start
+
+
+class _RawConnection(asyncio.Protocol):
+    """One keep-alive HTTP/1.1 connection. Responses are matched to requests
+    in order; only the status line and the Content-Length needed to find the
+    end of the body are parsed, bodies are skipped."""
+
+    def __init__(self, engine: "RawEngine"):
+        self.engine = engine
+        self.transport: asyncio.Transport | None = None
+        self.pending: deque[asyncio.Future] = deque()
+        self.buffer = bytearray()
+        self.status = 0
+        self.version = ""
+        # Body bytes of the current response still to skip, None while in headers
+        self.body_left: int | None = None
+        self.close_after = False
+        self._connecting = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.transport is not None and not self.transport.is_closing()
+
+    async def connect(self):
+        async with self._connecting:
+            if self.connected:
+                return
+            engine = self.engine
+            await asyncio.get_running_loop().create_connection(
+                lambda: self,
+                engine.host,
+                engine.port,
+                ssl=engine.ssl_context,
+                server_hostname=engine.host if engine.ssl_context else None,
+            )
+
+    def request(self, data: bytes) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.transport.write(data)
+        return future
+
+    def abort(self):
+        if self.transport is not None:
+            self.transport.abort()
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        self.buffer.clear()
+        self.body_left = None
+        self.close_after = False
+
+    def connection_lost(self, exc: Exception | None):
+        self.transport = None
+        error = ConnectionError(f"Connection lost: {exc!r}" if exc else "Connection closed")
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    def data_received(self, data: bytes):
+        self.buffer += data
+        try:
+            while self._parse_response():
+                pass
+        except ValueError as e:
+            # Out of sync with the server, fail everything sent on this connection
+            logger.error({"event_log": "raw_engine_protocol_error", "error": str(e)})
+            self.abort()
+
+    def _parse_response(self) -> bool:
+        """Consumes at most one response from the buffer, True when it did"""
+        if self.body_left is None:
+            end = self.buffer.find(b"\r\n\r\n")
+            if end < 0:
+                return False
+            head = bytes(self.buffer[:end]).lower()
+            del self.buffer[: end + 4]
+            if not head.startswith(b"http/1."):
+                raise ValueError(f"Unexpected status line {head[:40]!r}")
+            self.version = head[:8].upper().decode("ascii")
+            self.status = int(head[9:12])
+            self.body_left = self._content_length(head)
+            self.close_after = b"\r\nconnection: close" in head
+            if self.status < 200:
+                # 100 Continue and friends, the final response follows
+                self.body_left = None
+                return True
+        skip = min(self.body_left, len(self.buffer))
+        del self.buffer[:skip]
+        self.body_left -= skip
+        if self.body_left:
+            return False
+        self.body_left = None
+        if self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_result(self.status)
+                self.engine.http_versions[self.version] += 1
+        if self.close_after and self.transport is not None:
+            self.transport.close()
+        return True
+
+    def _content_length(self, head: bytes) -> int:
+        if self.status in (204, 304):
+            return 0
+        start = head.find(b"\r\ncontent-length:")
+        if start < 0:
+            if b"\r\ntransfer-encoding:" in head:
+                raise ValueError("Chunked responses are not supported by the raw engine")
+            return 0
+        start += len(b"\r\ncontent-length:")
+        end = head.find(b"\r\n", start)
+        return int(head[start : end if end >= 0 else len(head)])
+
+
+class RawEngine(Engine):
+    """Pre-built GET requests written straight to asyncio transports.
+
+    Keeps config.max_connections keep-alive connections, each taking up to
+    config.pipeline_depth requests before the first response comes back
+    (HTTP/1.1 pipelining, 1 disables it). A connection that fails or times
+    out is dropped with everything pipelined on it and reopened on next use.
+    """
+
+    def __init__(self, config: TestConfig):
+        super().__init__(config)
+        self.ssl_context = ssl.create_default_context() if self.scheme == "https" else None
+        self.request_start = b"GET "
+        self.request_end = f" HTTP/1.1\r\nHost: {self.netloc}\r\n\r\n".encode("ascii")
+        self.connections: list[_RawConnection] = []
+        self._slots: asyncio.Queue[_RawConnection] | None = None
+
+    async def __aenter__(self) -> "RawEngine":
+        self.connections = [_RawConnection(self) for _ in range(self.config.max_connections or 1)]
+        # A connection appears once per pipeline slot; taking a slot is
+        # what lets a request onto that connection
+        self._slots = asyncio.Queue()
+        for _ in range(max(1, self.config.pipeline_depth)):
+            for connection in self.connections:
+                self._slots.put_nowait(connection)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        for connection in self.connections:
+            if connection.transport is not None:
+                connection.transport.close()
+        self.connections = []
+
+    def open_connections(self) -> int | None:
+        return sum(connection.connected for connection in self.connections)
+
+    async def send(self, target: bytes) -> tuple[bool, float]:
+        start = time.perf_counter()
+        connection = await self._slots.get()
+        try:
+            if not connection.connected:
+                await connection.connect()
+            status = await asyncio.wait_for(
+                connection.request(self.request_start + target + self.request_end),
+                self.config.http_timeout,
+            )
+            return 200 <= status < 300, time.perf_counter() - start
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                # Later responses on this connection would be matched to the wrong requests
+                connection.abort()
+            self._log_failure(e, target)
+            return False, time.perf_counter() - start
+        finally:
+            self._slots.put_nowait(connection)
+
+
+def create_engine(config: TestConfig) -> Engine:
+    engines = {
+        "httpx": HttpxEngine,
+        "aiohttp": AiohttpEngine,
+        "raw": RawEngine,
+        "threads": ThreadPoolEngine,
+    }
+    check_engine_options(config.engine, config.protocol, config.pipeline_depth)
+    return engines[config.engine](config)
+
+
+def check_engine_options(engine: str, protocol: str, pipeline_depth: int):
+    """Raises ValueError for an engine, protocol and pipelining combination
+    that cannot work, so the CLI can reject it before the run starts"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    if protocol not in PROTOCOLS:
+        raise ValueError(f"Unknown protocol {protocol!r}, expected one of {PROTOCOLS}")
+    if engine not in PROTOCOL_ENGINES[protocol]:
+        raise ValueError(
+            f"The {engine} engine cannot send {protocol}, "
+            f"use one of {PROTOCOL_ENGINES[protocol]}"
+        )
+    pipelined = engine == "raw" and pipeline_depth > 1
+    if protocol == "h1-pipelined" and not pipelined:
+        raise ValueError("h1-pipelined needs a pipeline_depth (--pipeline) above 1")
+    if protocol == "h1" and pipelined:
+        raise ValueError("h1 is plain keep-alive, use h1-pipelined with pipeline_depth > 1")
+
+
+def _httpx_pool_size(client: httpx.Client | httpx.AsyncClient | None) -> int | None:
+    # httpx keeps its httpcore pool private, read it defensively
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    if pool is None:
+        return None
+    return sum(not connection.is_closed() for connection in pool.connections)
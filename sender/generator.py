@@ -0,0 +1,261 @@
+import random
+from array import array
+from itertools import groupby
+from typing import Iterable, Iterator, NamedTuple, Sequence
+from urllib.parse import quote_plus
+
+from storage import POSTBACK_COLUMNS
+
+try:
+    import numpy as np
+except ImportError:  # optional, only makes chunks faster to build
+    np = None
+
+ADSET_IDS = ("123456", "654321")
+AD_IDS = ("0123456", "0654321")
+
+
+class EncodedPostback(NamedTuple):
+    # Values in POSTBACK_COLUMNS order, as storage backends take them
+    row: tuple
+    # Request target (path and query) ready for the request line
+    target: bytes
+    # Number of the postback in the run
+    index: int = 0
+
+
+class PostbackChunk:
+    """Columns of ``len(self)`` consecutive postbacks, the first one being
+    postback number ``start`` of the run"""
+
+    def __init__(self, start: int, columns: dict[str, list], generator: "PostbackGenerator"):
+        self.start = start
+        self.columns = columns
+        self._generator = generator
+
+    def __len__(self) -> int:
+        return len(self.columns["request_id"])
+
+    def tail(self, offset: int) -> "PostbackChunk":
+        """The same chunk without its first ``offset`` postbacks"""
+        return PostbackChunk(
+            self.start + offset,
+            {name: values[offset:] for name, values in self.columns.items()},
+            self._generator,
+        )
+
+    def head(self, count: int) -> "PostbackChunk":
+        return PostbackChunk(
+            self.start,
+            {name: values[:count] for name, values in self.columns.items()},
+            self._generator,
+        )
+
+    def rows(self) -> list[tuple]:
+        """Tuples in POSTBACK_COLUMNS order, as storage backends take them"""
+        return list(zip(*(self.columns[name] for name in POSTBACK_COLUMNS)))
+
+    def dicts(self) -> Iterator[dict]:
+        for row in zip(*(self.columns[name] for name in POSTBACK_COLUMNS)):
+            yield dict(zip(POSTBACK_COLUMNS, row))
+
+    def query_strings(self, prefix: str = "") -> list[str]:
+        """Encoded query strings, each preceded by ``prefix`` (e.g. the path and
+        "?"). Constant fields are baked into the template, choice fields are
+        quoted once per distinct value and ids never need quoting."""
+        generator = self._generator
+        template = prefix.replace("{", "{{").replace("}", "}}") + generator.template
+        columns = []
+        for name in generator.template_columns:
+            values = self.columns[name]
+            quoted = generator.quoted.get(name)
+            columns.append([quoted[value] for value in values] if quoted else values)
+        return [template.format(*row) for row in zip(*columns)]
+
+    def encoded(self, prefix: str = "") -> list[EncodedPostback]:
+        """Rows paired with their request targets as bytes"""
+        return [
+            EncodedPostback(row, query.encode("ascii"), index)
+            for index, row, query in zip(
+                range(self.start, self.start + len(self)),
+                self.rows(),
+                self.query_strings(prefix),
+            )
+        ]
+
+
+class PostbackGenerator:
+    """Seeded, chunk-addressable bulk postback generator.
+
+    Postback ``n`` of a run depends only on the seed and on ``n``: chunk
+    ``i`` draws from its own PRNG seeded with ``(seed, i)``, so any range
+    can be rebuilt later or generated by another process. Every field is
+    produced as a column in one pass (random bytes are drawn in bulk and
+    turned into uuid4 strings or ids); NumPy speeds this up when it is
+    installed and gives the same output.
+
+    With ``compact_ids`` request_id is a 31-bit run prefix (from the seed)
+    in the high bits and the postback number in the low 32, other ids are
+    63-bit draws, all ints. With ``with_seq`` query strings also carry the
+    postback number as ``seq`` (bitmap verification); rows and dicts keep
+    POSTBACK_COLUMNS only.
+    """
+
+    def __init__(
+        self,
+        test_id: str,
+        seed: int,
+        postback_types: Sequence[str],
+        event_names: Sequence[str],
+        source_ids: Sequence[str],
+        mmp: Sequence[str],
+        compact_ids: bool = False,
+        with_seq: bool = False,
+        chunk_size: int = 10_000,
+        use_numpy: bool = True,
+    ):
+        self.test_id = test_id
+        self.seed = seed
+        self.choices = {
+            "postback_type": tuple(postback_types),
+            "event_name": tuple(event_names),
+            "source_id": tuple(source_ids),
+            "adset_id": ADSET_IDS,
+            "ad_id": AD_IDS,
+            "mmp": tuple(mmp),
+        }
+        self.constants = {"test_id": test_id, "advertising_id": test_id, "country": "ru"}
+        self.compact_ids = compact_ids
+        self.with_seq = with_seq
+        self.chunk_size = chunk_size
+        self.use_numpy = use_numpy and np is not None
+        self.id_prefix = random.Random(f"{seed}/prefix").getrandbits(31) << 32
+        # Choices are quoted once per distinct value, not once per postback,
+        # and only for fields where quoting changes anything
+        self.quoted = {}
+        for name, values in self.choices.items():
+            quoted = {value: quote_plus(str(value)) for value in values}
+            if any(value != text for value, text in quoted.items()):
+                self.quoted[name] = quoted
+        self.template = "&".join(
+            f"{name}={quote_plus(str(self.constants[name]))}" if name in self.constants
+            else f"{name}={{}}"
+            for name in POSTBACK_COLUMNS
+        )
+        self.template_columns = tuple(
+            name for name in POSTBACK_COLUMNS if name not in self.constants
+        )
+        if with_seq:
+            self.template += "&seq={}"
+            self.template_columns += ("seq",)
+
+    def chunk(self, index: int) -> PostbackChunk:
+        """Postbacks ``index * chunk_size`` to ``(index + 1) * chunk_size - 1``"""
+        rng = random.Random(f"{self.seed}/{index}")
+        count = self.chunk_size
+        start = index * self.chunk_size
+        columns: dict[str, list] = {}
+        for name in POSTBACK_COLUMNS:
+            if name in self.constants:
+                columns[name] = [self.constants[name]] * count
+            elif name in self.choices:
+                columns[name] = self._choices(rng, name, count)
+            elif self.compact_ids and name == "request_id":
+                columns[name] = list(range(self.id_prefix | start, self.id_prefix | start + count))
+            elif self.compact_ids:
+                columns[name] = self._int_ids(rng.randbytes(8 * count))
+            else:
+                columns[name] = self._uuid_strings(rng.randbytes(16 * count), count)
+        if self.with_seq:
+            columns["seq"] = range(start, start + count)
+        return PostbackChunk(start, columns, self)
+
+    def iter_chunks(self, count: int, start: int = 0) -> Iterator[PostbackChunk]:
+        """Chunks covering postbacks ``start`` to ``start + count - 1``"""
+        stop = start + count
+        index = start // self.chunk_size
+        while index * self.chunk_size < stop:
+            chunk = self.chunk(index)
+            if chunk.start < start:
+                chunk = chunk.tail(start - chunk.start)
+            if chunk.start + len(chunk) > stop:
+                chunk = chunk.head(stop - chunk.start)
+            yield chunk
+            index += 1
+
+    def iter_row_chunks(self, ranges: Iterable[tuple[int, int]]) -> Iterator[list[tuple]]:
+        """Rows of postbacks ``start`` to ``stop - 1`` of every range, a chunk
+        at a time: what a run sent, rebuilt without having stored it"""
+        for start, stop in ranges:
+            for chunk in self.iter_chunks(stop - start, start):
+                yield chunk.rows()
+
+    def rows_at(self, indices: Iterable[int]) -> list[tuple]:
+        """Rows of the given postback numbers, rebuilding only their chunks"""
+        rows = []
+        for index, numbers in groupby(sorted(indices), lambda n: n // self.chunk_size):
+            chunk_rows = self.chunk(index).rows()
+            rows.extend(chunk_rows[n - index * self.chunk_size] for n in numbers)
+        return rows
+
+    def iter_dicts(self, count: int, start: int = 0) -> Iterator[dict]:
+        for chunk in self.iter_chunks(count, start):
+            yield from chunk.dicts()
+
+    def iter_query_strings(self, count: int, start: int = 0, prefix: str = "") -> Iterator[str]:
+        for chunk in self.iter_chunks(count, start):
+            yield from chunk.query_strings(prefix)
+
+    def iter_encoded(
+        self, count: int, start: int = 0, prefix: str = ""
+    ) -> Iterator[EncodedPostback]:
+        for chunk in self.iter_chunks(count, start):
+            yield from chunk.encoded(prefix)
+
+    def _choices(self, rng: random.Random, name: str, count: int) -> list:
+        values = self.choices[name]
+        if len(values) == 1:
+            return [values[0]] * count
+        # One random byte per pick, two above 256 options; the modulo bias
+        # does not matter for load generation
+        width = 1 if len(values) <= 256 else 2
+        buf = rng.randbytes(width * count)
+        if self.use_numpy:
+            picks = np.frombuffer(buf, np.uint8 if width == 1 else np.uint16) % len(values)
+            return np.array(values, dtype=object)[picks].tolist()
+        picks = buf if width == 1 else array("H", buf)
+        return [values[pick % len(values)] for pick in picks]
+
+    def _int_ids(self, buf: bytes) -> list[int]:
+        if self.use_numpy:
+            return (np.frombuffer(buf, np.uint64) >> np.uint64(1)).tolist()
+        return [value >> 1 for value in array("Q", buf)]
+
+    def _uuid_strings(self, buf: bytes, count: int) -> list[str]:
+        """uuid4 strings from 16 random bytes each, same format as str(uuid.uuid4())"""
+        if self.use_numpy:
+            return self._uuid_strings_numpy(buf, count)
+        raw = bytearray(buf)
+        raw[6::16] = bytes(byte & 0x0F | 0x40 for byte in raw[6::16])
+        raw[8::16] = bytes(byte & 0x3F | 0x80 for byte in raw[8::16])
+        h = raw.hex()
+        return [
+            f"{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}"
+            for i in range(0, 32 * count, 32)
+        ]
+
+    @staticmethod
+    def _uuid_strings_numpy(buf: bytes, count: int) -> list[str]:
+        raw = np.frombuffer(buf, np.uint8).reshape(count, 16).copy()
+        raw[:, 6] = raw[:, 6] & 0x0F | 0x40
+        raw[:, 8] = raw[:, 8] & 0x3F | 0x80
+        digits = np.frombuffer(b"0123456789abcdef", np.uint8)
+        hexed = np.empty((count, 32), np.uint8)
+        hexed[:, 0::2] = digits[raw >> 4]
+        hexed[:, 1::2] = digits[raw & 0x0F]
+        text = np.full((count, 36), ord("-"), np.uint8)
+        # 8-4-4-4-12 groups, dashes stay at 8, 13, 18 and 23
+        for target, source, width in ((0, 0, 8), (9, 8, 4), (14, 12, 4), (19, 16, 4), (24, 20, 12)):
+            text[:, target:target + width] = hexed[:, source:source + width]
+        joined = text.tobytes().decode("ascii")
+        return [joined[i:i + 36] for i in range(0, 36 * count, 36)]
@@ -0,0 +1,105 @@
+import math
+from array import array
+from typing import Any
+
+
+class LatencyHistogram:
+    """Fixed-memory log-bucketed (HDR-style) histogram of durations in seconds.
+
+    Values are kept in microseconds. Below ``2 * 2**sub_bucket_bits`` µs every
+    value has its own bucket, above that each power of two is split into
+    ``2**sub_bucket_bits`` buckets, so the relative error of any percentile
+    stays under ``1 / 2**sub_bucket_bits`` (0.8% by default) while memory is
+    bounded by ``max_value`` rather than by the number of recorded values.
+    Min, max, count and sum are tracked exactly.
+    """
+
+    def __init__(self, sub_bucket_bits: int = 7, max_value: float = 3600.0):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.max_value_us = int(max_value * 1_000_000)
+        self.counts = array("Q", [0]) * (self._index(self.max_value_us) + 1)
+        self.total_count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, value_us: int) -> int:
+        if value_us < 2 * self.sub_bucket_count:
+            return value_us
+        shift = value_us.bit_length() - self.sub_bucket_bits - 1
+        return shift * self.sub_bucket_count + (value_us >> shift)
+
+    def _bucket_middle(self, index: int) -> float:
+        """Midpoint of a bucket in microseconds"""
+        if index < 2 * self.sub_bucket_count:
+            return float(index)
+        shift = index // self.sub_bucket_count - 1
+        lowest = (index - shift * self.sub_bucket_count) << shift
+        return lowest + ((1 << shift) - 1) / 2
+
+    def record(self, value: float):
+        value = max(0.0, value)
+        value_us = min(int(value * 1_000_000), self.max_value_us)
+        self.counts[self._index(value_us)] += 1
+        self.total_count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        if other.sub_bucket_bits != self.sub_bucket_bits or len(other.counts) != len(self.counts):
+            raise ValueError("Cannot merge histograms with different bucket layouts")
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total_count += other.total_count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def __len__(self) -> int:
+        return self.total_count
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.total_count if self.total_count else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """Value below which ``percent`` of recorded values fall, in seconds"""
+        if not self.total_count:
+            return 0.0
+        if percent >= 100:
+            return self.max
+        # Same rank as sorted(values)[int(n * q)] used before the histogram
+        rank = min(self.total_count, int(self.total_count * percent / 100) + 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                value = self._bucket_middle(index) / 1_000_000
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> dict[str, Any]:
+        """Sparse snapshot, suitable for JSON and for rebuilding with from_dict"""
+        return {
+            "sub_bucket_bits": self.sub_bucket_bits,
+            "max_value": self.max_value_us / 1_000_000,
+            "total_count": self.total_count,
+            "total": self.total,
+            "min": self.min if self.total_count else 0.0,
+            "max": self.max,
+            "counts": {str(index): count for index, count in enumerate(self.counts) if count},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls(data["sub_bucket_bits"], data["max_value"])
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+        histogram.total_count = data["total_count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"] if histogram.total_count else math.inf
+        histogram.max = data["max"]
+        return histogram
@@ -1,12 +1,15 @@
 import asyncio
-import multiprocessing
+import math
 from pathlib import Path
+import random
 import uuid
 from config import parse_args, TEST_CONFIG
 from database import DatabaseManager
-from requester import RequestSender
+from engines import ENGINES, create_engine
+from profiles import peak_rps, profile_requests, profile_seconds
+from rate_limiter import UNLIMITED_RPS
 from reporter import TestReporter
-from runner import TestRunner
+from runner import TestRunner, run_benchmark, run_saturation_search
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
@@ -18,31 +21,70 @@ async def main():
             "test_id": args.test_id or str(uuid.uuid4()),
             "request_count": args.requests or 1,
             "parallel_threads_count": args.threads or 1,
-            "max_requests_per_second": args.rps or 1_000_000,
+            "max_requests_per_second": (
+                args.rps if args.rps is not None else TEST_CONFIG.max_requests_per_second
+            )
+            or UNLIMITED_RPS,
             "max_duration_minutes": args.duration,
             "target_url": args.target,
+            "burst_size": args.burst,
+            "max_in_flight": args.in_flight,
+            "delivery_grace_seconds": args.grace,
+            "storage": args.storage,
+            "spool": args.spool,
+            "verification": args.verification,
+            "engine": args.engine,
+            "max_connections": args.connections,
+            "pipeline_depth": args.pipeline,
+            "protocol": args.protocol,
+            "max_streams": args.streams,
+            "compact_ids": args.compact_ids,
+            "seed": args.seed if args.seed is not None else random.getrandbits(63),
+            "slo_p99": args.slo_p99,
+            "slo_error_rate": args.slo_errors,
+            "probe_seconds": args.probe_seconds,
         }
     )
+    if args.profile:
+        # The profile decides how many requests go out and at what rate
+        config = config.model_copy(
+            update={
+                "load_profile": args.profile,
+                "request_count": profile_requests(args.profile),
+                "max_requests_per_second": peak_rps(args.profile),
+                "max_duration_minutes": max(
+                    args.duration, math.ceil(profile_seconds(args.profile) / 60)
+                ),
+            }
+        )
 
-    db_manager = DatabaseManager(BASE_DIR / f"postback_load_test/{config.db_name}")
-    request_sender = RequestSender(config)
+    db_manager = DatabaseManager(
+        BASE_DIR / f"postback_load_test/{config.db_name}",
+        backend=config.storage,
+        spool=config.spool,
+    )
     reporter = TestReporter(config)
+    if args.benchmark is not None:
+        await run_benchmark(
+            config,
+            db_manager,
+            reporter,
+            args.benchmark or list(ENGINES),
+            rate_limited=args.rps is not None,
+        )
+        return
+    if args.saturate is not None:
+        min_rps, max_rps = args.saturate
+        await run_saturation_search(config, db_manager, reporter, min_rps, max_rps)
+        return
+
+    engine = create_engine(config)
 
-    runner = TestRunner(config, db_manager, request_sender, reporter)
+    runner = TestRunner(config, db_manager, engine, reporter)
     await runner.run_test()
 
     print("Test_id",config.test_id)
 
 
-# async def run_test_instance():
-#     await main()
 if __name__ == "__main__":
     asyncio.run(main())
-    # processes = []
-    # for i in range(4):  # 4 параллельных процесса
-    #     p = multiprocessing.Process(target=asyncio.run, args=(run_test_instance(),))
-    #     p.start()
-    #     processes.append(p)
-
-    # for p in processes:
-    #     p.join()
@@ -1,7 +1,20 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any
 from pydantic import BaseModel
 
+from histogram import LatencyHistogram
+from timeseries import TimeSeries
+
+
+class LoadStage(BaseModel):
+    """Part of a load profile, the target rate goes linearly from start_rps
+    to end_rps over duration seconds"""
+
+    duration: float
+    start_rps: float
+    end_rps: float
+    name: str = ""
+
 
 class TestConfig(BaseModel):
     test_id:str | None = None
@@ -15,9 +28,63 @@ class TestConfig(BaseModel):
     source_ids: list[str]
     mmp: list[str]
     db_name: str
+    # Where postbacks and metrics are stored: "sqlite", "clickhouse"
+    # (CLICKHOUSE_DB_URL) or "memory" to benchmark the sender alone
+    storage: str = "sqlite"
+    # Sent postbacks go to spool/{test_id}-{pid}.jsonl during the run and are
+    # bulk-loaded into storage afterwards, instead of being written while sending
+    spool: bool = True
+    # HTTP client sending the postbacks: "httpx", "aiohttp", "raw" (asyncio
+    # transports, HTTP/1.1 only) or "threads" (blocking httpx on a thread
+    # pool), see engines.py
+    engine: str = "httpx"
+    # Requests written to one raw-engine connection before its first
+    # response arrives, 1 disables HTTP/1.1 pipelining
+    pipeline_depth: int = 1
+    # "auto" (HTTP/2 offered where the engine can, ALPN decides), "h1"
+    # (keep-alive), "h1-pipelined" (raw engine, pipeline_depth > 1) or "h2"
+    # (prior knowledge on http://, httpx and threads engines)
+    protocol: str = "auto"
+    # HTTP/2 streams per connection of the httpx engine, h2 opens
+    # max_in_flight / max_streams connections
+    max_streams: int = 100
     max_connections: int | None = 100
     http_timeout: float | None = 30.0
     http_retries: int | None = 3
+    # Length of one point of the live/persisted time series, seconds
+    metrics_interval: float = 1.0
+    live_report: bool = True
+    # Receiver endpoint reporting committed rows per test, derived from target_url if unset
+    stats_url: str | None = None
+    # How long to wait for the receiver to persist delivered postbacks
+    delivery_grace_seconds: float = 25.0
+    # Upper bound of requests awaiting a response, the scheduler keeps
+    # dispatching on time until it is reached
+    max_in_flight: int = 500
+    # Requests released together per scheduler tick
+    burst_size: int = 1
+    # 63-bit integer ids instead of uuid4 strings, stored in *_compact tables
+    compact_ids: bool = False
+    # Postbacks are a pure function of seed and their number in the run,
+    # a random seed is drawn when unset
+    seed: int | None = None
+    # Number of this process's first postback when the run is split across processes
+    first_postback: int = 0
+    # "rows" joins stored sent rows with received ones. The other modes store
+    # no sent rows: "replay" regenerates them from the seed and checks every
+    # field of the received ones, "bitmap" only diffs postback numbers (sent
+    # as seq) with the receiver's bitmap of received ones
+    verification: str = "rows"
+    # Stages replacing the flat max_requests_per_second, see profiles.py;
+    # request_count then follows from the profile
+    load_profile: list[LoadStage] = []
+    # SLO of the saturation search (--saturate): a probe passes while p99
+    # latency and the share of failed requests stay within these and the
+    # target keeps up with the offered rate
+    slo_p99: float = 0.5
+    slo_error_rate: float = 1.0
+    # Length of one saturation probe, seconds at the probed rate
+    probe_seconds: float = 10.0
 
 
 @dataclass
@@ -46,13 +113,139 @@ class PostbackParams:
     mmp: str
 
 
+@dataclass
+class StageStats:
+    """What one load-profile stage achieved, for spotting where latency knees"""
+
+    name: str
+    start_offset: float
+    duration: float
+    start_rps: float
+    end_rps: float
+    sent: int = 0
+    ok: int = 0
+    failed: int = 0
+    latencies: LatencyHistogram = field(default_factory=LatencyHistogram)
+    send_lag: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    @property
+    def rps(self) -> float:
+        return self.sent / self.duration if self.duration > 0 else 0.0
+
+    def to_row(self, index: int) -> dict[str, Any]:
+        """Values for STAGE_COLUMNS"""
+        return {
+            "stage_index": index,
+            "name": self.name,
+            "start_offset": self.start_offset,
+            "duration": self.duration,
+            "start_rps": self.start_rps,
+            "end_rps": self.end_rps,
+            "sent": self.sent,
+            "ok": self.ok,
+            "failed": self.failed,
+            "rps": self.rps,
+            "p50": self.latencies.percentile(50),
+            "p99": self.latencies.percentile(99),
+            "p99_send_lag": self.send_lag.percentile(99),
+        }
+
+    def merge(self, other: "StageStats"):
+        # Every process runs the same stages at its share of the rate
+        self.start_rps += other.start_rps
+        self.end_rps += other.end_rps
+        self.sent += other.sent
+        self.ok += other.ok
+        self.failed += other.failed
+        self.latencies.merge(other.latencies)
+        self.send_lag.merge(other.send_lag)
+
+
 @dataclass
 class TestStats:
     verified_success: int
     unverified_success: int
     failed: int
-    latencies: list[float]
+    latencies: LatencyHistogram
     sent_count: int
+    # Scheduled-vs-actual dispatch delay, non-zero lag means the sender fell behind --rps
+    send_lag: LatencyHistogram = field(default_factory=LatencyHistogram)
+    timeseries: TimeSeries = field(default_factory=TimeSeries)
+    # Requests still awaiting a response when the duration limit stopped the test
+    in_flight_at_stop: int = 0
+    # Responses per negotiated HTTP version ("HTTP/1.1", "HTTP/2")
+    http_versions: dict[str, int] = field(default_factory=dict)
+    # Requests in flight per open connection, sampled every metrics_interval
+    connection_samples: int = 0
+    requests_per_connection_total: float = 0.0
+    peak_requests_per_connection: float = 0.0
+    peak_connections: int = 0
+    # [start, stop) postback numbers dispatched, one range per sender process
+    sent_ranges: list[tuple[int, int]] = field(default_factory=list)
+    # Per load-profile stage, empty for flat runs
+    stages: list[StageStats] = field(default_factory=list)
+    # Wall-clock (time.time()) window of the load, from the scheduler start
+    # to the last response, without process startup or verification
+    load_start: float | None = None
+    load_end: float | None = None
+
+    def merge(self, other: "TestStats"):
+        """Adds stats collected by another sender process"""
+        self.verified_success += other.verified_success
+        self.unverified_success += other.unverified_success
+        self.failed += other.failed
+        self.latencies.merge(other.latencies)
+        self.sent_count += other.sent_count
+        self.send_lag.merge(other.send_lag)
+        self.timeseries.merge(other.timeseries)
+        self.in_flight_at_stop += other.in_flight_at_stop
+        for version, count in other.http_versions.items():
+            self.http_versions[version] = self.http_versions.get(version, 0) + count
+        self.connection_samples += other.connection_samples
+        self.requests_per_connection_total += other.requests_per_connection_total
+        self.peak_requests_per_connection = max(
+            self.peak_requests_per_connection, other.peak_requests_per_connection
+        )
+        # Processes run side by side, their peaks roughly coincide
+        self.peak_connections += other.peak_connections
+        self.sent_ranges.extend(other.sent_ranges)
+        if other.load_start is not None:
+            self.load_start = (
+                other.load_start
+                if self.load_start is None
+                else min(self.load_start, other.load_start)
+            )
+        if other.load_end is not None:
+            self.load_end = (
+                other.load_end if self.load_end is None else max(self.load_end, other.load_end)
+            )
+        if not self.stages:
+            self.stages = other.stages
+        else:
+            for stage, other_stage in zip(self.stages, other.stages):
+                stage.merge(other_stage)
+
+    def record_connections(self, connections: int, in_flight: int):
+        if connections <= 0:
+            return
+        per_connection = in_flight / connections
+        self.connection_samples += 1
+        self.requests_per_connection_total += per_connection
+        self.peak_requests_per_connection = max(self.peak_requests_per_connection, per_connection)
+        self.peak_connections = max(self.peak_connections, connections)
+
+    @property
+    def load_seconds(self) -> float:
+        """Length of the merged load window, 0 before any load ran"""
+        if self.load_start is None or self.load_end is None:
+            return 0.0
+        return self.load_end - self.load_start
+
+    @property
+    def avg_requests_per_connection(self) -> float:
+        if not self.connection_samples:
+            return 0.0
+        return self.requests_per_connection_total / self.connection_samples
 
 
 @dataclass
@@ -60,11 +253,16 @@ class TestMetrics:
     avg_latency: float
     min_latency: float
     max_latency: float
+    p50: float
     p90: float
     p95: float
     p99: float
+    p999: float
     verified_rate: float
     rps: float
+    avg_send_lag: float = 0.0
+    max_send_lag: float = 0.0
+    p99_send_lag: float = 0.0
 
 
 @dataclass
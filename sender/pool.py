@@ -0,0 +1,42 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def run_worker_pool(
+    items: Iterable[T],
+    workers: int,
+    handle: Callable[[T], Awaitable[bool]],
+    log_every: int = 0,
+) -> tuple[int, int]:
+    """Streams ``items`` through ``workers`` coroutines calling ``handle``,
+    a finished item is replaced by the next one right away. Only ``workers``
+    tasks exist at any time and items are pulled lazily, so memory and
+    scheduler overhead do not grow with the number of items.
+
+    Returns (success, errors), an exception raised by ``handle`` counts as
+    an error.
+    """
+    items = iter(items)
+    counts = {"success": 0, "errors": 0}
+
+    async def worker():
+        # The iterator is shared: next() never yields to the loop, so no
+        # item is taken twice
+        for item in items:
+            try:
+                ok = await handle(item)
+            except Exception as e:
+                logger.error(f"Task failed: {e}")
+                ok = False
+            counts["success" if ok else "errors"] += 1
+            done = counts["success"] + counts["errors"]
+            if log_every and done % log_every == 0:
+                logger.info(f"Sent {done} requests")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    return counts["success"], counts["errors"]
@@ -0,0 +1,113 @@
+import math
+
+from models import LoadStage
+
+PROFILES = ("ramp", "step", "spike", "soak")
+
+PROFILE_USAGE = {
+    "ramp": "ramp:FROM_RPS:TO_RPS:SECONDS",
+    "step": "step:START_RPS:STEP_RPS:EVERY_SECONDS:STEPS",
+    "spike": "spike:BASE_RPS:PEAK_RPS:BASE_SECONDS:SPIKE_SECONDS",
+    "soak": "soak:RPS:SECONDS",
+}
+
+
+def ramp(from_rps: float, to_rps: float, seconds: float) -> list[LoadStage]:
+    """Linear ramp, e.g. from 0 to the expected peak"""
+    return [LoadStage(duration=seconds, start_rps=from_rps, end_rps=to_rps, name="ramp")]
+
+
+def step(start_rps: float, step_rps: float, every: float, steps: int) -> list[LoadStage]:
+    """Ladder of flat stages, e.g. +500 RPS every 60 s"""
+    return [
+        LoadStage(
+            duration=every,
+            start_rps=start_rps + i * step_rps,
+            end_rps=start_rps + i * step_rps,
+            name=f"step {i + 1}",
+        )
+        for i in range(int(steps))
+    ]
+
+
+def spike(
+    base_rps: float, peak_rps: float, base_seconds: float, spike_seconds: float
+) -> list[LoadStage]:
+    """Base load, a sudden jump to the peak and the same base again to watch recovery"""
+    return [
+        LoadStage(duration=base_seconds, start_rps=base_rps, end_rps=base_rps, name="base"),
+        LoadStage(duration=spike_seconds, start_rps=peak_rps, end_rps=peak_rps, name="spike"),
+        LoadStage(duration=base_seconds, start_rps=base_rps, end_rps=base_rps, name="recovery"),
+    ]
+
+
+def soak(rps: float, seconds: float) -> list[LoadStage]:
+    """Long flat run for leaks and slow degradation"""
+    return [LoadStage(duration=seconds, start_rps=rps, end_rps=rps, name="soak")]
+
+
+_BUILDERS = {"ramp": ramp, "step": step, "spike": spike, "soak": soak}
+
+
+def parse_profile(spec: str) -> list[LoadStage]:
+    """Stages from a spec like "step:500:500:60:10" (see PROFILE_USAGE)"""
+    kind, _, args = spec.partition(":")
+    if kind not in _BUILDERS:
+        raise ValueError(f"Unknown load profile {kind!r}, expected one of {', '.join(PROFILES)}")
+    try:
+        values = [float(value) for value in args.split(":")] if args else []
+        stages = _BUILDERS[kind](*values)
+    except (TypeError, ValueError):
+        raise ValueError(f"Load profile {kind!r} expects {PROFILE_USAGE[kind]}") from None
+    if not stages or any(
+        stage.duration <= 0 or stage.start_rps < 0 or stage.end_rps < 0 for stage in stages
+    ):
+        raise ValueError(f"Load profile {spec!r} needs positive durations and rates")
+    return stages
+
+
+def profile_requests(stages: list[LoadStage]) -> int:
+    """Requests the profile sends, the area under its rate curve"""
+    return int(sum((stage.start_rps + stage.end_rps) / 2 * stage.duration for stage in stages))
+
+
+def profile_seconds(stages: list[LoadStage]) -> float:
+    return sum(stage.duration for stage in stages)
+
+
+def peak_rps(stages: list[LoadStage]) -> int:
+    return math.ceil(max((max(stage.start_rps, stage.end_rps) for stage in stages), default=0))
+
+
+def latency_knee(
+    stages: list[dict],
+    factor: float = 2.0,
+    min_increase: float = 0.01,
+    max_error_rate: float = 0.01,
+) -> int | None:
+    """First stage (stage rows, see StageStats.to_row) whose p99 exceeds
+    ``factor`` times the best p99 of the stages before it, and by at least
+    ``min_increase`` seconds so millisecond jitter does not count, or whose
+    error rate passes ``max_error_rate``: where the target stops keeping up"""
+    best_p99 = None
+    for index, stage in enumerate(stages):
+        if not stage["sent"]:
+            continue
+        if stage["failed"] / stage["sent"] > max_error_rate:
+            return index
+        if best_p99 is not None and stage["p99"] > max(
+            factor * best_p99, best_p99 + min_increase
+        ):
+            return index
+        best_p99 = stage["p99"] if best_p99 is None else min(best_p99, stage["p99"])
+    return None
+
+
+def scale_profile(stages: list[LoadStage], factor: float) -> list[LoadStage]:
+    """The same stages at ``factor`` times the rate, one sender process's share"""
+    return [
+        stage.model_copy(
+            update={"start_rps": stage.start_rps * factor, "end_rps": stage.end_rps * factor}
+        )
+        for stage in stages
+    ]
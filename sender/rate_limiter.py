@@ -1,19 +1,112 @@
 import asyncio
+import math
 import time
+from bisect import bisect_right
+from typing import Sequence
 
+# Rate standing for "no limit": slots are due faster than any sender can go,
+# so only max_in_flight throttles
+UNLIMITED_RPS = 1_000_000
 
-class PreciseRateLimiter:
-    """Provides precise rate limiting for async operations"""
 
-    def __init__(self, rps: int):
+class ArrivalScheduler:
+    """Open-loop constant-arrival-rate scheduler.
+
+    Request ``n`` is due at ``start + n / rps`` regardless of how long earlier
+    responses take, so a slow target shows up as send lag instead of silently
+    lowering the achieved rate (coordinated omission). Slots are released in
+    groups of ``burst`` requests and anything due within ``tick`` seconds is
+    dispatched without sleeping, which keeps the number of timer wakeups well
+    below the request rate.
+    """
+
+    def __init__(self, rps: int, burst: int = 1, tick: float = 0.001):
         self.interval = 1.0 / rps if rps else 0
-        self.last_request = time.perf_counter()
-        self.lock = asyncio.Lock()
-
-    async def wait(self):
-        async with self.lock:
-            elapsed = time.perf_counter() - self.last_request
-            wait_time = max(0, self.interval - elapsed)
-            if wait_time > 0:
-                await asyncio.sleep(wait_time)
-            self.last_request = time.perf_counter()
+        self.burst = max(1, burst)
+        self.tick = tick
+        self.start_time: float | None = None
+        self.issued = 0
+
+    def start(self, start_time: float | None = None):
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.issued = 0
+
+    def scheduled_time(self, slot: int) -> float:
+        return self.start_time + (slot // self.burst) * self.burst * self.interval
+
+    async def next_slot(self) -> float:
+        """Waits until the next arrival slot is due and returns its scheduled time"""
+        if self.start_time is None:
+            self.start()
+        # Slot is claimed before the first await, so concurrent callers never share one
+        scheduled = self.scheduled_time(self.issued)
+        self.issued += 1
+        delay = scheduled - time.perf_counter()
+        if delay > self.tick:
+            await asyncio.sleep(delay)
+        return scheduled
+
+
+class ProfileScheduler:
+    """Open-loop scheduler following a load profile.
+
+    Stages are ``(duration, start_rps, end_rps)`` with the rate changing
+    linearly inside each, so flat, ramp, step and spike profiles are all
+    sequences of them. Request ``n`` is due when the integral of the rate
+    reaches ``n``, solved exactly per stage; like ArrivalScheduler it never
+    waits for responses. ``next_slot`` returns None once the profile is over.
+    """
+
+    def __init__(
+        self, stages: Sequence[tuple[float, float, float]], burst: int = 1, tick: float = 0.001
+    ):
+        self.stages = [
+            (float(duration), float(start), float(end)) for duration, start, end in stages
+        ]
+        self.burst = max(1, burst)
+        self.tick = tick
+        # Stage boundaries in seconds and in requests
+        self.offsets = [0.0]
+        self.counts = [0.0]
+        for duration, start, end in self.stages:
+            self.offsets.append(self.offsets[-1] + duration)
+            self.counts.append(self.counts[-1] + (start + end) / 2 * duration)
+        self.total = int(self.counts[-1])
+        self.start_time: float | None = None
+        self.issued = 0
+
+    def start(self, start_time: float | None = None):
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.issued = 0
+
+    def offset(self, slot: int) -> float:
+        """Seconds from the start at which request ``slot`` is due"""
+        stage = min(bisect_right(self.counts, slot) - 1, len(self.stages) - 1)
+        duration, start, end = self.stages[stage]
+        # start * t + slope / 2 * t^2 = requests into the stage, in the form
+        # that stays exact for flat stages and for ramps starting at zero
+        requests = slot - self.counts[stage]
+        half_slope = (end - start) / (2 * duration)
+        root = start + math.sqrt(max(0.0, start * start + 4 * half_slope * requests))
+        elapsed = 2 * requests / root if root > 0 else 0.0
+        return self.offsets[stage] + min(elapsed, duration)
+
+    def scheduled_time(self, slot: int) -> float:
+        return self.start_time + self.offset((slot // self.burst) * self.burst)
+
+    def stage_at(self, scheduled: float) -> int:
+        """Index of the stage a scheduled time falls into"""
+        stage = bisect_right(self.offsets, scheduled - self.start_time) - 1
+        return max(0, min(stage, len(self.stages) - 1))
+
+    async def next_slot(self) -> float | None:
+        if self.start_time is None:
+            self.start()
+        if self.issued >= self.total:
+            return None
+        scheduled = self.scheduled_time(self.issued)
+        self.issued += 1
+        delay = scheduled - time.perf_counter()
+        if delay > self.tick:
+            await asyncio.sleep(delay)
+        return scheduled
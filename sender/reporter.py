@@ -1,8 +1,13 @@
 import logging
+from collections import deque
+from contextlib import contextmanager
 from rich.console import Console
+from rich.live import Live
 from rich.table import Table
 from rich import box
 
+from timeseries import IntervalPoint
+
 logging.basicConfig(
     level=logging.INFO,
     format='{"time": "%(asctime)s", "level": "%(levelname)s", "message": %(message)s}',
@@ -10,10 +15,70 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def format_http_versions(versions: dict[str, int] | None) -> str:
+    """Negotiated protocols with their share of responses, e.g. "HTTP/2 (100%)" """
+    if not versions:
+        return "-"
+    total = sum(versions.values())
+    return ", ".join(
+        f"{version} ({count / total * 100:.0f}%)"
+        for version, count in sorted(versions.items(), key=lambda item: -item[1])
+    )
+
+
 class TestReporter:
-    def __init__(self, config):
+    def __init__(self, config, live_rows: int = 15):
         self.console = Console()
         self.config = config
+        self._live: Live | None = None
+        self._live_points: deque[IntervalPoint] = deque(maxlen=live_rows)
+
+    @contextmanager
+    def live(self, enabled: bool = True):
+        """Renders the last time-series intervals in place while the test runs"""
+        if not enabled:
+            yield
+            return
+        self._live_points.clear()
+        with Live(
+            self._render_live(), console=self.console, refresh_per_second=4
+        ) as live:
+            self._live = live
+            try:
+                yield
+            finally:
+                self._live = None
+
+    def update_live(self, point: IntervalPoint):
+        if self._live is None:
+            return
+        self._live_points.append(point)
+        self._live.update(self._render_live())
+
+    def _render_live(self) -> Table:
+        table = Table(
+            title=f"Ход теста {(self.config.test_id or '')[:8]}...",
+            box=box.ROUNDED,
+            title_style="bold cyan",
+            header_style="bold magenta",
+        )
+        table.add_column("Секунда", style="cyan", justify="right")
+        table.add_column("RPS", style="green", justify="right")
+        table.add_column("Успешно", style="green", justify="right")
+        table.add_column("Ошибки", style="red", justify="right")
+        table.add_column("p50", style="yellow", justify="right")
+        table.add_column("p99", style="yellow", justify="right")
+
+        for point in self._live_points:
+            table.add_row(
+                f"{point.offset:.0f}",
+                f"{point.rps:.1f}",
+                str(point.ok),
+                str(point.failed),
+                f"{point.p50:.4f}",
+                f"{point.p99:.4f}",
+            )
+        return table
 
     def print_console_report(self, test_id: str, duration: float, metrics: dict, stats: dict):
         main_table = Table(
@@ -29,6 +94,7 @@ class TestReporter:
         main_table.add_row("Общие показатели", "")
         main_table.add_row("Длительность теста", f"{duration:.2f} сек")
         main_table.add_row("Скорость запросов", f"{metrics['rps']:.1f} RPS")
+        main_table.add_row("Целевая скорость", f"{self.config.max_requests_per_second} RPS")
         main_table.add_row("Всего запросов", str(self.config.request_count))
 
         main_table.add_row("═" * 20, "═" * 20)
@@ -55,6 +121,9 @@ class TestReporter:
         main_table.add_row(
             "Ошибки соединения (не доставлено)", f"{failed} ({(failed/total*100):.1f}%)"
         )
+        main_table.add_row(
+            "Без ответа при остановке", str(stats.get("in_flight_at_stop", 0))
+        )
         main_table.add_row(
             "Всего доставлено на сервер",
             f"{verified + unverified} ({(verified + unverified)/total*100:.1f}%)",
@@ -65,10 +134,30 @@ class TestReporter:
         main_table.add_row("Средняя", f"{metrics['avg_latency']:.4f}")
         main_table.add_row("Минимальная", f"{metrics['min_latency']:.4f}")
         main_table.add_row("Максимальная", f"{metrics['max_latency']:.4f}")
+        main_table.add_row("50-й перцентиль", f"{metrics['p50']:.4f}")
         main_table.add_row("90-й перцентиль", f"{metrics['p90']:.4f}")
         main_table.add_row("95-й перцентиль", f"{metrics['p95']:.4f}")
         main_table.add_row("99-й перцентиль", f"{metrics['p99']:.4f}")
+        main_table.add_row("99.9-й перцентиль", f"{metrics['p999']:.4f}")
+
+        main_table.add_row("═" * 20, "═" * 20)
+        main_table.add_row("Отставание от расписания (секунды)", "")
+        main_table.add_row("Среднее", f"{metrics['avg_send_lag']:.4f}")
+        main_table.add_row("99-й перцентиль", f"{metrics['p99_send_lag']:.4f}")
+        main_table.add_row("Максимальное", f"{metrics['max_send_lag']:.4f}")
 
+        main_table.add_row("═" * 20, "═" * 20)
+        main_table.add_row("Соединения", "")
+        main_table.add_row("Режим протокола", self.config.protocol)
+        main_table.add_row(
+            "Согласованный протокол", format_http_versions(stats.get("http_versions"))
+        )
+        main_table.add_row("Открытых соединений (пик)", str(stats.get("peak_connections", 0)))
+        main_table.add_row(
+            "Запросов на соединение (среднее / пик)",
+            f"{stats.get('avg_requests_per_connection', 0):.1f} / "
+            f"{stats.get('peak_requests_per_connection', 0):.1f}",
+        )
 
         self.console.print(main_table)
 
@@ -89,6 +178,27 @@ class TestReporter:
         config_table.add_row("mmp", str(self.config.mmp))
         config_table.add_row("max_duration_minutes", str(self.config.max_duration_minutes))
         config_table.add_row("max_requests_per_second", str(self.config.max_requests_per_second))
+        if self.config.load_profile:
+            config_table.add_row(
+                "load_profile",
+                ", ".join(
+                    f"{stage.name} {stage.start_rps:g}→{stage.end_rps:g}/{stage.duration:g}s"
+                    for stage in self.config.load_profile
+                ),
+            )
+        config_table.add_row("max_in_flight", str(self.config.max_in_flight))
+        config_table.add_row("burst_size", str(self.config.burst_size))
+        config_table.add_row("storage", self.config.storage)
+        config_table.add_row("spool", str(self.config.spool))
+        config_table.add_row("verification", self.config.verification)
+        config_table.add_row("engine", self.config.engine)
+        config_table.add_row("protocol", self.config.protocol)
+        if self.config.engine == "raw":
+            config_table.add_row("pipeline_depth", str(self.config.pipeline_depth))
+        if self.config.protocol == "h2":
+            config_table.add_row("max_streams", str(self.config.max_streams))
+        config_table.add_row("compact_ids", str(self.config.compact_ids))
+        config_table.add_row("seed", str(self.config.seed))
 
         self.console.print(config_table)
 
@@ -110,6 +220,7 @@ class TestReporter:
         table.add_column("Запросы", style="green", justify="right")
         table.add_column("RPS", style="green", justify="right")
         table.add_column("Задержка", style="yellow", justify="right")
+        table.add_column("p99", style="yellow", justify="right")
         table.add_column("Успешных", style="green", justify="right")
 
         for row in history:
@@ -131,7 +242,121 @@ class TestReporter:
                 str(row.get("sending_count", 0)),
                 f"{row.get('rps', 0):.1f}",
                 f"{row.get('avg_latency', 0):.3f}",
+                f"{row.get('p99') or 0:.3f}",
                 f"{row.get('verified_rate', 0):.1f}%",
             )
 
         self.console.print(table)
+
+    def print_stages(self, stages: list[dict], knee: int | None = None):
+        """Load-profile stages side by side; ``knee`` (see profiles.latency_knee)
+        is highlighted"""
+        table = Table(
+            title="Этапы нагрузки",
+            box=box.ROUNDED,
+            title_style="bold cyan",
+            header_style="bold magenta",
+        )
+        table.add_column("Этап", style="cyan", justify="left")
+        table.add_column("Начало, сек", style="blue", justify="right")
+        table.add_column("Целевой RPS", style="blue", justify="right")
+        table.add_column("RPS", style="green", justify="right")
+        table.add_column("Отправлено", style="green", justify="right")
+        table.add_column("Ошибки", style="red", justify="right")
+        table.add_column("p50", style="yellow", justify="right")
+        table.add_column("p99", style="yellow", justify="right")
+        table.add_column("p99 лаг", style="yellow", justify="right")
+
+        for index, row in enumerate(stages):
+            target = (
+                f"{row['start_rps']:.0f}"
+                if row["start_rps"] == row["end_rps"]
+                else f"{row['start_rps']:.0f} → {row['end_rps']:.0f}"
+            )
+            table.add_row(
+                row["name"],
+                f"{row['start_offset']:.0f}",
+                target,
+                f"{row['rps']:.1f}",
+                str(row["sent"]),
+                str(row["failed"]),
+                f"{row['p50']:.4f}",
+                f"{row['p99']:.4f}",
+                f"{row['p99_send_lag']:.4f}",
+                style="bold red" if index == knee else None,
+            )
+
+        self.console.print(table)
+        if knee is not None:
+            self.console.print(
+                f"[bold red]Задержка растёт с этапа «{stages[knee]['name']}»[/bold red]"
+            )
+
+    def print_saturation(self, probes: list[dict], max_rps: int | None):
+        table = Table(
+            title=(
+                f"Поиск предела (SLO: p99 ≤ {self.config.slo_p99:g} с, "
+                f"ошибок ≤ {self.config.slo_error_rate:g}%)"
+            ),
+            box=box.ROUNDED,
+            title_style="bold cyan",
+            header_style="bold magenta",
+        )
+        table.add_column("Целевой RPS", style="cyan", justify="right")
+        table.add_column("Достигнутый RPS", style="green", justify="right")
+        table.add_column("p50", style="yellow", justify="right")
+        table.add_column("p99", style="yellow", justify="right")
+        table.add_column("Ошибки", style="red", justify="right")
+        table.add_column("Успешных", style="green", justify="right")
+        table.add_column("SLO", justify="center")
+        table.add_column("Тест", style="blue", justify="left")
+
+        for row in probes:
+            table.add_row(
+                str(row["target_rps"]),
+                f"{row['achieved_rps']:.1f}",
+                f"{row['p50']:.4f}",
+                f"{row['p99']:.4f}",
+                f"{row['error_rate']:.2f}%",
+                f"{row['verified_rate']:.1f}%",
+                "[green]да[/green]" if row["passed"] else "[red]нет[/red]",
+                row["test_id"][:8],
+            )
+
+        self.console.print(table)
+        if max_rps is None:
+            self.console.print("[bold red]SLO нарушен уже на минимальной нагрузке[/bold red]")
+        else:
+            self.console.print(f"[bold green]Максимальный устойчивый RPS: {max_rps}[/bold green]")
+
+    def print_benchmark(self, results: list[dict]):
+        table = Table(
+            title=f"Сравнение движков ({self.config.request_count} запросов)",
+            box=box.ROUNDED,
+            title_style="bold cyan",
+            header_style="bold magenta",
+        )
+        table.add_column("Движок", style="cyan", justify="left")
+        table.add_column("Протокол", style="cyan", justify="left")
+        table.add_column("RPS", style="green", justify="right")
+        table.add_column("p50", style="yellow", justify="right")
+        table.add_column("p99", style="yellow", justify="right")
+        table.add_column("Ошибки", style="red", justify="right")
+        table.add_column("Успешных", style="green", justify="right")
+        table.add_column("CPU, сек", style="blue", justify="right")
+        table.add_column("CPU на запрос, мкс", style="blue", justify="right")
+
+        for row in sorted(results, key=lambda row: row["rps"], reverse=True):
+            table.add_row(
+                row["engine"],
+                format_http_versions(row["http_versions"]),
+                f"{row['rps']:.1f}",
+                f"{row['p50']:.4f}",
+                f"{row['p99']:.4f}",
+                str(row["failed"]),
+                f"{row['verified_rate']:.1f}%",
+                f"{row['cpu_seconds']:.2f}",
+                f"{row['cpu_per_request'] * 1_000_000:.0f}",
+            )
+
+        self.console.print(table)
@@ -1,4 +1,5 @@
 import logging
+from collections import Counter
 from sqlite3 import connect
 import httpx
 import time
@@ -6,7 +7,6 @@ from typing import Any
 from contextlib import asynccontextmanager
 
 from models import TestConfig
-from rate_limiter import PreciseRateLimiter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,26 +19,33 @@ class RequestSender:
     def __init__(self, config: TestConfig):
         self.config = config
         self.client = None
-        self.rate_limiter = PreciseRateLimiter(config.max_requests_per_second)
+        # Responses per negotiated HTTP version
+        self.http_versions: Counter[str] = Counter()
+        self.base_url = httpx.URL(config.target_url)
+        # Path and query start every pre-encoded request target is built on
+        self.target_prefix = self.base_url.raw_path.decode("ascii") + (
+            "&" if self.base_url.query else "?"
+        )
 
     @asynccontextmanager
-    async def get_client(self):
+    async def get_client(self, max_connections: int = 500):
         timeout = httpx.Timeout(10.0, connect=5.0)  # More reasonable timeouts
+        protocol = self.config.protocol
         limits = httpx.Limits(
-            max_connections=500,
-            max_keepalive_connections=250
+            max_connections=max_connections,
+            max_keepalive_connections=max(1, max_connections // 2)
         )
         async with httpx.AsyncClient(
             timeout=timeout,
             limits=limits,
-            http2=True,
+            http1=protocol != "h2",
+            http2=protocol in ("auto", "h2"),
         ) as client:
             yield client
 
     async def send_request(
         self, client: httpx.AsyncClient, params: dict[str, Any]
     ) -> tuple[bool, float]:
-        await self.rate_limiter.wait()
         start = time.perf_counter()
         try:
             response = await client.get(self.config.target_url, params=params)
@@ -55,6 +62,26 @@ class RequestSender:
             )
             return False, time.perf_counter() - start
 
+    async def send_encoded(self, client: httpx.AsyncClient, target: bytes) -> tuple[bool, float]:
+        """Sends a request target built with target_prefix as is, skipping
+        httpx's per-request params merging and percent-encoding"""
+        start = time.perf_counter()
+        try:
+            response = await client.get(self.base_url.copy_with(raw_path=target))
+            self.http_versions[response.http_version] += 1
+            response.raise_for_status()
+            return True, time.perf_counter() - start
+        except Exception as e:
+            logger.error(
+                {
+                    "event_log": "send_request_failed",
+                    "error": e,
+                    "url": self.config.target_url,
+                    "target": target.decode("ascii", "replace"),
+                }
+            )
+            return False, time.perf_counter() - start
+
     async def __aenter__(self):
         limits = httpx.Limits(
             max_connections=self.config.parallel_workers * 2,
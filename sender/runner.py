@@ -1,15 +1,26 @@
 import asyncio
+import math
+import multiprocessing
 import random
-import uuid
+import resource
 import time
+import uuid
 import logging
-from dataclasses import dataclass
-import httpx
-
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
 from database import DatabaseManager
-from models import TestConfig, TestMetrics, TestStats
+from delivery import DeliveryTracker
+from engines import Engine, create_engine
+from histogram import LatencyHistogram
+from generator import EncodedPostback, PostbackGenerator
+from models import StageStats, TestConfig, TestMetrics, TestStats
+from profiles import latency_knee, profile_requests, scale_profile
+from rate_limiter import UNLIMITED_RPS, ArrivalScheduler, ProfileScheduler
 from reporter import TestReporter
-from requester import RequestSender
+from storage import DeliveryBitmap
+from timeseries import TimeSeries
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,155 +28,334 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Missing postbacks whose request_ids bitmap verification logs and keeps
+MISSING_SAMPLE_SIZE = 10
+
 
 @dataclass
 class TestRunner:
     config: TestConfig
     db_manager: DatabaseManager
-    request_sender: RequestSender
+    engine: Engine
     reporter: TestReporter
     start_time: float = 0.0
+    delivery_tracker: DeliveryTracker = field(init=False)
+    generator: PostbackGenerator = field(init=False)
+
+    def __post_init__(self):
+        self.delivery_tracker = DeliveryTracker(self.config)
+        seed = self.config.seed if self.config.seed is not None else random.getrandbits(63)
+        self.generator = PostbackGenerator(
+            test_id=self.config.test_id,
+            seed=seed,
+            postback_types=self.config.postback_types,
+            event_names=self.config.event_names,
+            source_ids=self.config.source_ids,
+            mmp=self.config.mmp,
+            compact_ids=self.config.compact_ids,
+            with_seq=self.config.verification == "bitmap",
+        )
 
-    def _generate_postback(self, test_id: str) -> dict:
-        return {
-            "request_id": str(uuid.uuid4()),
-            "test_id": test_id,
-            "postback_type": random.choice(self.config.postback_types),
-            "event_name": random.choice(self.config.event_names),
-            "source_id": random.choice(self.config.source_ids),
-            "campaign_id": str(uuid.uuid4()),
-            "placement_id": str(uuid.uuid4()),
-            "adset_id": random.choice(["123456", "654321"]),
-            "ad_id": random.choice(["0123456", "0654321"]),
-            "advertising_id": test_id,
-            "country": "ru",
-            "click_id": str(uuid.uuid4()),
-            "mmp": random.choice(self.config.mmp),
-        }
+    def _iter_postbacks(self, count: int) -> Iterator[EncodedPostback]:
+        """Lazily yields this process's postbacks chunk by chunk with their
+        request targets pre-encoded, memory stays flat regardless of request_count"""
+        return self.generator.iter_encoded(
+            count, start=self.config.first_postback, prefix=self.engine.target_prefix
+        )
 
     async def run_test(self):
         test_id = self.config.test_id
         self.start_time = time.perf_counter()
-        stats = TestStats(
-            verified_success=0, unverified_success=0, failed=0, latencies=[], sent_count=0
-        )
-        all_requests = [self._generate_postback(test_id) for _ in range(self.config.request_count)]
+        stats = _empty_stats()
 
         try:
-            async with self.request_sender.get_client() as client:
-                try:
-                    await asyncio.wait_for(
-                        self._execute_test(client, all_requests, stats),
-                        timeout=self.config.max_duration_minutes * 60,
-                    )
-                except asyncio.TimeoutError:
-                    logger.info("Test stopped due to duration limit")
+            stats = await self.collect_stats(stats)
 
-            duration = time.perf_counter() - self.start_time
+            # Same load window as run_round, so single runs, benchmark and
+            # saturation rounds report comparable rates
+            duration = stats.load_seconds or time.perf_counter() - self.start_time
 
             metrics = self._calculate_metrics(stats, duration)
-            await self._save_and_report_results(test_id, stats, metrics)
+            # Commit the tail of sent rows before verification reads them
+            await self.db_manager.close()
+            await self.db_manager.load_spool(test_id)
+            await self._save_and_report_results(test_id, duration, stats, metrics)
 
         except asyncio.CancelledError:
             await self._handle_interruption(test_id, stats)
 
-    async def _execute_test(self, client: httpx.AsyncClient, all_requests: list, stats: TestStats):
-        queue = asyncio.Queue(maxsize=self.config.max_requests_per_second or 5000)
-        semaphore = asyncio.Semaphore(self.config.max_requests_per_second or 500)
+    async def collect_stats(self, stats: TestStats) -> TestStats:
+        """Runs the load in this process, filling ``stats``, or across sender
+        processes, returning their merged stats"""
+        if self._process_count() > 1:
+            return await self._run_processes()
+        await self.run_load(stats)
+        return stats
+
+    async def run_round(self, params: dict[str, Any]) -> dict[str, Any]:
+        """Runs the test without the console report, stores it with ``params``
+        added to its params and returns what benchmark and saturation tables
+        compare; CPU time covers the load only"""
+        test_id = self.config.test_id
+        self.start_time = time.perf_counter()
+        cpu_start = _cpu_seconds()
+        stats = await self.collect_stats(_empty_stats())
+        cpu_seconds = _cpu_seconds() - cpu_start
+        # Rates come from the load window the senders report, the parent's
+        # timer would also count spawning and importing sender processes
+        duration = stats.load_seconds or time.perf_counter() - self.start_time
+
+        metrics = self._calculate_metrics(stats, duration)
+        await self.db_manager.close()
+        await self.db_manager.load_spool(test_id)
+        verification = await self._verify(test_id, stats)
+        metrics.verified_rate = (
+            stats.verified_success / stats.sent_count * 100 if stats.sent_count else 0
+        )
+        await self.db_manager.save_test_results(
+            test_id,
+            duration,
+            stats,
+            metrics,
+            params={
+                **self._run_params(stats),
+                **verification,
+                **params,
+                "cpu_seconds": cpu_seconds,
+            },
+        )
+        return {
+            "engine": self.config.engine,
+            "protocol": self.config.protocol,
+            "http_versions": stats.http_versions,
+            "test_id": test_id,
+            "sent_count": stats.sent_count,
+            "failed": stats.failed,
+            "duration": duration,
+            "rps": metrics.rps,
+            "p50": metrics.p50,
+            "p99": metrics.p99,
+            "verified_rate": metrics.verified_rate,
+            "cpu_seconds": cpu_seconds,
+            "cpu_per_request": cpu_seconds / stats.sent_count if stats.sent_count else 0,
+        }
+
+    async def run_load(self, stats: TestStats):
+        """Sends config.request_count postbacks from this process, filling stats"""
+        postbacks = self._iter_postbacks(self.config.request_count)
+        sent_before = stats.sent_count
+        stats.timeseries = TimeSeries(self.config.metrics_interval)
+        offset = 0.0
+        stats.stages = []
+        for stage in self.config.load_profile:
+            stats.stages.append(
+                StageStats(stage.name, offset, stage.duration, stage.start_rps, stage.end_rps)
+            )
+            offset += stage.duration
+        with self.reporter.live(enabled=self.config.live_report):
+            monitor = asyncio.create_task(self._monitor(stats))
+            try:
+                async with self.engine:
+                    try:
+                        await asyncio.wait_for(
+                            self._execute_test(postbacks, stats),
+                            timeout=self.config.max_duration_minutes * 60,
+                        )
+                    except asyncio.TimeoutError:
+                        logger.info("Test stopped due to duration limit")
+            finally:
+                # Requests cut off by the duration limit may or may not have arrived
+                stats.in_flight_at_stop += len(self.delivery_tracker.in_flight)
+                first = self.config.first_postback
+                stats.sent_ranges.append((first, first + stats.sent_count - sent_before))
+                monitor.cancel()
+                await asyncio.gather(monitor, return_exceptions=True)
+                if stats.timeseries.has_pending:
+                    self.reporter.update_live(stats.timeseries.close_interval())
+                for version, count in self.engine.http_versions.items():
+                    stats.http_versions[version] = stats.http_versions.get(version, 0) + count
+
+    async def _monitor(self, stats: TestStats):
+        """Closes a time-series interval every metrics_interval and shows it
+        live, sampling how many requests share each open connection"""
+        timeseries = stats.timeseries
+        next_tick = time.perf_counter()
+        while True:
+            next_tick += timeseries.interval
+            await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+            self.reporter.update_live(timeseries.close_interval())
+            connections = self.engine.open_connections()
+            if connections:
+                stats.record_connections(connections, len(self.delivery_tracker.in_flight))
+
+    def _process_count(self) -> int:
+        # Never start a process that would get zero requests or a zero RPS share
+        limits = [self.config.parallel_threads_count, self.config.request_count]
+        if self.config.max_requests_per_second:
+            limits.append(self.config.max_requests_per_second)
+        return max(1, min(limits))
+
+    def _shard_configs(self) -> list[TestConfig]:
+        """Splits request_count, the RPS budget and in-flight limit across processes;
+        every process generates its own consecutive range of the run's postbacks"""
+        count = self._process_count()
+
+        def share(total: int, index: int) -> int:
+            return total // count + (1 if index < total % count else 0)
+
+        configs = []
+        first_postback = self.config.first_postback
+        # Every process runs the whole profile at 1/count of its rates
+        load_profile = scale_profile(self.config.load_profile, 1 / count)
+        for i in range(count):
+            request_count = share(self.config.request_count, i)
+            if load_profile:
+                request_count = profile_requests(load_profile)
+            configs.append(
+                self.config.model_copy(
+                    update={
+                        "request_count": request_count,
+                        "load_profile": load_profile,
+                        "max_requests_per_second": share(self.config.max_requests_per_second, i),
+                        "max_in_flight": max(1, share(self.config.max_in_flight, i)),
+                        "parallel_threads_count": 1,
+                        "seed": self.generator.seed,
+                        "first_postback": first_postback,
+                        # Worker output would interleave, the merged series is reported at the end
+                        "live_report": False,
+                    }
+                )
+            )
+            first_postback += request_count
+        return configs
+
+    async def _run_processes(self) -> TestStats:
+        shard_configs = self._shard_configs()
+        logger.info(
+            {
+                "event_log": "run_processes",
+                "test_id": self.config.test_id,
+                "processes": len(shard_configs),
+            }
+        )
+        loop = asyncio.get_running_loop()
+        # spawn gives every worker a clean interpreter and its own event loop
+        with ProcessPoolExecutor(
+            max_workers=len(shard_configs), mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            shard_stats = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        pool,
+                        run_worker_process,
+                        shard.model_dump(),
+                        str(self.db_manager.db_path),
+                    )
+                    for shard in shard_configs
+                )
+            )
+
+        stats = shard_stats[0]
+        for other in shard_stats[1:]:
+            stats.merge(other)
+        return stats
+
+    def _scheduler(self) -> ArrivalScheduler | ProfileScheduler:
+        if self.config.load_profile:
+            return ProfileScheduler(
+                [
+                    (stage.duration, stage.start_rps, stage.end_rps)
+                    for stage in self.config.load_profile
+                ],
+                burst=self.config.burst_size,
+            )
+        return ArrivalScheduler(self.config.max_requests_per_second, burst=self.config.burst_size)
+
+    async def _execute_test(self, postbacks: Iterator[EncodedPostback], stats: TestStats):
+        scheduler = self._scheduler()
+        in_flight = asyncio.Semaphore(self.config.max_in_flight)
+        tasks: set[asyncio.Task] = set()
         test_end_time = self.start_time + self.config.max_duration_minutes * 60
-        worker_count=100
 
-        workers = [
-            asyncio.create_task(self._worker(client, queue, stats, semaphore))
-            for _ in range(worker_count)
-        ]
+        def _on_done(task: asyncio.Task):
+            tasks.discard(task)
+            in_flight.release()
 
         try:
-            for postback in all_requests:
+            scheduler.start()
+            stats.load_start = time.time()
+            for postback in postbacks:
                 if time.perf_counter() > test_end_time:
                     logger.info("Duration limit reached, stopping test")
                     break
 
-                await semaphore.acquire()
-                await queue.put(postback)
+                await self.db_manager.wait_for_room()
+                scheduled = await scheduler.next_slot()
+                if scheduled is None:
+                    # End of the load profile
+                    break
+                stage = stats.stages[scheduler.stage_at(scheduled)] if stats.stages else None
+                if stage is not None:
+                    stage.sent += 1
+                await in_flight.acquire()
+                task = asyncio.create_task(self._dispatch(postback, scheduled, stats, stage))
+                tasks.add(task)
+                task.add_done_callback(_on_done)
                 stats.sent_count += 1
+                stats.timeseries.on_sent()
 
-            await queue.join()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
         except asyncio.CancelledError:
             logger.info("Test execution cancelled, cleaning up...")
         finally:
-            for worker in workers:
-                if not worker.done():
-                    worker.cancel()
-
-            await asyncio.gather(*workers, return_exceptions=True)
+            for task in list(tasks):
+                if not task.done():
+                    task.cancel()
 
-            while not queue.empty():
-                try:
-                    queue.get_nowait()
-                    queue.task_done()
-                except asyncio.QueueEmpty:
-                    break
+            await asyncio.gather(*tasks, return_exceptions=True)
+            stats.load_end = time.time()
 
-    async def _worker(
+    async def _dispatch(
         self,
-        client: httpx.AsyncClient,
-        queue: asyncio.Queue,
+        postback: EncodedPostback,
+        scheduled: float,
         stats: TestStats,
-        semaphore: asyncio.Semaphore,
+        stage: StageStats | None = None,
     ):
-        last_request_time = 0
-        min_interval = 1.0 / (self.config.max_requests_per_second or 100)
-        test_end_time = self.start_time + self.config.max_duration_minutes * 60
-        current_task = None
-
-        while time.perf_counter() < test_end_time:
-            try:
-                current_time = time.perf_counter()
-                elapsed = current_time - last_request_time
-                if elapsed < min_interval:
-                    await asyncio.sleep(min_interval - elapsed)
-
-                try:
-                    current_task = asyncio.create_task(queue.get())
-                    params = await asyncio.wait_for(current_task, timeout=0.5)
-                    current_task = None
-
-                    last_request_time = time.perf_counter()
-                    await self._process_request(client=client, params=params, stats=stats)
-
-                except asyncio.TimeoutError:
-                    if time.perf_counter() >= test_end_time:
-                        break
-                    continue
-                except Exception as e:
-                    logger.error({"event_log": "_process_request", "error": str(e)})
-                    stats.failed += 1
-                finally:
-                    if current_task is None:
-                        queue.task_done()
-                    semaphore.release()
-
-            except asyncio.CancelledError:
-                if current_task and not current_task.done():
-                    current_task.cancel()
-                break
-            except Exception as e:
-                logger.error({"event_log": "_worker", "message": "Worker error", "error": str(e)})
-                stats.failed += 1
-                if current_task and not current_task.done():
-                    current_task.cancel()
-
-    async def _process_request(self, client: httpx.AsyncClient, params: dict, stats: TestStats):
+        lag = time.perf_counter() - scheduled
+        stats.send_lag.record(lag)
+        if stage is not None:
+            stage.send_lag.record(lag)
+        self.delivery_tracker.on_dispatch(postback.row[0])
+        await self._process_request(postback=postback, stats=stats, stage=stage)
+
+    async def _process_request(
+        self, postback: EncodedPostback, stats: TestStats, stage: StageStats | None = None
+    ):
+        request_id = postback.row[0]
         try:
-            await self.db_manager.save_requests_batch([params])
-            success, latency = await self.request_sender.send_request(client, params)
-            stats.latencies.append(latency)
+            if self.config.verification == "rows":
+                self.db_manager.record_sent(postback.row)
+            success, latency = await self.engine.send(postback.target)
+            self.delivery_tracker.on_complete(request_id)
+            stats.latencies.record(latency)
+            stats.timeseries.on_response(success, latency)
             if not success:
                 stats.failed += 1
+            if stage is not None:
+                stage.latencies.record(latency)
+                if success:
+                    stage.ok += 1
+                else:
+                    stage.failed += 1
         except Exception as e:
             logger.error({"event_log": "_process_request", "error": str(e)})
+            self.delivery_tracker.on_complete(request_id)
             stats.failed += 1
+            stats.timeseries.on_response(False)
+            if stage is not None:
+                stage.failed += 1
 
     def _calculate_metrics(self, stats: TestStats, duration: float) -> TestMetrics:
         latencies = stats.latencies
@@ -174,50 +364,52 @@ class TestRunner:
                 avg_latency=0,
                 min_latency=0,
                 max_latency=0,
+                p50=0,
                 p90=0,
                 p95=0,
                 p99=0,
+                p999=0,
                 verified_rate=0,
                 rps=0,
+                avg_send_lag=0,
+                max_send_lag=stats.send_lag.max,
+                p99_send_lag=stats.send_lag.percentile(99),
             )
 
-        latencies_sorted = sorted(latencies)
-        n = len(latencies_sorted)
         verified_rate = (
             (stats.verified_success / stats.sent_count * 100) if stats.sent_count > 0 else 0
         )
 
         return TestMetrics(
-            avg_latency=sum(latencies) / n,
-            min_latency=min(latencies),
-            max_latency=max(latencies),
-            p90=latencies_sorted[int(n * 0.9)],
-            p95=latencies_sorted[int(n * 0.95)],
-            p99=latencies_sorted[int(n * 0.99)],
+            avg_latency=latencies.mean,
+            min_latency=latencies.min,
+            max_latency=latencies.max,
+            p50=latencies.percentile(50),
+            p90=latencies.percentile(90),
+            p95=latencies.percentile(95),
+            p99=latencies.percentile(99),
+            p999=latencies.percentile(99.9),
             verified_rate=verified_rate,
             rps=stats.sent_count / duration if duration > 0 else 0,
+            avg_send_lag=stats.send_lag.mean,
+            max_send_lag=stats.send_lag.max,
+            p99_send_lag=stats.send_lag.percentile(99),
         )
 
-    async def _save_and_report_results(self, test_id: str, stats: TestStats, metrics: TestMetrics):
-        duration = time.perf_counter() - self.start_time
-
-        await asyncio.sleep(5)
-        max_retries = 20
-        retry_delay = 1
-
-        for attempt in range(max_retries):
-            verified, unverified = await self.db_manager.verify_requests(test_id)
-            if verified + unverified == stats.sent_count or attempt == max_retries - 1:
-                break
-            await asyncio.sleep(retry_delay)
-
-        stats.verified_success = verified
-        stats.unverified_success = unverified
+    async def _save_and_report_results(
+        self, test_id: str, duration: float, stats: TestStats, metrics: TestMetrics
+    ):
+        """``duration`` is taken when the load ends, draining the writer and
+        loading the spool stay out of the stored duration and rps"""
+        verification = await self._verify(test_id, stats)
 
-        metrics.verified_rate = (verified / stats.sent_count * 100) if stats.sent_count > 0 else 0
-        metrics.rps = stats.sent_count / duration if duration > 0 else 0
+        metrics.verified_rate = (
+            (stats.verified_success / stats.sent_count * 100) if stats.sent_count > 0 else 0
+        )
 
-        await self.db_manager.save_test_results(test_id, duration, stats, metrics)
+        await self.db_manager.save_test_results(
+            test_id, duration, stats, metrics, params={**self._run_params(stats), **verification}
+        )
         history = await self.db_manager.get_test_history()
 
         self.reporter.print_console_report(
@@ -227,26 +419,135 @@ class TestRunner:
                 "avg_latency": metrics.avg_latency,
                 "min_latency": metrics.min_latency,
                 "max_latency": metrics.max_latency,
+                "p50": metrics.p50,
                 "p90": metrics.p90,
                 "p95": metrics.p95,
                 "p99": metrics.p99,
+                "p999": metrics.p999,
                 "verified_rate": metrics.verified_rate,
                 "rps": metrics.rps,
+                "avg_send_lag": metrics.avg_send_lag,
+                "max_send_lag": metrics.max_send_lag,
+                "p99_send_lag": metrics.p99_send_lag,
             },
             {
                 "verified_success": stats.verified_success,
                 "unverified_success": stats.unverified_success,
                 "failed": stats.failed,
                 "sent_count": stats.sent_count,
+                "in_flight_at_stop": stats.in_flight_at_stop,
+                "http_versions": stats.http_versions,
+                "avg_requests_per_connection": stats.avg_requests_per_connection,
+                "peak_requests_per_connection": stats.peak_requests_per_connection,
+                "peak_connections": stats.peak_connections,
             },
         )
+        if stats.stages:
+            stages = [stage.to_row(index) for index, stage in enumerate(stats.stages)]
+            self.reporter.print_stages(stages, latency_knee(stages))
         self.reporter.print_history_comparison(history)
 
+    async def _verify(self, test_id: str, stats: TestStats) -> dict[str, Any]:
+        """Fills verified_success and unverified_success, returns verification
+        details kept in the run's params"""
+        if self.config.verification == "bitmap":
+            return await self._verify_bitmap(test_id, stats)
+        # Finishes as soon as the receiver has committed every postback it answered
+        # with HTTP 200, or after delivery_grace_seconds, then verifies once
+        await self.delivery_tracker.wait_until_persisted(
+            test_id, expected=stats.sent_count - stats.failed
+        )
+        if self.config.verification == "replay":
+            return await self._verify_replayed(test_id, stats)
+        stats.verified_success, stats.unverified_success = (
+            await self.db_manager.verify_requests(test_id)
+        )
+        return {"verification": "rows"}
+
+    async def _verify_replayed(self, test_id: str, stats: TestStats) -> dict[str, Any]:
+        """Checks every received field against postbacks rebuilt from the seed
+        and the sent ranges, which are kept in params to replay the run later"""
+        integrity = await self.db_manager.verify_replayed(
+            test_id, self.generator.iter_row_chunks(stats.sent_ranges), MISSING_SAMPLE_SIZE
+        )
+        stats.unverified_success = integrity["missing_count"]
+        stats.verified_success = integrity["total_sent"] - stats.unverified_success
+        if integrity["missing_count"] or integrity["field_mismatches"]:
+            logger.warning(
+                {
+                    "event_log": "replay_verification",
+                    "test_id": test_id,
+                    "missing": integrity["missing_count"],
+                    "field_mismatches": integrity["field_mismatches"],
+                }
+            )
+        return {
+            "verification": "replay",
+            "seed": self.generator.seed,
+            "sent_ranges": stats.sent_ranges,
+            "field_mismatches": integrity["field_mismatches"],
+            "missing_sample": integrity["missing_sample"],
+            "mismatch_sample": integrity["mismatch_sample"],
+        }
+
+    async def _verify_bitmap(self, test_id: str, stats: TestStats) -> dict[str, Any]:
+        """Diffs the sent postback numbers with the receiver's bitmap of received
+        ones. The bit is set before the receiver answers, so there is nothing
+        to wait for; missing request_ids are regenerated from the seed."""
+        sent = DeliveryBitmap.from_ranges(stats.sent_ranges)
+        try:
+            received = await self.delivery_tracker.fetch_bitmap(test_id)
+        except Exception as e:
+            logger.error({"event_log": "fetch_bitmap_failed", "error": str(e)})
+            received = DeliveryBitmap()
+        missing = sent - received
+        stats.unverified_success = len(missing)
+        stats.verified_success = len(sent) - stats.unverified_success
+        sample = []
+        for index in missing.indices():
+            if len(sample) == MISSING_SAMPLE_SIZE:
+                break
+            sample.append(index)
+        missing_ids = [str(row[0]) for row in self.generator.rows_at(sample)]
+        if missing_ids:
+            logger.warning(
+                {
+                    "event_log": "missing_postbacks",
+                    "test_id": test_id,
+                    "missing": stats.unverified_success,
+                    "sample": missing_ids,
+                }
+            )
+        return {
+            "verification": "bitmap",
+            "seed": self.generator.seed,
+            "sent_ranges": stats.sent_ranges,
+            "missing_sample": missing_ids,
+        }
+
+    def _run_params(self, stats: TestStats) -> dict[str, Any]:
+        """Transport details and the load profile kept with the run's metrics"""
+        params = {
+            "engine": self.config.engine,
+            "protocol": self.config.protocol,
+            "http_versions": stats.http_versions,
+            "avg_requests_per_connection": stats.avg_requests_per_connection,
+            "peak_connections": stats.peak_connections,
+        }
+        if stats.stages:
+            stages = [stage.to_row(index) for index, stage in enumerate(stats.stages)]
+            knee = latency_knee(stages)
+            params["load_profile"] = [stage.model_dump() for stage in self.config.load_profile]
+            params["latency_knee"] = stages[knee]["name"] if knee is not None else None
+        return params
+
     async def _handle_interruption(self, test_id: str, stats: TestStats):
         duration = time.perf_counter() - self.start_time
         metrics = self._calculate_metrics(stats, duration)
 
         try:
+            await self.db_manager.close()
+            await self.db_manager.load_spool(test_id)
             await self.db_manager.save_test_results(test_id, duration, stats, metrics)
         except Exception as e:
             logger.error({"event_log": "save_results_failed", "error": str(e)})
@@ -263,3 +564,148 @@ class TestRunner:
                 },
             }
         )
+
+
+def run_worker_process(config_data: dict, db_path: str) -> TestStats:
+    """Entry point of a sender process: own event loop, own HTTP client, shared test_id"""
+    config = TestConfig.model_validate(config_data)
+    return asyncio.run(_run_worker(config, Path(db_path)))
+
+
+async def _run_worker(config: TestConfig, db_path: Path) -> TestStats:
+    db_manager = DatabaseManager(db_path, backend=config.storage, spool=config.spool)
+    runner = TestRunner(config, db_manager, create_engine(config), TestReporter(config))
+    runner.start_time = time.perf_counter()
+    stats = _empty_stats()
+    await runner.run_load(stats)
+    await db_manager.close()
+    return stats
+
+
+async def run_benchmark(
+    config: TestConfig,
+    db_manager: DatabaseManager,
+    reporter: TestReporter,
+    engines: list[str],
+    rate_limited: bool = False,
+) -> list[dict[str, Any]]:
+    """Runs the same test once per engine, each with its own test_id and
+    seed so received rows of one run never verify another, and prints them
+    side by side. Rounds go as fast as each engine can unless
+    ``rate_limited`` keeps config.max_requests_per_second"""
+    results = []
+    for engine in engines:
+        update = {
+            "engine": engine,
+            "test_id": str(uuid.uuid4()),
+            "seed": random.getrandbits(63),
+            "live_report": False,
+        }
+        if not rate_limited:
+            update["max_requests_per_second"] = UNLIMITED_RPS
+        engine_config = config.model_copy(update=update)
+        runner = TestRunner(engine_config, db_manager, create_engine(engine_config), reporter)
+        logger.info(
+            {"event_log": "benchmark_round", "engine": engine, "test_id": engine_config.test_id}
+        )
+        results.append(await runner.run_round({"benchmark": True}))
+    reporter.print_benchmark(results)
+    return results
+
+
+async def run_saturation_search(
+    config: TestConfig,
+    db_manager: DatabaseManager,
+    reporter: TestReporter,
+    min_rps: int,
+    max_rps: int,
+    precision: float = 0.05,
+) -> int | None:
+    """Finds the highest rate the target sustains within the SLO.
+
+    Probes of probe_seconds double the rate from min_rps until one breaches
+    the SLO or max_rps passes, then bisect between the last passing and the
+    first failing rate until they are within ``precision`` of each other.
+    Every probe is a stored run with its own test_id and seed. Returns the
+    maximum sustainable RPS, None if even min_rps breaches the SLO.
+    """
+    search_id = str(uuid.uuid4())
+    probes: list[dict[str, Any]] = []
+
+    async def probe(rps: int) -> bool:
+        probe_config = config.model_copy(
+            update={
+                "test_id": str(uuid.uuid4()),
+                "seed": random.getrandbits(63),
+                "max_requests_per_second": rps,
+                "request_count": max(1, math.ceil(rps * config.probe_seconds)),
+                "load_profile": [],
+                "live_report": False,
+            }
+        )
+        runner = TestRunner(probe_config, db_manager, create_engine(probe_config), reporter)
+        logger.info({"event_log": "saturation_probe", "rps": rps, "test_id": probe_config.test_id})
+        result = await runner.run_round({"saturation_search": search_id, "target_rps": rps})
+        result["target_rps"] = rps
+        result["error_rate"] = (
+            result["failed"] / result["sent_count"] * 100 if result["sent_count"] else 100.0
+        )
+        # Completed requests per second of the whole round, the tail included;
+        # an open-loop sender holding the rate but a target falling behind
+        # shows up here even when the few answered requests are fast
+        result["achieved_rps"] = (
+            (result["sent_count"] - result["failed"]) / result["duration"]
+            if result["duration"] > 0
+            else 0.0
+        )
+        result["passed"] = (
+            result["p99"] <= config.slo_p99
+            and result["error_rate"] <= config.slo_error_rate
+            and result["achieved_rps"] >= 0.9 * rps
+        )
+        probes.append(result)
+        return result["passed"]
+
+    passing, failing = None, None
+    rps = min_rps
+    while True:
+        if await probe(rps):
+            passing = rps
+            if rps >= max_rps:
+                break
+            rps = min(rps * 2, max_rps)
+        else:
+            failing = rps
+            break
+    while passing is not None and failing is not None:
+        if failing - passing <= max(1, passing * precision):
+            break
+        rps = (passing + failing) // 2
+        if await probe(rps):
+            passing = rps
+        else:
+            failing = rps
+
+    logger.info(
+        {"event_log": "saturation_search", "search_id": search_id, "max_sustainable_rps": passing}
+    )
+    reporter.print_saturation(probes, passing)
+    return passing
+
+
+def _empty_stats() -> TestStats:
+    return TestStats(
+        verified_success=0,
+        unverified_success=0,
+        failed=0,
+        latencies=LatencyHistogram(),
+        sent_count=0,
+    )
+
+
+def _cpu_seconds() -> float:
+    """User and system CPU time of this process and of the sender processes
+    it started and already joined"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
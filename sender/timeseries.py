@@ -0,0 +1,90 @@
+from dataclasses import dataclass, field
+from typing import Any
+
+from histogram import LatencyHistogram
+
+
+@dataclass
+class IntervalPoint:
+    index: int
+    offset: float
+    sent: int
+    ok: int
+    failed: int
+    p50: float
+    p99: float
+    rps: float
+    # Sparse histogram snapshot, kept so points from several processes can be merged
+    histogram: dict[str, Any] = field(default_factory=dict, repr=False)
+
+
+class TimeSeries:
+    """Rolling per-interval window of sent/ok/failed counts and latency percentiles"""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.points: list[IntervalPoint] = []
+        self._reset()
+
+    def _reset(self):
+        self.sent = 0
+        self.ok = 0
+        self.failed = 0
+        self.latencies = LatencyHistogram()
+
+    def on_sent(self):
+        self.sent += 1
+
+    def on_response(self, success: bool, latency: float | None = None):
+        if success:
+            self.ok += 1
+        else:
+            self.failed += 1
+        if latency is not None:
+            self.latencies.record(latency)
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self.sent or self.ok or self.failed)
+
+    def close_interval(self) -> IntervalPoint:
+        index = len(self.points)
+        point = IntervalPoint(
+            index=index,
+            offset=(index + 1) * self.interval,
+            sent=self.sent,
+            ok=self.ok,
+            failed=self.failed,
+            p50=self.latencies.percentile(50),
+            p99=self.latencies.percentile(99),
+            rps=self.sent / self.interval,
+            histogram=self.latencies.to_dict(),
+        )
+        self.points.append(point)
+        self._reset()
+        return point
+
+    def merge(self, other: "TimeSeries"):
+        """Adds points of another process interval by interval"""
+        merged = []
+        for index in range(max(len(self.points), len(other.points))):
+            pair = [series.points[index] for series in (self, other) if index < len(series.points)]
+            histogram = LatencyHistogram()
+            for point in pair:
+                if point.histogram:
+                    histogram.merge(LatencyHistogram.from_dict(point.histogram))
+            sent = sum(point.sent for point in pair)
+            merged.append(
+                IntervalPoint(
+                    index=index,
+                    offset=(index + 1) * self.interval,
+                    sent=sent,
+                    ok=sum(point.ok for point in pair),
+                    failed=sum(point.failed for point in pair),
+                    p50=histogram.percentile(50),
+                    p99=histogram.percentile(99),
+                    rps=sent / self.interval,
+                    histogram=histogram.to_dict(),
+                )
+            )
+        self.points = merged
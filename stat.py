@@ -1,44 +1,36 @@
 
 import argparse
-import sqlite3
 from rich.console import Console
 from rich.table import Table
 from rich import box
 
+from storage import BACKENDS, Storage, open_storage
+
 DB_PATH = 'requests.db'
 
-def get_last_test_id()->str:
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.execute("""SELECT test_id FROM sending_requests
-        ORDER BY created_at DESC
-        LIMIT 1;""")
-        test_id = cursor.fetchone()[0]
-        return test_id or ""
+def get_last_test_id(storage: Storage)->str:
+    history = storage.get_history(limit=1)
+    return history[0]["test_id"] if history else ""
 def parse_args():
     parser = argparse.ArgumentParser(description="Postback Load Tester")
     parser.add_argument(
         "--test_id",
         type=str,
-        default=get_last_test_id() or 'test_1',
-        help="Test ID for get data from DB",
+        default=None,
+        help="Test ID for get data from DB, the last saved test by default",
+    )
+    parser.add_argument(
+        "--storage",
+        type=str,
+        choices=BACKENDS,
+        default="sqlite",
+        help="Storage backend with the test data",
     )
     return parser.parse_args()
 
-def verify_requests(test_id:str)->tuple[int,int]:
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.execute(
-            "SELECT COUNT(*) FROM sending_requests WHERE test_id = ?", (test_id,)
-        )
-        sent_count = cursor.fetchone()[0]
-
-        received_count = conn.execute(
-                """SELECT COUNT(*) FROM sending_requests s
-                JOIN received_requests r ON s.request_id = r.request_id
-                WHERE s.test_id = ?""",
-                (test_id,)
-            ).fetchone()[0]
-
-        return received_count, sent_count
+def verify_requests(storage: Storage, test_id:str)->tuple[int,int]:
+    received_count, missing_count = storage.verify_requests(test_id)
+    return received_count, received_count + missing_count
 
 def print_basic_stat(data: dict):
         if not data:
@@ -69,14 +61,16 @@ def print_basic_stat(data: dict):
         Console().print(table)
 def main():
     args = parse_args()
-    received_count,sent_count = verify_requests(args.test_id)
+    storage = open_storage(args.storage, path=DB_PATH)
+    test_id = args.test_id or get_last_test_id(storage) or 'test_1'
+    received_count,sent_count = verify_requests(storage, test_id)
     if sent_count > 0:
         success_rate = round((received_count / sent_count) * 100)
         error_rate = 100 - success_rate
     else:
         success_rate = 0
         error_rate = 100
-    data = {"test_id":args.test_id,"sent":sent_count,"received":received_count,"errors":error_rate,"success":success_rate}
+    data = {"test_id":test_id,"sent":sent_count,"received":received_count,"errors":error_rate,"success":success_rate}
     print_basic_stat(data)
 
 
@@ -0,0 +1,54 @@
+from pathlib import Path
+
+from .base import (
+    HISTORY_COLUMNS,
+    INTEGRITY_FIELDS,
+    METRICS_COLUMNS,
+    POSTBACK_COLUMNS,
+    Storage,
+    metrics_row,
+    postback_row,
+)
+from .bitmap import BitmapFile, DeliveryBitmap
+
+BACKENDS = ("sqlite", "clickhouse", "memory")
+
+
+def open_storage(backend: str = "sqlite", path: Path | str | None = None, **kwargs) -> Storage:
+    """Creates a backend and its schema; ``path`` is the SQLite file.
+
+    ClickHouse needs clickhouse_driver and is imported only when asked for.
+    """
+    if backend == "sqlite":
+        from .sqlite import SQLiteStorage
+
+        if path is None:
+            raise ValueError("SQLite storage needs a database path")
+        storage = SQLiteStorage(path, **kwargs)
+    elif backend == "clickhouse":
+        from .clickhouse import ClickHouseStorage
+
+        storage = ClickHouseStorage(**kwargs)
+    elif backend == "memory":
+        from .memory import MemoryStorage
+
+        storage = MemoryStorage(**kwargs)
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    storage.init_schema()
+    return storage
+
+
+__all__ = [
+    "BACKENDS",
+    "BitmapFile",
+    "DeliveryBitmap",
+    "HISTORY_COLUMNS",
+    "INTEGRITY_FIELDS",
+    "METRICS_COLUMNS",
+    "POSTBACK_COLUMNS",
+    "Storage",
+    "metrics_row",
+    "open_storage",
+    "postback_row",
+]
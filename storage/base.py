@@ -0,0 +1,235 @@
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Iterable, Sequence
+
+POSTBACK_COLUMNS = (
+    "request_id",
+    "test_id",
+    "postback_type",
+    "event_name",
+    "source_id",
+    "campaign_id",
+    "placement_id",
+    "adset_id",
+    "ad_id",
+    "advertising_id",
+    "country",
+    "click_id",
+    "mmp",
+)
+INTEGRITY_FIELDS = POSTBACK_COLUMNS[1:]
+
+METRICS_COLUMNS = (
+    "test_id",
+    "duration",
+    "sending_count",
+    "verified_success",
+    "unverified_success",
+    "failed",
+    "verified_rate",
+    "avg_latency",
+    "min_latency",
+    "max_latency",
+    "p50",
+    "p90",
+    "p95",
+    "p99",
+    "p999",
+    "rps",
+    "avg_send_lag",
+    "max_send_lag",
+    "p99_send_lag",
+    # JSON object with whatever else the tool that ran the test wants to keep
+    "params",
+)
+
+HISTORY_COLUMNS = (
+    "test_id",
+    "test_datetime",
+    "duration",
+    "sending_count",
+    "verified_success",
+    "unverified_success",
+    "failed",
+    "rps",
+    "avg_latency",
+    "p99",
+    "verified_rate",
+    "params",
+)
+
+TIMESERIES_COLUMNS = ("interval_index", "offset", "sent", "ok", "failed", "rps", "p50", "p99")
+
+# One row per load-profile stage; rps is the achieved rate, start/end_rps the target
+STAGE_COLUMNS = (
+    "stage_index",
+    "name",
+    "start_offset",
+    "duration",
+    "start_rps",
+    "end_rps",
+    "sent",
+    "ok",
+    "failed",
+    "rps",
+    "p50",
+    "p99",
+    "p99_send_lag",
+)
+
+# In compact id mode these are 63-bit integers instead of uuid4 strings
+COMPACT_ID_COLUMNS = ("request_id", "campaign_id", "placement_id", "click_id")
+_COMPACT_ID_INDEXES = tuple(POSTBACK_COLUMNS.index(column) for column in COMPACT_ID_COLUMNS)
+
+
+def postback_row(postback: dict) -> tuple:
+    """Postback params as a row in POSTBACK_COLUMNS order"""
+    return tuple(postback.get(column) for column in POSTBACK_COLUMNS)
+
+
+def is_compact_row(row: Sequence) -> bool:
+    """Compact ids arrive as ints from the sender and as digit strings from
+    a query string; uuid strings always contain dashes"""
+    request_id = row[0]
+    return isinstance(request_id, int) or (isinstance(request_id, str) and request_id.isdigit())
+
+
+def compact_row(row: Sequence) -> tuple:
+    """Row of a compact-id postback with the id columns as ints"""
+    row = list(row)
+    for index in _COMPACT_ID_INDEXES:
+        if row[index] is not None:
+            row[index] = int(row[index])
+    return tuple(row)
+
+
+def split_rows(rows: Sequence[Sequence]) -> tuple[list[tuple], list[tuple]]:
+    """Separates uuid-keyed rows from compact-id rows (the latter converted)"""
+    uuid_rows, compact_rows = [], []
+    for row in rows:
+        if is_compact_row(row):
+            compact_rows.append(compact_row(row))
+        else:
+            uuid_rows.append(tuple(row))
+    return uuid_rows, compact_rows
+
+
+def metrics_row(metrics: dict[str, Any]) -> dict[str, Any]:
+    """Fills the metrics a tool does not measure, so every backend gets a full row"""
+    row = {column: metrics.get(column) or 0 for column in METRICS_COLUMNS}
+    row["test_id"] = metrics["test_id"]
+    row["params"] = metrics.get("params") or {}
+    return row
+
+
+class Storage(ABC):
+    """Where sent/received postbacks and run metrics are kept.
+
+    Postback rows are tuples in POSTBACK_COLUMNS order, ids either uuid
+    strings or compact integers (see is_compact_row). Methods are blocking,
+    async callers run them in an executor. Implementations must allow calls
+    from several threads.
+    """
+
+    def init_schema(self):
+        """Creates tables if the backend needs them"""
+
+    def close(self):
+        """Releases connections"""
+
+    @abstractmethod
+    def insert_sent(self, rows: Sequence[Sequence]):
+        ...
+
+    @abstractmethod
+    def insert_received(self, rows: Sequence[Sequence]):
+        ...
+
+    @abstractmethod
+    def count_received(self, test_id: str) -> int:
+        ...
+
+    @abstractmethod
+    def verify_requests(self, test_id: str) -> tuple[int, int]:
+        """Sent rows of the test that were received and that were not"""
+
+    @abstractmethod
+    def verify_data_integrity(self, test_id: str, sample_size: int = 0) -> dict[str, Any]:
+        """total_sent, total_received, missing_count and per-field mismatch counts;
+        with sample_size > 0 also missing_sample and mismatch_sample request_ids"""
+
+    @abstractmethod
+    def fetch_received(self, test_id: str, request_ids: Sequence) -> dict[Any, tuple]:
+        """Received rows with the given request_ids, keyed by request_id; compact
+        rows come back with int ids as compact_row() makes them"""
+
+    def verify_replayed(
+        self, test_id: str, expected: Iterable[Sequence[Sequence]], sample_size: int = 0
+    ) -> dict[str, Any]:
+        """verify_data_integrity against rows the sender regenerated from its
+        seed instead of stored ones; ``expected`` yields them in chunks and
+        only one chunk of received rows is looked up at a time"""
+        mismatches: dict[str, int] = defaultdict(int)
+        missing_sample: list[str] = []
+        mismatch_sample: list[str] = []
+        total_sent = missing_count = 0
+        for chunk in expected:
+            total_sent += len(chunk)
+            received = self.fetch_received(test_id, [row[0] for row in chunk])
+            for row in chunk:
+                other = received.get(row[0])
+                if other is None:
+                    missing_count += 1
+                    if len(missing_sample) < sample_size:
+                        missing_sample.append(str(row[0]))
+                    continue
+                mismatched = False
+                for index, field in enumerate(INTEGRITY_FIELDS, start=1):
+                    if row[index] != other[index]:
+                        mismatches[field] += 1
+                        mismatched = True
+                if mismatched and len(mismatch_sample) < sample_size:
+                    mismatch_sample.append(str(row[0]))
+
+        result = {
+            "total_sent": total_sent,
+            "total_received": self.count_received(test_id),
+            "missing_count": missing_count,
+            "field_mismatches": dict(mismatches),
+        }
+        if sample_size > 0:
+            result["missing_sample"] = missing_sample
+            result["mismatch_sample"] = mismatch_sample
+        return result
+
+    @abstractmethod
+    def save_metrics(self, row: dict[str, Any]):
+        """Stores one run, ``row`` is a metrics_row() dict"""
+
+    @abstractmethod
+    def save_histograms(self, test_id: str, histograms: dict[str, dict]):
+        ...
+
+    @abstractmethod
+    def get_histogram(self, test_id: str, name: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def save_timeseries(self, test_id: str, points: Sequence[dict[str, Any]]):
+        ...
+
+    @abstractmethod
+    def get_timeseries(self, test_id: str) -> list[dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save_stages(self, test_id: str, stages: Sequence[dict[str, Any]]):
+        ...
+
+    @abstractmethod
+    def get_stages(self, test_id: str) -> list[dict[str, Any]]:
+        """STAGE_COLUMNS dicts in stage order"""
+
+    @abstractmethod
+    def get_history(self, limit: int = 5) -> list[dict[str, Any]]:
+        """Latest runs first, HISTORY_COLUMNS with params decoded"""
@@ -0,0 +1,97 @@
+import mmap
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
+class DeliveryBitmap:
+    """Set of postback numbers of one run, one bit per postback: bit
+    ``n % 8`` of byte ``n // 8`` is postback ``n``. 50M postbacks take
+    6.25 MB; set operations run on the whole buffer as one Python int.
+    """
+
+    def __init__(self, data: bytes = b""):
+        self.data = bytearray(data)
+
+    @classmethod
+    def from_int(cls, value: int) -> "DeliveryBitmap":
+        return cls(value.to_bytes((value.bit_length() + 7) // 8, "little"))
+
+    @classmethod
+    def from_ranges(cls, ranges: Iterable[tuple[int, int]]) -> "DeliveryBitmap":
+        """Postbacks ``start`` to ``stop - 1`` of every range"""
+        value = 0
+        for start, stop in ranges:
+            if stop > start:
+                value |= ((1 << (stop - start)) - 1) << start
+        return cls.from_int(value)
+
+    @classmethod
+    def union(cls, bitmaps: Iterable[bytes]) -> "DeliveryBitmap":
+        value = 0
+        for data in bitmaps:
+            value |= int.from_bytes(data, "little")
+        return cls.from_int(value)
+
+    def to_int(self) -> int:
+        return int.from_bytes(self.data, "little")
+
+    def add(self, index: int):
+        byte = index >> 3
+        if byte >= len(self.data):
+            self.data.extend(bytes(max(byte + 1 - len(self.data), len(self.data))))
+        self.data[byte] |= 1 << (index & 7)
+
+    def __contains__(self, index: int) -> bool:
+        byte = index >> 3
+        return byte < len(self.data) and bool(self.data[byte] >> (index & 7) & 1)
+
+    def __len__(self) -> int:
+        return self.to_int().bit_count()
+
+    def __or__(self, other: "DeliveryBitmap") -> "DeliveryBitmap":
+        return DeliveryBitmap.from_int(self.to_int() | other.to_int())
+
+    def __sub__(self, other: "DeliveryBitmap") -> "DeliveryBitmap":
+        """Postbacks in this set and not in ``other``, e.g. sent minus received"""
+        return DeliveryBitmap.from_int(self.to_int() & ~other.to_int())
+
+    def indices(self) -> Iterator[int]:
+        """Set postback numbers in ascending order"""
+        for byte_index, byte in enumerate(self.data):
+            if byte:
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        yield byte_index * 8 + bit
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.data.rstrip(b"\0"))
+
+
+class BitmapFile:
+    """DeliveryBitmap in a memory-mapped file.
+
+    Bits set here reach the page cache directly, so other processes reading
+    the file see them without any write call. Bytes are read-modify-written,
+    so every writer process must own its file; readers OR the files together
+    (DeliveryBitmap.union).
+    """
+
+    def __init__(self, path: Path | str, initial_size: int = 1 << 16):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.touch(exist_ok=True)
+        self._file = open(self.path, "r+b")
+        size = max(self.path.stat().st_size, initial_size)
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def add(self, index: int):
+        byte = index >> 3
+        if byte >= len(self._map):
+            # Grows the file too
+            self._map.resize(max(byte + 1, 2 * len(self._map)))
+        self._map[byte] |= 1 << (index & 7)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
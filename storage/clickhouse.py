@@ -0,0 +1,416 @@
+from clickhouse_driver import Client
+from urllib.parse import urlparse
+import atexit
+import json
+import logging
+import os
+from typing import Any, Sequence
+import threading
+
+from .base import (
+    HISTORY_COLUMNS,
+    INTEGRITY_FIELDS,
+    METRICS_COLUMNS,
+    POSTBACK_COLUMNS,
+    STAGE_COLUMNS,
+    TIMESERIES_COLUMNS,
+    Storage,
+    compact_row,
+    is_compact_row,
+)
+
+logger = logging.getLogger(__name__)
+
+CLICKHOUSE_DB_URL = os.environ.get(
+    "CLICKHOUSE_DB_URL", "clickhouse://default@127.0.0.1:9000/default"
+)
+
+
+class ClickHouseClient:
+    """
+    Thread-safe ClickHouse client singleton with proper resource cleanup.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+    _client: Client | None = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+                    cls._initialize()
+        return cls._instance
+
+    @classmethod
+    def _initialize(cls):
+        db_url = urlparse(CLICKHOUSE_DB_URL)
+
+        connection_settings: dict[str, Any] = {
+            "host": db_url.hostname,
+            "port": db_url.port or 9000,
+            "user": db_url.username or "default",
+            "password": db_url.password or "",
+            "database": db_url.path.lstrip("/") or "default",
+            "settings": {
+                "connect_timeout": 10,
+                "send_receive_timeout": 30,
+                "insert_block_size": 100000,
+            },
+        }
+
+        if db_url.scheme == "https":
+            connection_settings["secure"] = True
+
+        cls._client = Client(**connection_settings)
+        atexit.register(cls._cleanup)
+        logger.info({"event_log": "ClickHouseClient", "message": "ClickHouse client initialized"})
+
+    @classmethod
+    def _cleanup(cls):
+        """Cleanup resources safely"""
+        if cls._client is not None:
+            try:
+                cls._client.disconnect()
+                logger.info("ClickHouse connection closed")
+            except Exception as e:
+                logger.warning(
+                    {
+                        "event_log": "ClickHouseClient",
+                        "message": "Error closing ClickHouse connection",
+                        "error": e,
+                    }
+                )
+            finally:
+                cls._client = None
+
+    @property
+    def client(self) -> Client:
+        if self._client is None:
+            self._initialize()
+        return self._client
+
+
+def get_clickhouse() -> Client:
+    return ClickHouseClient().client
+
+
+class ClickHouseStorage(Storage):
+    """Sent/received postbacks and run metrics in ClickHouse.
+
+    Rows go in as columnar blocks into MergeTree tables ordered by
+    (test_id, request_id), verification runs server-side. Any object with
+    clickhouse_driver's ``execute`` signature can be passed as ``client``,
+    e.g. a fake in local runs without a server.
+    """
+
+    block_size = 100_000
+
+    def __init__(self, client: Any = None):
+        self.client = client if client is not None else get_clickhouse()
+        # clickhouse_driver connections must not run two queries at once
+        self._lock = threading.Lock()
+
+    def execute(self, query: str, params: Any = None, **kwargs) -> Any:
+        with self._lock:
+            return self.client.execute(query, params, **kwargs)
+
+    def init_schema(self):
+        postback_columns = """
+            request_id String,
+            test_id String,
+            postback_type LowCardinality(String),
+            event_name LowCardinality(String),
+            source_id LowCardinality(String),
+            campaign_id String,
+            placement_id String,
+            adset_id LowCardinality(String),
+            ad_id LowCardinality(String),
+            advertising_id String,
+            country LowCardinality(String),
+            click_id String,
+            mmp LowCardinality(String),
+            created_at DateTime DEFAULT now()
+        """
+        for table in ("sending_requests", "received_requests"):
+            self.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} ({postback_columns})
+                ENGINE = MergeTree
+                ORDER BY (test_id, request_id)
+                """
+            )
+        self.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metrics (
+                test_id String,
+                test_datetime DateTime DEFAULT now(),
+                duration Float64,
+                sending_count UInt64,
+                verified_success UInt64,
+                unverified_success UInt64,
+                failed UInt64,
+                verified_rate Float64,
+                avg_latency Float64,
+                min_latency Float64,
+                max_latency Float64,
+                p50 Float64,
+                p90 Float64,
+                p95 Float64,
+                p99 Float64,
+                p999 Float64,
+                rps Float64,
+                avg_send_lag Float64,
+                max_send_lag Float64,
+                p99_send_lag Float64,
+                params String DEFAULT '{}'
+            )
+            ENGINE = MergeTree
+            ORDER BY test_id
+            """
+        )
+        self.execute("ALTER TABLE metrics ADD COLUMN IF NOT EXISTS params String DEFAULT '{}'")
+        self.execute(
+            """
+            CREATE TABLE IF NOT EXISTS latency_histograms (
+                test_id String,
+                name String,
+                histogram String
+            )
+            ENGINE = MergeTree
+            ORDER BY (test_id, name)
+            """
+        )
+        self.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metrics_timeseries (
+                test_id String,
+                interval_index UInt32,
+                offset Float64,
+                sent UInt64,
+                ok UInt64,
+                failed UInt64,
+                rps Float64,
+                p50 Float64,
+                p99 Float64
+            )
+            ENGINE = MergeTree
+            ORDER BY (test_id, interval_index)
+            """
+        )
+        self.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metrics_stages (
+                test_id String,
+                stage_index UInt32,
+                name String,
+                start_offset Float64,
+                duration Float64,
+                start_rps Float64,
+                end_rps Float64,
+                sent UInt64,
+                ok UInt64,
+                failed UInt64,
+                rps Float64,
+                p50 Float64,
+                p99 Float64,
+                p99_send_lag Float64
+            )
+            ENGINE = MergeTree
+            ORDER BY (test_id, stage_index)
+            """
+        )
+
+    def _insert_rows(self, table: str, columns: Sequence[str], rows: Sequence[Sequence]):
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start : start + self.block_size]
+            self.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES",
+                [list(column) for column in zip(*block)],
+                columnar=True,
+            )
+
+    @staticmethod
+    def _text_rows(rows: Sequence[Sequence]) -> list[tuple]:
+        # Compact ids share the String columns, LowCardinality/LZ4 already
+        # keep them small and both sides compare them as the same text
+        return [
+            tuple(str(value) if isinstance(value, int) else value for value in row)
+            if is_compact_row(row)
+            else row
+            for row in rows
+        ]
+
+    def insert_sent(self, rows: Sequence[Sequence]):
+        self._insert_rows("sending_requests", POSTBACK_COLUMNS, self._text_rows(rows))
+
+    def insert_received(self, rows: Sequence[Sequence]):
+        self._insert_rows("received_requests", POSTBACK_COLUMNS, self._text_rows(rows))
+
+    def count_received(self, test_id: str) -> int:
+        return self.execute(
+            "SELECT uniqExact(request_id) FROM received_requests WHERE test_id = %(test_id)s",
+            {"test_id": test_id},
+        )[0][0]
+
+    def verify_requests(self, test_id: str) -> tuple[int, int]:
+        sent_count, received_count = self.execute(
+            """
+            SELECT
+                uniqExact(s.request_id),
+                uniqExactIf(s.request_id, r.request_id != '')
+            FROM sending_requests AS s
+            LEFT JOIN (
+                SELECT DISTINCT request_id FROM received_requests WHERE test_id = %(test_id)s
+            ) AS r ON r.request_id = s.request_id
+            WHERE s.test_id = %(test_id)s
+            """,
+            {"test_id": test_id},
+        )[0]
+        return received_count, sent_count - received_count
+
+    def verify_data_integrity(self, test_id: str, sample_size: int = 0) -> dict[str, Any]:
+        params = {"test_id": test_id, "sample_size": sample_size}
+        mismatch_counts = ", ".join(
+            f"countIf(r.request_id IS NOT NULL AND s.{field} != r.{field})"
+            for field in INTEGRITY_FIELDS
+        )
+        # MergeTree keeps retried or duplicated deliveries, one row per
+        # request_id on both sides counts them the way the other backends do
+        joined = f"""
+            FROM (
+                SELECT {', '.join(POSTBACK_COLUMNS)} FROM sending_requests
+                WHERE test_id = %(test_id)s
+                LIMIT 1 BY request_id
+            ) AS s
+            LEFT JOIN (
+                SELECT {', '.join(POSTBACK_COLUMNS)} FROM received_requests
+                WHERE test_id = %(test_id)s
+                LIMIT 1 BY request_id
+            ) AS r ON r.request_id = s.request_id
+            WHERE s.test_id = %(test_id)s
+        """
+        settings = {"join_use_nulls": 1}
+        row = self.execute(
+            f"SELECT count(), countIf(r.request_id IS NULL), {mismatch_counts} {joined}",
+            params,
+            settings=settings,
+        )[0]
+        result = {
+            "total_sent": row[0],
+            "total_received": self.count_received(test_id),
+            "missing_count": row[1],
+            "field_mismatches": {
+                field: count for field, count in zip(INTEGRITY_FIELDS, row[2:]) if count
+            },
+        }
+        if sample_size > 0:
+            any_mismatch = " OR ".join(f"s.{field} != r.{field}" for field in INTEGRITY_FIELDS)
+            result["missing_sample"] = [
+                row[0]
+                for row in self.execute(
+                    f"SELECT s.request_id {joined} AND r.request_id IS NULL "
+                    "LIMIT %(sample_size)s",
+                    params,
+                    settings=settings,
+                )
+            ]
+            result["mismatch_sample"] = [
+                row[0]
+                for row in self.execute(
+                    f"SELECT s.request_id {joined} AND r.request_id IS NOT NULL "
+                    f"AND ({any_mismatch}) LIMIT %(sample_size)s",
+                    params,
+                    settings=settings,
+                )
+            ]
+        return result
+
+    def fetch_received(self, test_id: str, request_ids: Sequence) -> dict[Any, tuple]:
+        rows = self.execute(
+            f"""
+            SELECT {', '.join(POSTBACK_COLUMNS)} FROM received_requests
+            WHERE test_id = %(test_id)s AND request_id IN %(request_ids)s
+            LIMIT 1 BY request_id
+            """,
+            {"test_id": test_id, "request_ids": [str(request_id) for request_id in request_ids]},
+        )
+        # Compact ids are stored as text, hand them back as the sender made them
+        rows = (compact_row(row) if is_compact_row(row) else tuple(row) for row in rows)
+        return {row[0]: row for row in rows}
+
+    def save_metrics(self, row: dict[str, Any]):
+        values = [row[column] for column in METRICS_COLUMNS]
+        values[METRICS_COLUMNS.index("params")] = json.dumps(row["params"])
+        self._insert_rows("metrics", METRICS_COLUMNS, [values])
+
+    def save_histograms(self, test_id: str, histograms: dict[str, dict]):
+        self._insert_rows(
+            "latency_histograms",
+            ("test_id", "name", "histogram"),
+            [(test_id, name, json.dumps(data)) for name, data in histograms.items()],
+        )
+
+    def get_histogram(self, test_id: str, name: str) -> dict | None:
+        rows = self.execute(
+            """
+            SELECT histogram FROM latency_histograms
+            WHERE test_id = %(test_id)s AND name = %(name)s
+            LIMIT 1
+            """,
+            {"test_id": test_id, "name": name},
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def save_timeseries(self, test_id: str, points: Sequence[dict[str, Any]]):
+        self._insert_rows(
+            "metrics_timeseries",
+            ("test_id",) + TIMESERIES_COLUMNS,
+            [[test_id] + [point[column] for column in TIMESERIES_COLUMNS] for point in points],
+        )
+
+    def get_timeseries(self, test_id: str) -> list[dict[str, Any]]:
+        rows = self.execute(
+            f"""
+            SELECT {', '.join(TIMESERIES_COLUMNS)} FROM metrics_timeseries
+            WHERE test_id = %(test_id)s
+            ORDER BY interval_index
+            """,
+            {"test_id": test_id},
+        )
+        return [dict(zip(TIMESERIES_COLUMNS, row)) for row in rows]
+
+    def save_stages(self, test_id: str, stages: Sequence[dict[str, Any]]):
+        self._insert_rows(
+            "metrics_stages",
+            ("test_id",) + STAGE_COLUMNS,
+            [[test_id] + [stage[column] for column in STAGE_COLUMNS] for stage in stages],
+        )
+
+    def get_stages(self, test_id: str) -> list[dict[str, Any]]:
+        rows = self.execute(
+            f"""
+            SELECT {', '.join(STAGE_COLUMNS)} FROM metrics_stages
+            WHERE test_id = %(test_id)s
+            ORDER BY stage_index
+            """,
+            {"test_id": test_id},
+        )
+        return [dict(zip(STAGE_COLUMNS, row)) for row in rows]
+
+    def get_history(self, limit: int = 5) -> list[dict[str, Any]]:
+        columns = ", ".join(
+            "formatDateTime(test_datetime, '%%Y-%%m-%%d %%H:%%M:%%S')"
+            if column == "test_datetime"
+            else column
+            for column in HISTORY_COLUMNS
+        )
+        rows = self.execute(
+            f"SELECT {columns} FROM metrics ORDER BY test_datetime DESC LIMIT %(limit)s",
+            {"limit": limit},
+        )
+        history = [dict(zip(HISTORY_COLUMNS, row)) for row in rows]
+        for entry in history:
+            entry["params"] = json.loads(entry["params"] or "{}")
+        return history
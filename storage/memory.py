@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Sequence
+
+from .base import HISTORY_COLUMNS, INTEGRITY_FIELDS, Storage, split_rows
+
+
+class MemoryStorage(Storage):
+    """Keeps everything in process memory and forgets it on exit.
+
+    Meant for benchmarking the load generator without storage overhead.
+    Verification only sees rows inserted into this same object, so a sender
+    using it cannot see what a separate receiver process got.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # test_id -> request_id (str, or int for compact ids) -> row
+        self.sent: dict[str, dict[Any, tuple]] = defaultdict(dict)
+        self.received: dict[str, dict[Any, tuple]] = defaultdict(dict)
+        self.metrics: dict[str, dict[str, Any]] = {}
+        self.histograms: dict[tuple[str, str], dict] = {}
+        self.timeseries: dict[str, list[dict[str, Any]]] = {}
+        self.stages: dict[str, list[dict[str, Any]]] = {}
+
+    def _insert_rows(self, table: dict[str, dict[Any, tuple]], rows: Sequence[Sequence]):
+        uuid_rows, compact_rows = split_rows(rows)
+        with self._lock:
+            for row in uuid_rows + compact_rows:
+                table[row[1]].setdefault(row[0], row)
+
+    def insert_sent(self, rows: Sequence[Sequence]):
+        self._insert_rows(self.sent, rows)
+
+    def insert_received(self, rows: Sequence[Sequence]):
+        self._insert_rows(self.received, rows)
+
+    def count_received(self, test_id: str) -> int:
+        return len(self.received.get(test_id, {}))
+
+    def verify_requests(self, test_id: str) -> tuple[int, int]:
+        sent = self.sent.get(test_id, {})
+        # Received rows are keyed by their own test_id, look the id up everywhere
+        received = sum(
+            1 for request_id in sent if any(request_id in rows for rows in self.received.values())
+        )
+        return received, len(sent) - received
+
+    def fetch_received(self, test_id: str, request_ids: Sequence) -> dict[Any, tuple]:
+        # Like verify_requests, received rows of any test_id count
+        found = {}
+        for rows in self.received.values():
+            for request_id in request_ids:
+                row = rows.get(request_id)
+                if row is not None:
+                    found[request_id] = row
+        return found
+
+    def verify_data_integrity(self, test_id: str, sample_size: int = 0) -> dict[str, Any]:
+        sent = self.sent.get(test_id, {})
+        received: dict[Any, tuple] = {}
+        for rows in self.received.values():
+            received.update(rows)
+        mismatches: dict[str, int] = defaultdict(int)
+        missing_sample: list[str] = []
+        mismatch_sample: list[str] = []
+        missing_count = 0
+        for request_id, row in sent.items():
+            other = received.get(request_id)
+            if other is None:
+                missing_count += 1
+                if len(missing_sample) < sample_size:
+                    missing_sample.append(str(request_id))
+                continue
+            mismatched = False
+            for index, field in enumerate(INTEGRITY_FIELDS, start=1):
+                if row[index] != other[index]:
+                    mismatches[field] += 1
+                    mismatched = True
+            if mismatched and len(mismatch_sample) < sample_size:
+                mismatch_sample.append(str(request_id))
+
+        result = {
+            "total_sent": len(sent),
+            "total_received": self.count_received(test_id),
+            "missing_count": missing_count,
+            "field_mismatches": dict(mismatches),
+        }
+        if sample_size > 0:
+            result["missing_sample"] = missing_sample
+            result["mismatch_sample"] = mismatch_sample
+        return result
+
+    def save_metrics(self, row: dict[str, Any]):
+        with self._lock:
+            self.metrics.setdefault(
+                row["test_id"],
+                {**row, "test_datetime": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())},
+            )
+
+    def save_histograms(self, test_id: str, histograms: dict[str, dict]):
+        with self._lock:
+            for name, data in histograms.items():
+                self.histograms[(test_id, name)] = data
+
+    def get_histogram(self, test_id: str, name: str) -> dict | None:
+        return self.histograms.get((test_id, name))
+
+    def save_timeseries(self, test_id: str, points: Sequence[dict[str, Any]]):
+        with self._lock:
+            self.timeseries[test_id] = [dict(point) for point in points]
+
+    def get_timeseries(self, test_id: str) -> list[dict[str, Any]]:
+        return sorted(self.timeseries.get(test_id, []), key=lambda point: point["interval_index"])
+
+    def save_stages(self, test_id: str, stages: Sequence[dict[str, Any]]):
+        with self._lock:
+            self.stages[test_id] = [dict(stage) for stage in stages]
+
+    def get_stages(self, test_id: str) -> list[dict[str, Any]]:
+        return sorted(self.stages.get(test_id, []), key=lambda stage: stage["stage_index"])
+
+    def get_history(self, limit: int = 5) -> list[dict[str, Any]]:
+        # Insertion order is run order
+        rows = list(self.metrics.values())[::-1][:limit]
+        return [{column: row[column] for column in HISTORY_COLUMNS} for row in rows]
@@ -0,0 +1,492 @@
+import json
+import logging
+import sqlite3
+import threading
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Sequence
+
+from .base import (
+    HISTORY_COLUMNS,
+    INTEGRITY_FIELDS,
+    METRICS_COLUMNS,
+    POSTBACK_COLUMNS,
+    STAGE_COLUMNS,
+    TIMESERIES_COLUMNS,
+    Storage,
+    split_rows,
+)
+
+logger = logging.getLogger(__name__)
+
+COLUMNS_SQL = ", ".join(POSTBACK_COLUMNS)
+PLACEHOLDERS = ", ".join("?" * len(POSTBACK_COLUMNS))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sending_requests (
+    request_id TEXT PRIMARY KEY,
+    test_id TEXT,
+    postback_type TEXT,
+    event_name TEXT,
+    source_id TEXT,
+    campaign_id TEXT,
+    placement_id TEXT,
+    adset_id TEXT,
+    ad_id TEXT,
+    advertising_id TEXT,
+    country TEXT,
+    click_id TEXT,
+    mmp TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS received_requests (
+    request_id TEXT PRIMARY KEY,
+    test_id TEXT,
+    postback_type TEXT,
+    event_name TEXT,
+    source_id TEXT,
+    campaign_id TEXT,
+    placement_id TEXT,
+    adset_id TEXT,
+    ad_id TEXT,
+    advertising_id TEXT,
+    country TEXT,
+    click_id TEXT,
+    mmp TEXT,
+    gaid TEXT,
+    idfa TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS metrics (
+    test_id TEXT PRIMARY KEY,
+    test_datetime TEXT,
+    duration REAL,
+    sending_count INTEGER,
+    verified_success INTEGER,
+    unverified_success INTEGER,
+    failed INTEGER,
+    verified_rate REAL,
+    avg_latency REAL,
+    min_latency REAL,
+    max_latency REAL,
+    p50 REAL,
+    p90 REAL,
+    p95 REAL,
+    p99 REAL,
+    p999 REAL,
+    rps REAL,
+    avg_send_lag REAL,
+    max_send_lag REAL,
+    p99_send_lag REAL,
+    params TEXT
+);
+
+CREATE TABLE IF NOT EXISTS metrics_timeseries (
+    test_id TEXT,
+    interval_index INTEGER,
+    offset REAL,
+    sent INTEGER,
+    ok INTEGER,
+    failed INTEGER,
+    rps REAL,
+    p50 REAL,
+    p99 REAL,
+    PRIMARY KEY (test_id, interval_index)
+);
+
+CREATE TABLE IF NOT EXISTS metrics_stages (
+    test_id TEXT,
+    stage_index INTEGER,
+    name TEXT,
+    start_offset REAL,
+    duration REAL,
+    start_rps REAL,
+    end_rps REAL,
+    sent INTEGER,
+    ok INTEGER,
+    failed INTEGER,
+    rps REAL,
+    p50 REAL,
+    p99 REAL,
+    p99_send_lag REAL,
+    PRIMARY KEY (test_id, stage_index)
+);
+
+CREATE TABLE IF NOT EXISTS latency_histograms (
+    test_id TEXT,
+    name TEXT,
+    histogram TEXT,
+    PRIMARY KEY (test_id, name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_sending_test ON sending_requests(test_id, request_id);
+CREATE INDEX IF NOT EXISTS idx_received_test ON received_requests(test_id, request_id);
+"""
+
+# Compact-id postbacks: the integer request_id is the rowid itself, so the
+# primary key needs no separate index and the verification joins compare
+# 8-byte integers. An index on test_id implicitly carries the rowid.
+COMPACT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sending_requests_compact (
+    request_id INTEGER PRIMARY KEY,
+    test_id TEXT,
+    postback_type TEXT,
+    event_name TEXT,
+    source_id TEXT,
+    campaign_id INTEGER,
+    placement_id INTEGER,
+    adset_id TEXT,
+    ad_id TEXT,
+    advertising_id TEXT,
+    country TEXT,
+    click_id INTEGER,
+    mmp TEXT
+);
+
+CREATE TABLE IF NOT EXISTS received_requests_compact (
+    request_id INTEGER PRIMARY KEY,
+    test_id TEXT,
+    postback_type TEXT,
+    event_name TEXT,
+    source_id TEXT,
+    campaign_id INTEGER,
+    placement_id INTEGER,
+    adset_id TEXT,
+    ad_id TEXT,
+    advertising_id TEXT,
+    country TEXT,
+    click_id INTEGER,
+    mmp TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_sending_compact_test ON sending_requests_compact(test_id);
+CREATE INDEX IF NOT EXISTS idx_received_compact_test ON received_requests_compact(test_id);
+"""
+
+# (sent, received) tables; a test lives in one pair, queries cover both
+TABLE_PAIRS = (
+    ("sending_requests", "received_requests"),
+    ("sending_requests_compact", "received_requests_compact"),
+)
+
+
+class SQLiteStorage(Storage):
+    """Postbacks and metrics in one SQLite file.
+
+    Every thread gets its own connection with the same pragmas. If
+    ``shards_dir`` is set, received rows of a multi-worker receiver
+    (``received_*.db`` files there) are merged in before verification.
+    """
+
+    def __init__(self, path: Path | str, shards_dir: Path | None = None, chunk_size: int = 10_000):
+        self.path = Path(path)
+        self.shards_dir = shards_dir
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA cache_size = -10000")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def init_schema(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+        conn.executescript(COMPACT_SCHEMA)
+        self._ensure_columns(
+            conn,
+            "metrics",
+            {
+                "p50": "REAL",
+                "p999": "REAL",
+                "avg_send_lag": "REAL",
+                "max_send_lag": "REAL",
+                "p99_send_lag": "REAL",
+                "params": "TEXT",
+            },
+        )
+        conn.commit()
+
+    @staticmethod
+    def _ensure_columns(conn: sqlite3.Connection, table: str, columns: dict[str, str]):
+        """Adds columns introduced after the table was first created"""
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, column_type in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def _insert_rows(self, pair_index: int, rows: Sequence[Sequence]):
+        conn = self.connection()
+        with conn:
+            for (sent, received), table_rows in zip(TABLE_PAIRS, split_rows(rows)):
+                if table_rows:
+                    table = (sent, received)[pair_index]
+                    conn.executemany(
+                        f"INSERT OR IGNORE INTO {table} ({COLUMNS_SQL}) VALUES ({PLACEHOLDERS})",
+                        table_rows,
+                    )
+
+    def insert_sent(self, rows: Sequence[Sequence]):
+        self._insert_rows(0, rows)
+
+    def insert_received(self, rows: Sequence[Sequence]):
+        self._insert_rows(1, rows)
+
+    def _count(self, table: str, test_id: str) -> int:
+        return self.connection().execute(
+            f"SELECT COUNT(*) FROM {table} WHERE test_id = ?", (test_id,)
+        ).fetchone()[0]
+
+    def count_received(self, test_id: str) -> int:
+        return sum(self._count(received, test_id) for _, received in TABLE_PAIRS)
+
+    def merge_received_shards(self, test_id: str | None = None) -> list[Path]:
+        """Copies received rows from receiver shards so received_requests is one
+        table; all tests unless test_id is given. Returns the merged shard files."""
+        if self.shards_dir is None:
+            return []
+        shards = sorted(Path(self.shards_dir).glob("received_*.db"))
+        where, params = ("WHERE test_id = ?", (test_id,)) if test_id is not None else ("", ())
+        conn = self.connection()
+        for path in shards:
+            conn.execute("ATTACH DATABASE ? AS shard", (str(path),))
+            try:
+                for _, table in TABLE_PAIRS:
+                    conn.execute(
+                        f"""
+                        INSERT OR IGNORE INTO main.{table} ({COLUMNS_SQL})
+                        SELECT {COLUMNS_SQL} FROM shard.{table} {where}
+                        """,
+                        params,
+                    )
+                    conn.commit()
+            except sqlite3.OperationalError as e:
+                logger.warning({"event_log": "merge_shard", "shard": str(path), "error": str(e)})
+            finally:
+                conn.execute("DETACH DATABASE shard")
+        return shards
+
+    def verify_requests(self, test_id: str) -> tuple[int, int]:
+        self.merge_received_shards(test_id)
+        conn = self.connection()
+        sent_count = received_count = 0
+        for sent, received in TABLE_PAIRS:
+            sent_count += self._count(sent, test_id)
+            received_count += conn.execute(
+                f"""SELECT COUNT(*) FROM {sent} s
+                JOIN {received} r ON s.request_id = r.request_id
+                WHERE s.test_id = ?""",
+                (test_id,),
+            ).fetchone()[0]
+        return received_count, sent_count - received_count
+
+    def verify_data_integrity(self, test_id: str, sample_size: int = 0) -> dict[str, Any]:
+        """Missing rows come from an anti-join and per-column mismatch counts
+        from one aggregated LEFT JOIN, so memory does not depend on the run
+        size; samples are streamed from a cursor in chunk_size pieces."""
+        self.merge_received_shards(test_id)
+        conn = self.connection()
+        mismatch_sums = ", ".join(
+            f"SUM(r.request_id IS NOT NULL AND s.{field} IS NOT r.{field})"
+            for field in INTEGRITY_FIELDS
+        )
+        any_mismatch = " OR ".join(f"s.{field} IS NOT r.{field}" for field in INTEGRITY_FIELDS)
+        result = {
+            "total_sent": 0,
+            "total_received": self.count_received(test_id),
+            "missing_count": 0,
+            "field_mismatches": {},
+        }
+        if sample_size > 0:
+            result["missing_sample"] = []
+            result["mismatch_sample"] = []
+
+        for sent, received in TABLE_PAIRS:
+            total_sent = self._count(sent, test_id)
+            if not total_sent:
+                continue
+            row = conn.execute(
+                f"""
+                SELECT SUM(r.request_id IS NULL), {mismatch_sums}
+                FROM {sent} s
+                LEFT JOIN {received} r ON r.request_id = s.request_id
+                WHERE s.test_id = ?
+                """,
+                (test_id,),
+            ).fetchone()
+            result["total_sent"] += total_sent
+            result["missing_count"] += row[0] or 0
+            for field, count in zip(INTEGRITY_FIELDS, row[1:]):
+                if count:
+                    result["field_mismatches"][field] = (
+                        result["field_mismatches"].get(field, 0) + count
+                    )
+            if sample_size > 0:
+                result["missing_sample"] += self._sample_ids(
+                    f"""
+                    SELECT s.request_id FROM {sent} s
+                    LEFT JOIN {received} r ON r.request_id = s.request_id
+                    WHERE s.test_id = ? AND r.request_id IS NULL
+                    """,
+                    (test_id,),
+                    sample_size - len(result["missing_sample"]),
+                )
+                result["mismatch_sample"] += self._sample_ids(
+                    f"""
+                    SELECT s.request_id FROM {sent} s
+                    JOIN {received} r ON r.request_id = s.request_id
+                    WHERE s.test_id = ? AND ({any_mismatch})
+                    """,
+                    (test_id,),
+                    sample_size - len(result["mismatch_sample"]),
+                )
+        return result
+
+    def fetch_received(self, test_id: str, request_ids: Sequence) -> dict[Any, tuple]:
+        """Looks the ids up through a TEMP table joined with both received
+        tables, a chunk of ids per call"""
+        conn = self.connection()
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS replay_ids (request_id PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.replay_ids")
+        conn.executemany(
+            "INSERT OR IGNORE INTO temp.replay_ids VALUES (?)",
+            [(request_id,) for request_id in request_ids],
+        )
+        found = {}
+        for _, received in TABLE_PAIRS:
+            for row in conn.execute(
+                f"SELECT {', '.join('r.' + column for column in POSTBACK_COLUMNS)} "
+                f"FROM {received} r JOIN temp.replay_ids i ON i.request_id = r.request_id"
+            ):
+                found[row[0]] = row
+        conn.commit()
+        return found
+
+    def verify_replayed(
+        self, test_id: str, expected: Iterable[Sequence[Sequence]], sample_size: int = 0
+    ) -> dict[str, Any]:
+        self.merge_received_shards(test_id)
+        return super().verify_replayed(test_id, expected, sample_size)
+
+    def _iter_ids(self, sql: str, params: tuple, chunk_size: int) -> Iterator[str]:
+        cursor = self.connection().execute(sql, params)
+        while rows := cursor.fetchmany(chunk_size):
+            for row in rows:
+                yield row[0]
+
+    def _sample_ids(self, sql: str, params: tuple, limit: int) -> list[str]:
+        if limit <= 0:
+            return []
+        ids = islice(self._iter_ids(sql, params, min(self.chunk_size, limit)), limit)
+        return [str(request_id) for request_id in ids]
+
+    def save_metrics(self, row: dict[str, Any]):
+        values = [row[column] for column in METRICS_COLUMNS]
+        values[METRICS_COLUMNS.index("params")] = json.dumps(row["params"])
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                f"""
+                INSERT OR IGNORE INTO metrics (test_datetime, {', '.join(METRICS_COLUMNS)})
+                VALUES (datetime('now'), {', '.join('?' * len(METRICS_COLUMNS))})
+                """,
+                values,
+            )
+
+    def save_histograms(self, test_id: str, histograms: dict[str, dict]):
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO latency_histograms (test_id, name, histogram)
+                VALUES (?, ?, ?)
+                """,
+                [(test_id, name, json.dumps(data)) for name, data in histograms.items()],
+            )
+
+    def get_histogram(self, test_id: str, name: str) -> dict | None:
+        row = self.connection().execute(
+            "SELECT histogram FROM latency_histograms WHERE test_id = ? AND name = ?",
+            (test_id, name),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_timeseries(self, test_id: str, points: Sequence[dict[str, Any]]):
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                f"""
+                INSERT OR REPLACE INTO metrics_timeseries
+                (test_id, {', '.join(TIMESERIES_COLUMNS)})
+                VALUES (?, {', '.join('?' * len(TIMESERIES_COLUMNS))})
+                """,
+                [[test_id] + [point[column] for column in TIMESERIES_COLUMNS] for point in points],
+            )
+
+    def get_timeseries(self, test_id: str) -> list[dict[str, Any]]:
+        rows = self.connection().execute(
+            f"""
+            SELECT {', '.join(TIMESERIES_COLUMNS)} FROM metrics_timeseries
+            WHERE test_id = ?
+            ORDER BY interval_index
+            """,
+            (test_id,),
+        ).fetchall()
+        return [dict(zip(TIMESERIES_COLUMNS, row)) for row in rows]
+
+    def save_stages(self, test_id: str, stages: Sequence[dict[str, Any]]):
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                f"""
+                INSERT OR REPLACE INTO metrics_stages
+                (test_id, {', '.join(STAGE_COLUMNS)})
+                VALUES (?, {', '.join('?' * len(STAGE_COLUMNS))})
+                """,
+                [[test_id] + [stage[column] for column in STAGE_COLUMNS] for stage in stages],
+            )
+
+    def get_stages(self, test_id: str) -> list[dict[str, Any]]:
+        rows = self.connection().execute(
+            f"""
+            SELECT {', '.join(STAGE_COLUMNS)} FROM metrics_stages
+            WHERE test_id = ?
+            ORDER BY stage_index
+            """,
+            (test_id,),
+        ).fetchall()
+        return [dict(zip(STAGE_COLUMNS, row)) for row in rows]
+
+    def get_history(self, limit: int = 5) -> list[dict[str, Any]]:
+        columns = ", ".join(
+            "strftime('%Y-%m-%d %H:%M:%S', test_datetime)" if column == "test_datetime" else column
+            for column in HISTORY_COLUMNS
+        )
+        rows = self.connection().execute(
+            f"SELECT {columns} FROM metrics ORDER BY test_datetime DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        history = [dict(zip(HISTORY_COLUMNS, row)) for row in rows]
+        for entry in history:
+            entry["params"] = json.loads(entry["params"]) if entry["params"] else {}
+        return history
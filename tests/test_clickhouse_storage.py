@@ -0,0 +1,85 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+if str(BASE_DIR) not in sys.path:
+    # Appended, the repo's stat.py would shadow the stdlib module
+    sys.path.append(str(BASE_DIR))
+
+pytest.importorskip("clickhouse_driver")
+
+from storage import INTEGRITY_FIELDS, POSTBACK_COLUMNS  # noqa: E402
+from storage.clickhouse import ClickHouseStorage  # noqa: E402
+
+
+class FakeClient:
+    """Stands in for clickhouse_driver.Client: keeps columnar inserts per
+    table and answers SELECTs from ``results``, first matching fragment wins"""
+
+    def __init__(self, results: dict[str, list[tuple]] | None = None):
+        self.results = results or {}
+        self.inserts: dict[str, list[list]] = {}
+        self.queries: list[str] = []
+
+    def execute(self, query, params=None, columnar=False, settings=None):
+        self.queries.append(query)
+        if query.lstrip().startswith("INSERT INTO"):
+            assert columnar
+            table = query.split()[2]
+            self.inserts.setdefault(table, []).append(params)
+            return len(params[0])
+        for fragment, rows in self.results.items():
+            if fragment in query:
+                return rows
+        return []
+
+
+def postback(request_id, test_id="t1"):
+    return (request_id, test_id, "install", "registration", "100", "c", "p",
+            "123456", "0123456", test_id, "ru", "k", "appsflyer")
+
+
+def test_insert_sent_writes_columnar_blocks():
+    client = FakeClient()
+    storage = ClickHouseStorage(client=client)
+    storage.block_size = 2
+    compact = (7, "t1", "install", "registration", "100", 8, 9,
+               "123456", "0123456", "t1", "ru", 10, "appsflyer")
+
+    storage.insert_sent([postback("a"), postback("b"), compact])
+
+    blocks = client.inserts["sending_requests"]
+    assert [len(block[0]) for block in blocks] == [2, 1]
+    assert all(len(block) == len(POSTBACK_COLUMNS) for block in blocks)
+    assert blocks[0][0] == ["a", "b"]
+    # Compact ids share the String columns with uuids
+    assert [column[0] for column in blocks[1]] == [str(value) for value in compact]
+
+
+def test_verify_data_integrity_counts_each_request_once():
+    mismatches = [0] * len(INTEGRITY_FIELDS)
+    mismatches[INTEGRITY_FIELDS.index("country")] = 1
+    client = FakeClient({
+        "uniqExact(request_id) FROM received_requests": [(2,)],
+        "SELECT count(), countIf": [(3, 1, *mismatches)],
+        "r.request_id IS NULL LIMIT": [("c",)],
+        "r.request_id IS NOT NULL": [("b",)],
+    })
+    storage = ClickHouseStorage(client=client)
+
+    result = storage.verify_data_integrity("t1", sample_size=5)
+
+    assert result == {
+        "total_sent": 3,
+        "total_received": 2,
+        "missing_count": 1,
+        "field_mismatches": {"country": 1},
+        "missing_sample": ["c"],
+        "mismatch_sample": ["b"],
+    }
+    joins = [query for query in client.queries if "LEFT JOIN" in query]
+    assert len(joins) == 3
+    # Duplicated sent or received rows collapse before the join
+    assert all(query.count("LIMIT 1 BY request_id") == 2 for query in joins)